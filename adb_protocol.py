@@ -0,0 +1,409 @@
+"""Client for the adb server's smart-socket protocol (TCP 5037)."""
+import socket
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5037
+
+# Shell protocol (shell,v2:) packet ids
+SHELL_ID_STDIN = 0
+SHELL_ID_STDOUT = 1
+SHELL_ID_STDERR = 2
+SHELL_ID_EXIT = 3
+SHELL_ID_CLOSE_STDIN = 4
+
+SYNC_DATA_MAX = 64 * 1024
+
+
+class AdbProtocolError(Exception):
+    """Raised when the adb server answers FAIL or breaks the protocol."""
+
+
+def deadline_after(timeout: Optional[float]) -> Optional[float]:
+    """The time.monotonic() value timeout seconds from now, or None for no deadline."""
+    return None if timeout is None else time.monotonic() + timeout
+
+
+def time_left(deadline: Optional[float]) -> Optional[float]:
+    """
+    Returns:
+        float or None: Seconds until deadline, None if there is none
+
+    Raises:
+        socket.timeout: If the deadline has passed
+    """
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise socket.timeout("timed out")
+    return left
+
+
+class AdbConnection:
+    """
+    A single TCP connection to the adb server.
+
+    A connection starts out talking to the host. After a successful
+    `host:transport:<serial>` request it is bound to that device and the next
+    service request (`shell:`, `exec:`, `sync:`) consumes it.
+
+    `timeout` is a total deadline for everything done on the connection, from
+    connecting on: every send and receive waits only for the time that is left
+    and raises socket.timeout once it has passed.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: Optional[float] = None):
+        self.deadline = deadline_after(timeout)
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(None)
+        self.serial = None
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def settimeout(self, timeout: Optional[float]):
+        """Replaces the deadline with one timeout seconds from now, or none."""
+        self.deadline = deadline_after(timeout)
+        if timeout is None:
+            self.sock.settimeout(None)
+
+    def _arm(self):
+        if self.deadline is not None:
+            self.sock.settimeout(time_left(self.deadline))
+
+    def sendall(self, data: bytes):
+        self._arm()
+        self.sock.sendall(data)
+
+    def recv(self, size: int) -> bytes:
+        self._arm()
+        return self.sock.recv(size)
+
+    def send_request(self, request: str):
+        """
+        Sends a smart-socket request and waits for its OKAY/FAIL status.
+
+        Args:
+            request (str): Service request, e.g. 'host:version' or 'shell:ls'
+
+        Raises:
+            AdbProtocolError: If the server answers FAIL
+        """
+        payload = request.encode("utf-8")
+        self.sendall(b"%04x" % len(payload) + payload)
+        self.read_status()
+
+    def read_status(self):
+        status = self.read_exactly(4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbProtocolError(self.read_length_prefixed().decode("utf-8", "replace"))
+        raise AdbProtocolError(f"unexpected status {status!r}")
+
+    def read_exactly(self, size: int) -> bytes:
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = self.recv(size - len(buffer))
+            if not chunk:
+                raise AdbProtocolError("connection closed by adb server")
+            buffer.extend(chunk)
+        return bytes(buffer)
+
+    def read_length_prefixed(self) -> bytes:
+        length = int(self.read_exactly(4), 16)
+        return self.read_exactly(length)
+
+    def read_all(self) -> bytes:
+        """Reads the stream until the server closes it."""
+        chunks = []
+        while True:
+            chunk = self.recv(SYNC_DATA_MAX)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def select_transport(self, serial: Optional[str] = None):
+        """
+        Binds this connection to a device.
+
+        Args:
+            serial (str, optional): The device identifier. If None, uses the only connected device.
+        """
+        self.send_request(f"host:transport:{serial}" if serial else "host:transport-any")
+        self.serial = serial
+
+    def read_shell_v2(self) -> Tuple[bytes, bytes, int]:
+        """
+        Reads shell protocol packets until the exit packet arrives.
+
+        Returns:
+            tuple: (stdout, stderr, exit_code)
+        """
+        stdout, stderr = bytearray(), bytearray()
+        while True:
+            header = self.read_exactly(5)
+            packet_id, length = header[0], struct.unpack("<I", header[1:])[0]
+            data = self.read_exactly(length) if length else b""
+            if packet_id == SHELL_ID_STDOUT:
+                stdout.extend(data)
+            elif packet_id == SHELL_ID_STDERR:
+                stderr.extend(data)
+            elif packet_id == SHELL_ID_EXIT:
+                return bytes(stdout), bytes(stderr), data[0] if data else 0
+
+    def write_shell_v2(self, packet_id: int, data: bytes = b""):
+        self.sendall(struct.pack("<BI", packet_id, len(data)) + data)
+
+
+class SyncSession:
+    """
+    A `sync:` session bound to one device. Unlike shell/exec services the
+    session stays usable across requests until QUIT, so it can be pooled.
+    """
+
+    def __init__(self, connection: AdbConnection):
+        self.connection = connection
+
+    def _send(self, command: bytes, data: bytes):
+        self.connection.sendall(command + struct.pack("<I", len(data)) + data)
+
+    def _read_header(self) -> Tuple[bytes, int]:
+        header = self.connection.read_exactly(8)
+        return header[:4], struct.unpack("<I", header[4:])[0]
+
+    def stat(self, path: str) -> Tuple[int, int, int]:
+        """
+        Returns:
+            tuple: (mode, size, mtime). All zero if the path does not exist.
+        """
+        self._send(b"STAT", path.encode("utf-8"))
+        response = self.connection.read_exactly(16)
+        if response[:4] != b"STAT":
+            raise AdbProtocolError(f"unexpected sync response {response[:4]!r}")
+        return struct.unpack("<III", response[4:])
+
+    def pull(self, path: str) -> bytes:
+        self._send(b"RECV", path.encode("utf-8"))
+        data = bytearray()
+        while True:
+            command, length = self._read_header()
+            if command == b"DATA":
+                data.extend(self.connection.read_exactly(length))
+            elif command == b"DONE":
+                return bytes(data)
+            elif command == b"FAIL":
+                raise AdbProtocolError(self.connection.read_exactly(length).decode("utf-8", "replace"))
+            else:
+                raise AdbProtocolError(f"unexpected sync response {command!r}")
+
+    def push(self, data: bytes, path: str, mode: int = 0o644, mtime: int = 0):
+        self._send(b"SEND", f"{path},{mode}".encode("utf-8"))
+        view = memoryview(data)
+        for offset in range(0, len(view), SYNC_DATA_MAX):
+            self._send(b"DATA", view[offset:offset + SYNC_DATA_MAX].tobytes())
+        self.connection.sendall(b"DONE" + struct.pack("<I", mtime))
+        command, length = self._read_header()
+        if command == b"FAIL":
+            raise AdbProtocolError(self.connection.read_exactly(length).decode("utf-8", "replace"))
+        if command != b"OKAY":
+            raise AdbProtocolError(f"unexpected sync response {command!r}")
+
+    def quit(self):
+        try:
+            self._send(b"QUIT", b"")
+        except OSError:
+            pass
+        self.connection.close()
+
+
+class AdbClient:
+    """
+    Talks to the adb server directly instead of spawning an `adb` client per command.
+
+    Shell and exec services consume their socket by design of the protocol, so
+    each call opens a fresh loopback connection. Sync sessions and per-device
+    feature lists are kept in a pool and reused.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, max_idle_sync: int = 4):
+        self.host = host
+        self.port = port
+        self.max_idle_sync = max_idle_sync
+        self._lock = threading.Lock()
+        self._idle_sync: Dict[Optional[str], List[SyncSession]] = {}
+        self._features: Dict[Optional[str], List[str]] = {}
+
+    def connect(self, timeout: Optional[float] = None) -> AdbConnection:
+        return AdbConnection(self.host, self.port, timeout=timeout)
+
+    def host_command(self, request: str, timeout: Optional[float] = None) -> bytes:
+        """
+        Runs a `host:` service that answers with a length-prefixed payload.
+
+        Args:
+            request (str): e.g. 'host:version', 'host:devices'
+            timeout (float, optional): Deadline in seconds for the whole request
+
+        Returns:
+            bytes: The payload returned by the server
+        """
+        with self.connect(timeout) as connection:
+            connection.send_request(request)
+            return connection.read_length_prefixed()
+
+    def version(self, timeout: Optional[float] = None) -> int:
+        return int(self.host_command("host:version", timeout), 16)
+
+    def devices(self, timeout: Optional[float] = None) -> List[Tuple[str, str]]:
+        """
+        Returns:
+            list: (serial, state) pairs as reported by 'host:devices'
+        """
+        raw = self.host_command("host:devices", timeout).decode("utf-8", "replace")
+        return [tuple(line.split("\t", 1)) for line in raw.splitlines() if "\t" in line]
+
+    def get_state(self, serial: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        prefix = f"host-serial:{serial}" if serial else "host"
+        return self.host_command(f"{prefix}:get-state", timeout).decode("utf-8").strip()
+
+    def features(self, serial: Optional[str] = None, timeout: Optional[float] = None) -> List[str]:
+        with self._lock:
+            if serial in self._features:
+                return self._features[serial]
+        prefix = f"host-serial:{serial}" if serial else "host"
+        try:
+            raw = self.host_command(f"{prefix}:features", timeout).decode("utf-8")
+            features = [feature for feature in raw.strip().split(",") if feature]
+        except AdbProtocolError:
+            features = []
+        with self._lock:
+            self._features[serial] = features
+        return features
+
+    def forget_device(self, serial: Optional[str]):
+        """Drops cached features and pooled sync sessions for a device, e.g. after a reconnect."""
+        with self._lock:
+            self._features.pop(serial, None)
+            sessions = self._idle_sync.pop(serial, [])
+        for session in sessions:
+            session.quit()
+
+    def open_service(self, serial: Optional[str], service: str, timeout: Optional[float] = None) -> AdbConnection:
+        """
+        Opens a device service and returns the connection positioned at its stream.
+
+        Args:
+            serial (str, optional): The device identifier. If None, uses the only connected device.
+            service (str): e.g. 'shell:ls', 'exec:screencap -p', 'sync:'
+            timeout (float, optional): Deadline in seconds for opening the service and
+                everything read or written on the connection afterwards
+        """
+        connection = self.connect(timeout=timeout)
+        try:
+            connection.select_transport(serial)
+            connection.send_request(service)
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def shell(self, serial: Optional[str], command: str, timeout: Optional[float] = None) -> Tuple[bytes, bytes, int]:
+        """
+        Runs a shell command on the device.
+
+        Uses the shell protocol when the device supports it so stdout, stderr and
+        the exit code come back separately, otherwise falls back to `shell:` and
+        recovers the exit code from a trailing marker.
+
+        Returns:
+            tuple: (stdout, stderr, exit_code)
+        """
+        deadline = deadline_after(timeout)
+        if "shell_v2" in self.features(serial, time_left(deadline)):
+            with self.open_service(serial, f"shell,v2,raw:{command}", time_left(deadline)) as connection:
+                return connection.read_shell_v2()
+
+        marker = b"__ADB_EXIT__:"
+        with self.open_service(serial, f"shell:{command}; echo -n __ADB_EXIT__:$?",
+                               time_left(deadline)) as connection:
+            output = connection.read_all()
+        body, found, code = output.rpartition(marker)
+        if not found:
+            return output, b"", 0
+        return body, b"", int(code.strip() or 0)
+
+    def exec_out(self, serial: Optional[str], command: str, timeout: Optional[float] = None) -> bytes:
+        """Runs a command through `exec:` and returns its binary-safe stdout."""
+        with self.open_service(serial, f"exec:{command}", timeout) as connection:
+            return connection.read_all()
+
+    def framebuffer(self, serial: Optional[str] = None, timeout: Optional[float] = None) -> bytes:
+        """Reads one frame from the `framebuffer:` service, header included."""
+        with self.open_service(serial, "framebuffer:", timeout) as connection:
+            return connection.read_all()
+
+    def acquire_sync(self, serial: Optional[str], timeout: Optional[float] = None) -> SyncSession:
+        """Takes an idle sync session or opens one; its connection gets a deadline timeout seconds from now."""
+        with self._lock:
+            sessions = self._idle_sync.get(serial)
+            if sessions:
+                session = sessions.pop()
+                session.connection.settimeout(timeout)
+                return session
+        return SyncSession(self.open_service(serial, "sync:", timeout))
+
+    def release_sync(self, serial: Optional[str], session: SyncSession):
+        with self._lock:
+            sessions = self._idle_sync.setdefault(serial, [])
+            if len(sessions) < self.max_idle_sync:
+                sessions.append(session)
+                return
+        session.quit()
+
+    def _with_sync(self, serial: Optional[str], operation, timeout: Optional[float] = None):
+        session = self.acquire_sync(serial, timeout)
+        try:
+            result = operation(session)
+        except AdbProtocolError:
+            # A FAIL leaves the session in a clean state
+            self.release_sync(serial, session)
+            raise
+        except Exception:
+            session.quit()
+            raise
+        self.release_sync(serial, session)
+        return result
+
+    def pull(self, serial: Optional[str], path: str, timeout: Optional[float] = None) -> bytes:
+        return self._with_sync(serial, lambda session: session.pull(path), timeout)
+
+    def push(self, serial: Optional[str], data: bytes, path: str, mode: int = 0o644,
+             timeout: Optional[float] = None):
+        return self._with_sync(serial, lambda session: session.push(data, path, mode), timeout)
+
+    def stat(self, serial: Optional[str], path: str, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        return self._with_sync(serial, lambda session: session.stat(path), timeout)
+
+    def close(self):
+        with self._lock:
+            pools = list(self._idle_sync.values())
+            self._idle_sync.clear()
+        for sessions in pools:
+            for session in sessions:
+                session.quit()
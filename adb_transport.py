@@ -0,0 +1,211 @@
+"""Transports that execute adb CLI-style commands for PyAdb."""
+import shlex
+import shutil
+import socket
+import subprocess
+import threading
+from typing import Optional
+
+from adb_protocol import AdbClient, AdbProtocolError, DEFAULT_HOST, DEFAULT_PORT
+from shell_session import ProcessShellSession, ShellSession, SocketShellSession
+
+
+class AdbError(Exception):
+    """Raised when a command cannot be executed at all (e.g. adb is not installed)."""
+
+
+class AdbTimeoutError(AdbError):
+    """
+    Raised when a command does not finish within its deadline. Its adb process or
+    server connection has been torn down by then.
+    """
+
+    def __init__(self, command: str, timeout: float):
+        super().__init__(f"timed out after {timeout}s: {command}")
+        self.command = command
+        self.timeout = timeout
+
+
+class SubprocessTransport:
+    """
+    Runs commands through the `adb` client binary.
+
+    The adb path is resolved once and commands are executed without an
+    intermediate shell.
+    """
+
+    def __init__(self, adb_path: Optional[str] = None):
+        self._adb_path = adb_path
+        self._lock = threading.Lock()
+
+    @property
+    def adb_path(self) -> Optional[str]:
+        if self._adb_path is None:
+            with self._lock:
+                if self._adb_path is None:
+                    self._adb_path = shutil.which('adb')
+        return self._adb_path
+
+    def run(self, command: str, text: bool = True, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """
+        Executes an adb command.
+
+        Args:
+            command (str): The ADB command to execute (without the ADB path)
+            text (bool): Decode stdout/stderr as text. Use False for binary output.
+            timeout (float, optional): Seconds before the adb process is killed
+
+        Returns:
+            subprocess.CompletedProcess: Result of command execution
+
+        Raises:
+            AdbError: If ADB is not installed
+            AdbTimeoutError: If the command did not finish within timeout
+        """
+        if self.adb_path is None:
+            raise AdbError("Error can't locate adb")
+        args = [self.adb_path] + shlex.split(command)
+        try:
+            # On expiry subprocess.run kills the child and reaps it before raising
+            return subprocess.run(args, capture_output=True, text=text, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise AdbTimeoutError(command, timeout) from None
+
+    def open_shell(self, serial: Optional[str] = None, timeout: Optional[float] = None) -> ShellSession:
+        """
+        Creates a persistent shell session backed by an `adb shell` child process.
+
+        Args:
+            serial (str, optional): The device identifier. If None, uses the default device.
+            timeout (float, optional): Unused; nothing is waited for until the first command
+
+        Raises:
+            AdbError: If ADB is not installed
+        """
+        if self.adb_path is None:
+            raise AdbError("Error can't locate adb")
+        return ProcessShellSession(self.adb_path, serial)
+
+
+class SocketTransport:
+    """
+    Runs commands by talking to the adb server on TCP 5037 directly.
+
+    Understands the commands PyAdb issues (`devices`, `shell`, `exec-out`,
+    `get-state`, `pull`, `push`, optionally prefixed with `-s <serial>`) and
+    hands everything else, or any command issued while the server is not
+    reachable, to a SubprocessTransport.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 fallback: Optional[SubprocessTransport] = None):
+        self.client = AdbClient(host, port)
+        self.fallback = fallback if fallback is not None else SubprocessTransport()
+
+    def run(self, command: str, text: bool = True, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """
+        Executes an adb command.
+
+        Args:
+            command (str): The ADB command to execute (without the ADB path)
+            text (bool): Decode stdout/stderr as text. Use False for binary output.
+            timeout (float, optional): Seconds the whole command may take, from connecting
+                to the last byte read. On expiry the connection is closed, which ends the
+                command on the device.
+
+        Returns:
+            subprocess.CompletedProcess: Result of command execution
+
+        Raises:
+            AdbError: If the connection to the server fails mid-command
+            AdbTimeoutError: If the command did not finish within timeout
+        """
+        args = shlex.split(command)
+        serial = None
+        if len(args) >= 2 and args[0] == "-s":
+            serial, args = args[1], args[2:]
+        if not args:
+            return self.fallback.run(command, text, timeout)
+
+        try:
+            stdout, stderr, returncode = self._dispatch(serial, args[0], args[1:], timeout)
+        except NotImplementedError:
+            return self.fallback.run(command, text, timeout)
+        except ConnectionRefusedError:
+            # No server running; the adb client starts one for us
+            return self.fallback.run(command, text, timeout)
+        except socket.timeout:
+            raise AdbTimeoutError(command, timeout) from None
+        except OSError as e:
+            # e.g. the connection was reset because the server restarted
+            raise AdbError(f"adb server connection failed: {e}") from e
+        except AdbProtocolError as e:
+            stdout, stderr, returncode = b"", f"error: {e}\n".encode("utf-8"), 1
+
+        if text:
+            stdout = stdout.decode("utf-8", "replace")
+            stderr = stderr.decode("utf-8", "replace")
+        return subprocess.CompletedProcess(command, returncode, stdout, stderr)
+
+    def _dispatch(self, serial, subcommand, rest, timeout=None):
+        # Like the adb client, join the remaining arguments with spaces for the device shell
+        if subcommand == "devices" and not rest:
+            listing = self.client.host_command("host:devices", timeout)
+            return b"List of devices attached\n" + listing + b"\n", b"", 0
+        if subcommand == "shell" and rest:
+            return self.client.shell(serial, " ".join(rest), timeout)
+        if subcommand == "exec-out" and rest:
+            return self.client.exec_out(serial, " ".join(rest), timeout), b"", 0
+        if subcommand == "get-state" and not rest:
+            return (self.client.get_state(serial, timeout) + "\n").encode("utf-8"), b"", 0
+        if subcommand == "pull" and len(rest) == 2:
+            data = self.client.pull(serial, rest[0], timeout)
+            with open(rest[1], "wb") as f:
+                f.write(data)
+            return f"{rest[0]}: 1 file pulled\n".encode("utf-8"), b"", 0
+        if subcommand == "push" and len(rest) == 2:
+            with open(rest[0], "rb") as f:
+                self.client.push(serial, f.read(), rest[1], timeout=timeout)
+            return f"{rest[0]}: 1 file pushed\n".encode("utf-8"), b"", 0
+        raise NotImplementedError(subcommand)
+
+    def framebuffer(self, serial: Optional[str] = None, timeout: Optional[float] = None) -> bytes:
+        """
+        Reads one raw frame from the adb `framebuffer:` service, which the adb
+        client binary has no command for.
+
+        Raises:
+            AdbError: If the server is not reachable or the device refuses the service
+            AdbTimeoutError: If the frame was not read within timeout seconds
+        """
+        try:
+            return self.client.framebuffer(serial, timeout)
+        except socket.timeout:
+            raise AdbTimeoutError("framebuffer:", timeout) from None
+        except (OSError, AdbProtocolError) as e:
+            raise AdbError(f"framebuffer: failed: {e}")
+
+    def open_shell(self, serial: Optional[str] = None, timeout: Optional[float] = None) -> ShellSession:
+        """
+        Creates a persistent shell session over the shell protocol, or through the
+        adb binary when the device lacks shell_v2 or the server is not reachable.
+
+        Args:
+            serial (str, optional): The device identifier. If None, uses the only connected device.
+            timeout (float, optional): Deadline in seconds for asking the server about the device
+
+        Raises:
+            AdbTimeoutError: If the server did not answer within timeout
+        """
+        try:
+            supported = "shell_v2" in self.client.features(serial, timeout)
+        except socket.timeout:
+            raise AdbTimeoutError(f"host-serial:{serial}:features", timeout) from None
+        except OSError:
+            supported = False
+        if supported:
+            return SocketShellSession(self.client, serial)
+        return self.fallback.open_shell(serial, timeout)
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,781 @@
+"""Asyncio-native counterpart of PyAdb for driving many devices from one event loop."""
+import asyncio
+import itertools
+import shlex
+import shutil
+import struct
+import subprocess
+import time
+from typing import List, Optional
+
+from adb_protocol import AdbProtocolError, DEFAULT_HOST, DEFAULT_PORT, SHELL_ID_EXIT, SHELL_ID_STDERR, SHELL_ID_STDOUT
+from adb_transport import AdbError
+from device_properties import PropertyCache, parse_getprop
+from foreground_state import FOREGROUND_COMMAND, SCREEN_FIELDS, parse_foreground_state
+from frames import SettleDetector, parse_screencap_raw, png_size
+from package_index import LIST_PACKAGES_COMMAND, PackageIndex, parse_package_list, parse_resolved_activity
+from pyadb import build_action_script, has_emulator_properties, parse_action_output
+from screenshot_store import ScreenshotStore
+from text_entry import (ADB_KEYBOARD_PACKAGE, CURRENT_IME_COMMAND, IME_MIN_LENGTH, choose_method, ime_script,
+                        ime_status, input_script, is_input_typeable)
+from touch_events import PROBE_COMMAND, parse_touchscreen, pinch_script, swipe_script, tap_script
+from ui_hierarchy import DUMP_COMMAND, DUMP_FILE_COMMAND, HierarchyCache, parse_hierarchy
+
+
+class AsyncSubprocessTransport:
+    """Runs commands through the `adb` client binary with asyncio subprocesses."""
+
+    def __init__(self, adb_path: Optional[str] = None):
+        self._adb_path = adb_path
+
+    @property
+    def adb_path(self) -> Optional[str]:
+        if self._adb_path is None:
+            self._adb_path = shutil.which('adb')
+        return self._adb_path
+
+    async def run(self, command: str, text: bool = True) -> subprocess.CompletedProcess:
+        """
+        Executes an adb command. If the awaiting task is cancelled (including by a
+        deadline) the child process is killed before the cancellation propagates.
+
+        Args:
+            command (str): The ADB command to execute (without the ADB path)
+            text (bool): Decode stdout/stderr as text. Use False for binary output.
+
+        Returns:
+            subprocess.CompletedProcess: Result of command execution
+
+        Raises:
+            AdbError: If ADB is not installed
+        """
+        if self.adb_path is None:
+            raise AdbError("Error can't locate adb")
+        process = await asyncio.create_subprocess_exec(
+            self.adb_path, *shlex.split(command),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await process.communicate()
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        if text:
+            stdout = stdout.decode("utf-8", "replace")
+            stderr = stderr.decode("utf-8", "replace")
+        return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+class AsyncAdbConnection:
+    """An asyncio stream connection to the adb server. See adb_protocol.AdbConnection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> "AsyncAdbConnection":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def close(self):
+        self.writer.close()
+
+    async def send_request(self, request: str):
+        payload = request.encode("utf-8")
+        self.writer.write(b"%04x" % len(payload) + payload)
+        await self.writer.drain()
+        status = await self.read_exactly(4)
+        if status == b"FAIL":
+            raise AdbProtocolError((await self.read_length_prefixed()).decode("utf-8", "replace"))
+        if status != b"OKAY":
+            raise AdbProtocolError(f"unexpected status {status!r}")
+
+    async def read_exactly(self, size: int) -> bytes:
+        try:
+            return await self.reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            raise AdbProtocolError("connection closed by adb server")
+
+    async def read_length_prefixed(self) -> bytes:
+        length = int(await self.read_exactly(4), 16)
+        return await self.read_exactly(length)
+
+    async def read_all(self) -> bytes:
+        return await self.reader.read()
+
+    async def read_shell_v2(self):
+        stdout, stderr = bytearray(), bytearray()
+        while True:
+            header = await self.read_exactly(5)
+            packet_id, length = header[0], struct.unpack("<I", header[1:])[0]
+            data = await self.read_exactly(length) if length else b""
+            if packet_id == SHELL_ID_STDOUT:
+                stdout.extend(data)
+            elif packet_id == SHELL_ID_STDERR:
+                stderr.extend(data)
+            elif packet_id == SHELL_ID_EXIT:
+                return bytes(stdout), bytes(stderr), data[0] if data else 0
+
+
+class AsyncSocketTransport:
+    """
+    Talks to the adb server on TCP 5037 with asyncio streams. Handles `devices`,
+    `shell` and `exec-out`; everything else, or any command issued while the
+    server is not reachable, goes to an AsyncSubprocessTransport.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 fallback: Optional[AsyncSubprocessTransport] = None):
+        self.host = host
+        self.port = port
+        self.fallback = fallback if fallback is not None else AsyncSubprocessTransport()
+        self._features = {}
+
+    async def _host_command(self, request: str) -> bytes:
+        connection = await AsyncAdbConnection.open(self.host, self.port)
+        try:
+            await connection.send_request(request)
+            return await connection.read_length_prefixed()
+        finally:
+            connection.close()
+
+    async def _features_of(self, serial: Optional[str]) -> List[str]:
+        if serial not in self._features:
+            prefix = f"host-serial:{serial}" if serial else "host"
+            try:
+                raw = (await self._host_command(f"{prefix}:features")).decode("utf-8")
+                self._features[serial] = [feature for feature in raw.strip().split(",") if feature]
+            except AdbProtocolError:
+                self._features[serial] = []
+        return self._features[serial]
+
+    async def _open_service(self, serial: Optional[str], service: str) -> AsyncAdbConnection:
+        connection = await AsyncAdbConnection.open(self.host, self.port)
+        try:
+            await connection.send_request(f"host:transport:{serial}" if serial else "host:transport-any")
+            await connection.send_request(service)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    async def run(self, command: str, text: bool = True) -> subprocess.CompletedProcess:
+        """
+        Executes an adb command. Cancelling the awaiting task closes the connection,
+        which ends the service on the device side.
+
+        Args:
+            command (str): The ADB command to execute (without the ADB path)
+            text (bool): Decode stdout/stderr as text. Use False for binary output.
+
+        Returns:
+            subprocess.CompletedProcess: Result of command execution
+
+        Raises:
+            AdbError: If the connection to the server fails mid-command
+        """
+        args = shlex.split(command)
+        serial = None
+        if len(args) >= 2 and args[0] == "-s":
+            serial, args = args[1], args[2:]
+
+        try:
+            if args == ["devices"]:
+                listing = await self._host_command("host:devices")
+                stdout, stderr, returncode = b"List of devices attached\n" + listing + b"\n", b"", 0
+            elif len(args) > 1 and args[0] == "shell" and "shell_v2" in await self._features_of(serial):
+                connection = await self._open_service(serial, f"shell,v2,raw:{' '.join(args[1:])}")
+                try:
+                    stdout, stderr, returncode = await connection.read_shell_v2()
+                finally:
+                    connection.close()
+            elif len(args) > 1 and args[0] == "exec-out":
+                connection = await self._open_service(serial, f"exec:{' '.join(args[1:])}")
+                try:
+                    stdout, stderr, returncode = await connection.read_all(), b"", 0
+                finally:
+                    connection.close()
+            else:
+                return await self.fallback.run(command, text)
+        except ConnectionRefusedError:
+            return await self.fallback.run(command, text)
+        except OSError as e:
+            # e.g. the connection was reset because the server restarted
+            raise AdbError(f"adb server connection failed: {e}") from e
+        except AdbProtocolError as e:
+            stdout, stderr, returncode = b"", f"error: {e}\n".encode("utf-8"), 1
+
+        if text:
+            stdout = stdout.decode("utf-8", "replace")
+            stderr = stderr.decode("utf-8", "replace")
+        return subprocess.CompletedProcess(command, returncode, stdout, stderr)
+
+
+class AsyncPyAdb:
+    """
+    Asyncio version of PyAdb with the same methods and return shapes.
+
+    Every method takes an optional `timeout` (seconds) that acts as a deadline for
+    the whole call; on expiry the underlying adb process or connection is torn
+    down and the method returns its usual error shape with a timeout message.
+    Cancelling the awaiting task tears the call down the same way.
+    """
+
+    def __init__(self, transport=None, serial: Optional[str] = None, default_timeout: Optional[float] = 30.0,
+                 property_ttl: Optional[float] = 300.0, package_ttl: Optional[float] = 60.0,
+                 direct_touch: bool = True, screenshots: Optional[ScreenshotStore] = None):
+        """
+        Args:
+            transport (optional): AsyncSocketTransport or AsyncSubprocessTransport.
+                Defaults to an AsyncSocketTransport.
+            serial (str, optional): Device that methods without a device_id target.
+                If None, uses the default device.
+            default_timeout (float, optional): Deadline applied when a call does not pass one
+            property_ttl (float, optional): Seconds a device's getprop snapshot stays cached
+            package_ttl (float, optional): Seconds a device's package listing is reused, see PyAdb
+            direct_touch (bool): Write gestures with `sendevent` where possible, see PyAdb
+            screenshots (ScreenshotStore, optional): Where screenshots are saved. Defaults to a
+                store in the default directory; sessions that run together should share one.
+        """
+        self.transport = transport if transport is not None else AsyncSocketTransport()
+        self.serial = serial
+        self.default_timeout = default_timeout
+        self.properties = PropertyCache(property_ttl)
+        self.ui_hierarchies = HierarchyCache()
+        self.packages = PackageIndex(package_ttl)
+        self.direct_touch = direct_touch
+        self._touchscreens = {}
+        self._screen_sizes = {}
+        self._tracking_ids = itertools.count(1)
+        self.screenshots = screenshots if screenshots is not None else ScreenshotStore()
+
+    async def _run(self, command, text=True, timeout=None):
+        """
+        Returns:
+            tuple: (result, error) like PyAdb.run_command
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(self.transport.run(command, text), timeout), None
+        except asyncio.TimeoutError:
+            return None, f"timed out after {timeout}s: {command}"
+        except (AdbError, OSError) as e:
+            # OSError from a transport that does not wrap its own, e.g. the adb binary failing to start
+            return None, str(e)
+
+    def _device_param(self, device_id=None):
+        device_id = device_id or self.serial
+        return f"-s {device_id} " if device_id else ""
+
+    async def _shell(self, command, device_id=None, timeout=None):
+        """
+        Runs a device shell command, passed as one quoted argument so that the
+        transport hands it to the device shell unchanged. Callers give the command
+        as the device should see it and never quote it themselves.
+        """
+        command = shlex.quote(command)
+        return await self._run(f"{self._device_param(device_id)}shell {command}", timeout=timeout)
+
+    async def _shell_result(self, command, device_id=None, timeout=None, **extra):
+        # Every caller is an action that may change the screen
+        self.ui_hierarchies.invalidate()
+        result, error = await self._shell(command, device_id, timeout)
+        if error:
+            return {
+                "success": False,
+                "error": error,
+                "command": command
+            }
+        return {
+            "success": result.returncode == 0,
+            "return_code": result.returncode,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "command": command,
+            **extra
+        }
+
+    def check_if_adb_installed(self):
+        """See PyAdb.check_if_adb_installed."""
+        path = shutil.which('adb')
+        if path is not None:
+            return path, None
+        return None, "Error can't locate adb"
+
+    def make_adb_command(self, adb, command):
+        """See PyAdb.make_adb_command."""
+        return f"{adb} {command}"
+
+    async def run_command(self, command, timeout=None):
+        """
+        Executes an ADB command and returns the result.
+
+        Args:
+            command (str): The ADB command to execute (without the ADB path). Targets the
+                session's device unless it starts with '-s'.
+            timeout (float, optional): Deadline in seconds
+
+        Returns:
+            tuple: (result, error)
+                - result (subprocess.CompletedProcess or None): Result of command execution
+                - error (str or None): Error message if ADB is not installed or the deadline expired
+        """
+        if not command.lstrip().startswith("-s "):
+            command = f"{self._device_param()}{command}"
+        return await self._run(command, timeout=timeout)
+
+    async def list_android_devices(self, timeout=None):
+        """
+        Lists all connected Android devices, probing them concurrently.
+
+        Args:
+            timeout (float, optional): Deadline in seconds for listing, and separately for each device probe
+
+        Returns:
+            tuple: (devices_list, error) on failure, otherwise the list of device entries
+                as returned by PyAdb.list_android_devices
+        """
+        result, error = await self._run("devices", timeout=timeout)
+        if error is not None:
+            return None, error
+        if result.returncode != 0:
+            return None, result.stderr
+        return await self.parse_device_list(None, result.stdout, timeout=timeout)
+
+    async def parse_device_list(self, adb_path, raw_device_list, timeout=None):
+        """See PyAdb.parse_device_list. Devices are probed concurrently."""
+        devices = []
+        for device_line in raw_device_list.strip().split('\n')[1:]:
+            parts = device_line.strip().split('\t')
+            if len(parts) >= 2:
+                devices.append((parts[0], parts[1]))
+
+        async def probe(device_id, status):
+            if status != 'device':
+                return self._device_error_entry(device_id, status, f"device {status}")
+            detail = await self.get_device_details(device_id, timeout=timeout)
+            return {
+                'status': status,
+                'id': device_id,
+                'is_emulator': await self.is_emulator(device_id, timeout=timeout),
+                'detail': detail
+            }
+
+        return list(await asyncio.gather(*(probe(device_id, status) for device_id, status in devices)))
+
+    def _device_error_entry(self, device_id, status, error):
+        return {
+            'status': status,
+            'id': device_id,
+            'is_emulator': device_id.startswith('emulator-') or device_id.startswith('localhost:'),
+            'detail': (None, error)
+        }
+
+    async def get_device_properties(self, device_id, refresh=False, timeout=None):
+        """See PyAdb.get_device_properties."""
+        if not refresh:
+            properties = self.properties.get(device_id)
+            if properties is not None:
+                return properties, None
+        result, error = await self._run(f"-s {device_id} shell getprop", timeout=timeout)
+        if error is not None:
+            return None, error
+        if result.returncode != 0:
+            return None, result.stderr
+        properties = parse_getprop(result.stdout)
+        self.properties.put(device_id, properties)
+        return properties, None
+
+    async def is_emulator(self, device_id, adb_path=None, timeout=None):
+        """See PyAdb.is_emulator."""
+        if device_id.startswith('emulator-') or device_id.startswith('localhost:'):
+            return True
+        properties, error = await self.get_device_properties(device_id, timeout=timeout)
+        if error is not None:
+            return False
+        return has_emulator_properties(properties)
+
+    async def get_device_details(self, device_id, adb_path=None, timeout=None):
+        """See PyAdb.get_device_details."""
+        properties, error = await self.get_device_properties(device_id, timeout=timeout)
+        if error is not None:
+            return None, error
+        return {
+            'model': properties.get('ro.product.model', ''),
+            'android_version': properties.get('ro.build.version.release', ''),
+            'serial': properties.get('ro.serialno', ''),
+        }, None
+
+    async def take_screenshot(self, device_id=None, timeout=None):
+        """
+        Takes a screenshot, queues it for the screenshot store, and returns the raw PNG data.
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the session's device.
+            timeout (float, optional): Deadline in seconds
+
+        Returns:
+            tuple: (raw_data, error)
+        """
+        result, error = await self._run(f"{self._device_param(device_id)}exec-out screencap -p",
+                                        text=False, timeout=timeout)
+        if error is not None:
+            return None, error
+        if result.returncode != 0:
+            return None, "Failed to capture screenshot"
+        self._screen_sizes[device_id or self.serial] = png_size(result.stdout)
+
+        # The store writes on its own thread; the caller does not wait for the disk
+        self.screenshots.put(result.stdout, device_id or self.serial)
+        return result.stdout, None
+
+    async def capture_raw_frame(self, device_id=None, timeout=None):
+        """
+        See PyAdb.capture_raw_frame; always captures with `screencap` without -p.
+
+        Returns:
+            tuple: (frame, error)
+        """
+        result, error = await self._run(f"{self._device_param(device_id)}exec-out screencap",
+                                        text=False, timeout=timeout)
+        if error is not None:
+            return None, f"Error capturing raw frame: {error}"
+        if result.returncode != 0:
+            return None, "Failed to capture screenshot"
+        try:
+            frame = parse_screencap_raw(result.stdout)
+        except ValueError as e:
+            return None, f"Error capturing raw frame: {e}"
+        self._screen_sizes[device_id or self.serial] = (frame.width, frame.height)
+        return frame, None
+
+    async def wait_for_ui_idle(self, device_id=None, threshold=0.005, timeout=5.0, interval=0.0,
+                               stable_frames=1, method="pixel", hash_threshold=2):
+        """
+        See PyAdb.wait_for_ui_idle. Each capture gets the default deadline; `timeout`
+        bounds the wait for the screen to settle.
+
+        Returns:
+            dict: settled, elapsed, frames, difference and, if frames could not be captured, error
+        """
+        detector = SettleDetector(threshold, stable_frames, method, hash_threshold)
+        start = time.monotonic()
+        frames = 0
+        while True:
+            frame, error = await self.capture_raw_frame(device_id)
+            elapsed = time.monotonic() - start
+            if error is not None:
+                return {"settled": False, "elapsed": elapsed, "frames": frames,
+                        "difference": detector.last_difference, "error": error}
+            frames += 1
+            if detector.add(frame):
+                return {"settled": True, "elapsed": elapsed, "frames": frames,
+                        "difference": detector.last_difference}
+            if elapsed >= timeout:
+                return {"settled": False, "elapsed": elapsed, "frames": frames,
+                        "difference": detector.last_difference}
+            if interval:
+                await asyncio.sleep(interval)
+
+    async def _screen_signature(self, device_id=None, timeout=None):
+        """See PyAdb._screen_signature."""
+        state = await self.get_foreground_state(device_id, timeout)
+        return tuple(state[field] for field in SCREEN_FIELDS) if state["success"] else None
+
+    async def get_ui_hierarchy(self, device_id=None, refresh=False, timeout=None):
+        """
+        See PyAdb.get_ui_hierarchy.
+
+        Returns:
+            tuple: (hierarchy, error)
+        """
+        device_id = device_id or self.serial
+        signature = None
+        if not refresh and self.ui_hierarchies.has(device_id):
+            signature = await self._screen_signature(device_id, timeout)
+            hierarchy = self.ui_hierarchies.get(device_id, signature)
+            if hierarchy is not None:
+                return hierarchy, None
+
+        result, error = await self._run(f"{self._device_param(device_id)}exec-out {DUMP_COMMAND}", timeout=timeout)
+        if error is not None:
+            return None, error
+        output = result.stdout if result.returncode == 0 else ""
+        if "</hierarchy>" not in output:
+            result, error = await self._shell(DUMP_FILE_COMMAND, device_id, timeout)
+            if error is not None:
+                return None, error
+            output = result.stdout
+        try:
+            hierarchy = parse_hierarchy(output)
+        except ValueError as e:
+            return None, f"Error dumping UI hierarchy: {e}"
+        self.ui_hierarchies.put(device_id, signature, hierarchy)
+        return hierarchy, None
+
+    async def get_foreground_state(self, device_id=None, timeout=None) -> dict:
+        """See PyAdb.get_foreground_state."""
+        result, error = await self._shell(FOREGROUND_COMMAND, device_id, timeout)
+        if error:
+            return {"success": False, "error": error}
+        try:
+            state = parse_foreground_state(result.stdout)
+        except ValueError as e:
+            return {"success": False, "error": f"Error reading foreground state: {e}"}
+        return {"success": True, **state.to_dict(), "summary": state.describe()}
+
+    async def find_element(self, text: str = None, resource_id: str = None, content_desc: str = None,
+                           class_name: str = None, device_id=None, timeout=None) -> dict:
+        """See PyAdb.find_element."""
+        if not any((text, resource_id, content_desc, class_name)):
+            return {"success": False, "error": "give at least one of text, resource_id, content_desc or class_name"}
+        hierarchy, error = await self.get_ui_hierarchy(device_id, timeout=timeout)
+        if error:
+            return {"success": False, "error": error}
+        matches = hierarchy.find(text, resource_id, content_desc, class_name)
+        return {
+            "success": bool(matches),
+            "elements": [element.to_dict() for element in matches[:10]],
+            "count": len(matches)
+        }
+
+    async def tap_element(self, text: str = None, resource_id: str = None, content_desc: str = None,
+                          class_name: str = None, match_index: int = 0, device_id=None, timeout=None) -> dict:
+        """See PyAdb.tap_element."""
+        if not any((text, resource_id, content_desc, class_name)):
+            return {"success": False, "error": "give at least one of text, resource_id, content_desc or class_name"}
+        hierarchy, error = await self.get_ui_hierarchy(device_id, timeout=timeout)
+        if error:
+            return {"success": False, "error": error}
+        matches = hierarchy.find(text, resource_id, content_desc, class_name)
+        if not matches:
+            return {"success": False, "error": "no matching element on screen"}
+        if match_index >= len(matches):
+            return {"success": False, "error": f"only {len(matches)} matching elements"}
+        element = matches[match_index]
+        result = await self.tap(*element.center, device_id=device_id, timeout=timeout)
+        result["element"] = element.to_dict()
+        return result
+
+    async def run_actions(self, actions: List[dict], stop_on_error: bool = True, device_id=None,
+                          timeout=None) -> dict:
+        """See PyAdb.run_actions."""
+        try:
+            script, commands, marker = build_action_script(actions, stop_on_error)
+        except ValueError as e:
+            return {"success": False, "error": str(e), "steps": []}
+        if not commands:
+            return {"success": True, "steps": [], "command": ""}
+
+        self.ui_hierarchies.invalidate()
+        result, error = await self._shell(script, device_id, timeout)
+        if error:
+            return {"success": False, "error": error, "command": script, "steps": []}
+        return parse_action_output(actions, commands, marker, result.stdout, result.returncode, script)
+
+    async def tap(self, x: int, y: int, device_id=None, timeout=None) -> dict:
+        """See PyAdb.tap."""
+        screen = await self._direct_touchscreen(device_id, timeout)
+        script = tap_script(screen, x, y, next(self._tracking_ids)) if screen is not None else None
+        return await self._run_gesture(script, f"tap {x} {y}", f"input tap {x} {y}", device_id, timeout)
+
+    async def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int = 300, device_id=None,
+                    timeout=None) -> dict:
+        """See PyAdb.swipe."""
+        screen = await self._direct_touchscreen(device_id, timeout)
+        script = (swipe_script(screen, x1, y1, x2, y2, duration, next(self._tracking_ids))
+                  if screen is not None else None)
+        return await self._run_gesture(script, f"swipe {x1} {y1} {x2} {y2} {duration}",
+                                  f"input swipe {x1} {y1} {x2} {y2} {duration}", device_id, timeout)
+
+    async def long_press(self, x: int, y: int, duration: int = 800, device_id=None, timeout=None) -> dict:
+        """See PyAdb.long_press."""
+        screen = await self._direct_touchscreen(device_id, timeout)
+        script = tap_script(screen, x, y, next(self._tracking_ids), duration) if screen is not None else None
+        return await self._run_gesture(script, f"long_press {x} {y} {duration}",
+                                  f"input swipe {x} {y} {x} {y} {duration}", device_id, timeout)
+
+    async def pinch(self, x: int, y: int, start_span: int, end_span: int, duration: int = 400, device_id=None,
+                    timeout=None) -> dict:
+        """See PyAdb.pinch."""
+        screen = await self._direct_touchscreen(device_id, timeout)
+        if screen is None:
+            return {"success": False, "error": "pinch needs a writable multi-touch input device", "command": ""}
+        try:
+            script = pinch_script(screen, x, y, start_span, end_span, duration, next(self._tracking_ids))
+        except ValueError as e:
+            return {"success": False, "error": str(e), "command": ""}
+        return await self._run_gesture(script, f"pinch {x} {y} {start_span} {end_span} {duration}", None,
+                                        device_id, timeout)
+
+    async def get_touchscreen(self, device_id=None, refresh=False, timeout=None):
+        """See PyAdb.get_touchscreen."""
+        key = device_id or self.serial
+        if not refresh and key in self._touchscreens:
+            return self._touchscreens[key]
+        result, error = await self._shell(PROBE_COMMAND, device_id, timeout)
+        if error:
+            return None
+        screen = parse_touchscreen(result.stdout)
+        if screen is not None:
+            check, error = await self._shell(f"sendevent {screen.path} 0 0 0", device_id, timeout)
+            if error:
+                return None
+            if check.returncode != 0:
+                screen = None
+        self._touchscreens[key] = screen
+        return screen
+
+    async def _direct_touchscreen(self, device_id, timeout):
+        if not self.direct_touch:
+            return None
+        screen = await self.get_touchscreen(device_id, timeout=timeout)
+        if screen is None:
+            return None
+        size = self._screen_sizes.get(device_id or self.serial)
+        width, height = screen.display_size
+        if size is not None and (size[0] > size[1]) != (width > height):
+            return None
+        return screen
+
+    async def _run_gesture(self, script, gesture, fallback, device_id, timeout):
+        if script is None:
+            return await self._shell_result(fallback, device_id, timeout, method="input")
+        self.ui_hierarchies.invalidate()
+        result, error = await self._shell(script, device_id, timeout)
+        if error is None and result.returncode != 0 and fallback is not None:
+            self._touchscreens[device_id or self.serial] = None
+            return await self._shell_result(fallback, device_id, timeout, method="input")
+        if error:
+            return {
+                "success": False,
+                "error": error,
+                "command": f"sendevent {gesture}",
+                "method": "sendevent"
+            }
+        return {
+            "success": result.returncode == 0,
+            "return_code": result.returncode,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "command": f"sendevent {gesture}",
+            "method": "sendevent"
+        }
+
+    async def input_text(self, text: str, device_id=None, method: str = "auto", timeout=None) -> dict:
+        """See PyAdb.input_text."""
+        try:
+            if method == "auto":
+                needs_ime = not is_input_typeable(text) or len(text) >= IME_MIN_LENGTH
+                method = choose_method(text, needs_ime and await self.has_adb_keyboard(device_id, timeout))
+            if method == "ime":
+                current_ime, error = await self._shell(CURRENT_IME_COMMAND, device_id, timeout)
+                if error:
+                    return {"success": False, "error": error, "command": CURRENT_IME_COMMAND}
+                command = ime_script(text, current_ime.stdout.strip())
+            else:
+                command = input_script(text)
+        except ValueError as e:
+            return {"success": False, "error": str(e), "command": "", "method": method}
+        if not command:
+            return {"success": True, "return_code": 0, "stdout": "", "stderr": "", "command": "", "method": method}
+
+        self.ui_hierarchies.invalidate()
+        result, error = await self._shell(command, device_id, timeout)
+        if error:
+            return {"success": False, "error": error, "command": command, "method": method}
+        returncode = ime_status(result.stdout, result.returncode) if method == "ime" else result.returncode
+        return {
+            "success": returncode == 0,
+            "return_code": returncode,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "command": command,
+            "method": method
+        }
+
+    async def has_adb_keyboard(self, device_id=None, timeout=None) -> bool:
+        """See PyAdb.has_adb_keyboard."""
+        packages, error = await self.get_installed_packages(device_id, timeout=timeout)
+        return error is None and ADB_KEYBOARD_PACKAGE in packages
+
+    async def press_key(self, keycode: str, device_id=None, timeout=None) -> dict:
+        """See PyAdb.press_key."""
+        if not keycode.startswith("KEYCODE_"):
+            keycode = f"KEYCODE_{keycode}"
+        return await self._shell_result(f"input keyevent {keycode}", device_id, timeout)
+
+    async def launch_app(self, package_name: str, device_id=None, timeout=None) -> dict:
+        """
+        See PyAdb.launch_app. The deadline covers activity resolution and launch together.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(self._launch_app(package_name, device_id), timeout)
+        except asyncio.TimeoutError:
+            return {
+                "success": False,
+                "error": f"timed out after {timeout}s",
+                "command": f"launch {package_name}"
+            }
+
+    async def _launch_app(self, package_name, device_id=None):
+        key = device_id or self.serial
+        activity = self.packages.get_activity(key, package_name)
+        if activity is not None:
+            result = await self._start_activity(activity, device_id)
+            if result["success"]:
+                result["cached"] = True
+                return result
+            self.packages.invalidate(key, package_name)
+
+        resolve_cmd = f"cmd package resolve-activity --brief {package_name}"
+        result, error = await self._shell(resolve_cmd, device_id, timeout=float("inf"))
+        if error:
+            return {
+                "success": False,
+                "error": error,
+                "command": resolve_cmd
+            }
+
+        activity = None
+        if result.returncode == 0 and not result.stderr:
+            activity = parse_resolved_activity(result.stdout)
+        if activity is None:
+            monkey_cmd = f"monkey -p {package_name} -c android.intent.category.LAUNCHER 1"
+            return await self._shell_result(monkey_cmd, device_id, timeout=float("inf"), method="monkey")
+
+        result = await self._start_activity(activity, device_id)
+        if result["success"]:
+            self.packages.put_activity(key, package_name, activity)
+        return result
+
+    async def _start_activity(self, activity, device_id=None):
+        result = await self._shell_result(f"am start -n {activity}", device_id, timeout=float("inf"),
+                                          method="am start", activity=activity)
+        # am start exits 0 even when the activity does not exist
+        if "Error" in result.get("stdout", "") or "Error" in result.get("stderr", ""):
+            result["success"] = False
+        return result
+
+    async def get_installed_packages(self, device_id=None, refresh=False, timeout=None):
+        """
+        Gets a list of installed packages on the device, from the package index while
+        it is fresh.
+
+        Returns:
+            tuple: (packages, error)
+        """
+        key = device_id or self.serial
+        packages = None if refresh else self.packages.get_packages(key)
+        if packages is None:
+            result, error = await self._shell(LIST_PACKAGES_COMMAND, device_id, timeout)
+            if error:
+                return None, error
+            if result.returncode != 0:
+                return None, result.stderr or f"pm list packages exited with {result.returncode}"
+            packages = parse_package_list(result.stdout)
+            self.packages.update(key, packages)
+        return sorted(packages), None
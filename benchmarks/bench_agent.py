@@ -0,0 +1,193 @@
+"""
+Offline benchmarks of PyAdb and the agent loop: a fake adb server (reached over
+the socket transport, or through the fake adb binary) and a scripted model stand
+in for the phone and Gemini.
+
+Reports p50/p95 latency of list_android_devices, take_screenshot, each tool the
+agent calls, each agent step (model answer to next request) and whole episodes,
+plus the bytes each request would send to the model.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_agent
+    python -m benchmarks.bench_agent --devices 8 --latency 0.005 --screen 1440x3120 --episodes 5
+    python -m benchmarks.bench_agent --transport subprocess --json results.json
+    python -m benchmarks.bench_agent --baseline results.json --tolerance 0.25
+    python -m benchmarks.bench_agent --png-encode-delay 0.3 --serial-capture   # vs. the default pipelined loop
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+
+import main as agent  # noqa: E402
+from adb_transport import SocketTransport, SubprocessTransport  # noqa: E402
+from benchmarks.bench_screenshot import percentile  # noqa: E402
+from benchmarks.scripted_model import ScriptedClient  # noqa: E402
+from fake_adb_server import FakeAdbServer  # noqa: E402
+from pyadb import PyAdb  # noqa: E402
+
+SERIAL = "emulator-5554"
+FAKE_ADB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+
+
+def summarize(name, samples, unit="ms"):
+    if not samples:
+        return {"name": name, "n": 0, "p50": 0.0, "p95": 0.0, "unit": unit}
+    return {
+        "name": name,
+        "n": len(samples),
+        "p50": statistics.median(samples),
+        "p95": percentile(samples, 0.95),
+        "unit": unit,
+    }
+
+
+def timed(samples, function):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            samples.append((time.perf_counter() - start) * 1000)
+    return wrapper
+
+
+def make_adb(server, transport):
+    if transport == "subprocess":
+        os.environ["FAKE_ADB_PORT"] = str(server.port)
+        return PyAdb(transport=SubprocessTransport(adb_path=FAKE_ADB))
+    return PyAdb(transport=SocketTransport(port=server.port))
+
+
+def bench_list_devices(adb, iterations):
+    cold, warm = [], []
+    for _ in range(iterations):
+        adb.properties.invalidate()
+        timed(cold, adb.list_android_devices)()
+        timed(warm, adb.list_android_devices)()
+    return [summarize("list_android_devices (cold)", cold), summarize("list_android_devices (cached)", warm)]
+
+
+def bench_screenshot(adb, iterations):
+    samples = []
+    for _ in range(iterations):
+        timed(samples, adb.take_screenshot)(SERIAL)
+    return [summarize("take_screenshot", samples)]
+
+
+def bench_episodes(adb, episodes, model_latency, pipelined=True):
+    """
+    Runs main.main() episodes against the scripted model.
+
+    Per-step time is from a model answer to the next request: tool calls, settling,
+    the screenshot and preparing it for the model.
+
+    Args:
+        pipelined (bool): Passed to main.main(); False runs the serial settle-then-capture loop
+    """
+    tool_samples = {}
+    for name in agent.make_function_map(adb):
+        samples = tool_samples.setdefault(name, [])
+        setattr(adb, name, timed(samples, getattr(adb, name)))
+
+    steps, totals, request_bytes = [], [], []
+    for _ in range(episodes):
+        agent.client = ScriptedClient(latency=model_latency)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.main(replay=False, adb=adb, pipelined=pipelined, memo=False)
+        totals.append((time.perf_counter() - start) * 1000)
+        requests = agent.client.models.requests
+        steps.extend((requests[i][0] - requests[i - 1][1]) * 1000 for i in range(1, len(requests)))
+        request_bytes.extend(size for _, _, size in requests)
+
+    rows = [summarize(f"tool {name}", samples) for name, samples in sorted(tool_samples.items()) if samples]
+    rows.append(summarize("agent step", steps))
+    rows.append(summarize("episode", totals))
+    rows.append(summarize("request bytes", request_bytes, unit="B"))
+    return rows
+
+
+def compare(rows, baseline_path, tolerance):
+    """
+    Returns:
+        list: Descriptions of rows whose p95 grew more than `tolerance` over the baseline
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {row["name"]: row for row in json.load(f)}
+    regressions = []
+    for row in rows:
+        previous = baseline.get(row["name"])
+        if previous and previous["p95"] > 0 and row["p95"] > previous["p95"] * (1 + tolerance):
+            regressions.append(f"{row['name']}: p95 {previous['p95']:.1f} -> {row['p95']:.1f} {row['unit']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=["socket", "subprocess"], default="socket",
+                        help="socket: talk to the fake server directly; subprocess: go through benchmarks/fake_adb.py")
+    parser.add_argument("--devices", type=int, default=4, help="Devices attached to the fake server")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake server waits per request")
+    parser.add_argument("--screen", default="1080x2400", help="Fake screen size, WIDTHxHEIGHT")
+    parser.add_argument("--png-encode-delay", type=float, default=0.0,
+                        help="Seconds the fake devices spend encoding a PNG")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--episodes", type=int, default=3)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Seconds the scripted model takes per turn")
+    parser.add_argument("--serial-capture", action="store_true",
+                        help="Settle and then capture instead of capturing in the background")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Fail if a p95 regressed against this --json file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 growth over the baseline")
+    options = parser.parse_args()
+    width, height = (int(value) for value in options.screen.lower().split("x"))
+    json_path = os.path.abspath(options.json) if options.json else None
+    baseline_path = os.path.abspath(options.baseline) if options.baseline else None
+    cwd = os.getcwd()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir, FakeAdbServer(latency=options.latency) as server:
+        # take_screenshot and the agent write screenshots to the working directory
+        os.chdir(workdir)
+        server.add_device(SERIAL, screen_size=(width, height), png_encode_delay=options.png_encode_delay)
+        for index in range(1, options.devices):
+            server.add_device(f"emulator-{5554 + 2 * index}", screen_size=(width, height),
+                              png_encode_delay=options.png_encode_delay)
+        adb = make_adb(server, options.transport)
+        rows += bench_list_devices(adb, options.iterations)
+        rows += bench_screenshot(adb, options.iterations)
+        adb.close()
+
+        # The agent acts on the default device, so episodes run with only one attached
+        for index in range(1, options.devices):
+            server.remove_device(f"emulator-{5554 + 2 * index}")
+        adb = make_adb(server, options.transport)
+        rows += bench_episodes(adb, options.episodes, options.model_latency, not options.serial_capture)
+        adb.close()
+        os.chdir(cwd)
+
+    print(f"{'benchmark':<36}{'n':>6}{'p50':>12}{'p95':>12}")
+    for row in rows:
+        print(f"{row['name']:<36}{row['n']:>6}{row['p50']:>10.1f}{row['unit']:>2}{row['p95']:>10.1f}{row['unit']:>2}")
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    if baseline_path:
+        regressions = compare(rows, baseline_path, options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compares screenshot capture paths: device-side PNG (`screencap -p`) against raw
+pixels from `screencap` and from the adb `framebuffer:` service.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_screenshot --serial emulator-5554
+    python -m benchmarks.bench_screenshot --fake --png-encode-delay 0.25
+"""
+import argparse
+import statistics
+import time
+
+from adb_transport import SocketTransport
+from fake_adb_server import FakeAdbServer
+from pyadb import PyAdb
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(name, capture, iterations):
+    """
+    Runs capture() `iterations` times.
+
+    Returns:
+        dict: name, p50/p95 latency in ms, and bytes transferred per capture
+    """
+    latencies, sizes = [], []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        size = capture()
+        latencies.append((time.perf_counter() - start) * 1000)
+        sizes.append(size)
+    return {
+        "path": name,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 0.95),
+        "bytes": int(statistics.mean(sizes)),
+    }
+
+
+def run(adb, serial, iterations, host_encode):
+    device_param = f"-s {serial} " if serial else ""
+
+    def png():
+        result = adb.transport.run(f"{device_param}exec-out screencap -p", text=False)
+        return len(result.stdout)
+
+    def raw(method):
+        def capture():
+            frame, error = adb.capture_raw_frame(serial, method=method)
+            if error:
+                raise RuntimeError(error)
+            if host_encode:
+                frame.to_png()
+            return len(frame.pixels)
+        return capture
+
+    results = [measure("png (screencap -p)", png, iterations),
+               measure("raw (screencap)", raw("screencap"), iterations)]
+    if hasattr(adb.transport, "framebuffer"):
+        results.append(measure("raw (framebuffer:)", raw("framebuffer"), iterations))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serial", help="Device to capture from. Defaults to the only connected device.")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--host-encode", action="store_true", help="Include host-side PNG encoding in the raw paths")
+    parser.add_argument("--fake", action="store_true", help="Run against a local fake adb server")
+    parser.add_argument("--png-encode-delay", type=float, default=0.25,
+                        help="Seconds the fake device spends encoding a PNG")
+    options = parser.parse_args()
+
+    if options.fake:
+        with FakeAdbServer() as server:
+            server.add_device("emulator-5554", png_encode_delay=options.png_encode_delay)
+            adb = PyAdb(transport=SocketTransport(port=server.port))
+            results = run(adb, "emulator-5554", options.iterations, options.host_encode)
+    else:
+        adb = PyAdb(transport=SocketTransport())
+        results = run(adb, options.serial, options.iterations, options.host_encode)
+
+    print(f"{'path':<22}{'p50 ms':>10}{'p95 ms':>10}{'bytes':>14}")
+    for row in results:
+        print(f"{row['path']:<22}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['bytes']:>14,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measures input_text throughput in characters per second for each entry path
+(`input text` chunks, the ADBKeyBoard IME, and the automatic choice) on short,
+form-sized, fixture-sized and Unicode payloads.
+
+Against the fake server the typed text is checked against the payload. The fake
+`input` command sleeps --input-latency per call to stand in for the process
+start-up a real device pays.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_text --fake
+    python -m benchmarks.bench_text --fake --input-latency 0.3 --iterations 5
+    python -m benchmarks.bench_text --serial emulator-5554   # focus a text field first
+"""
+import argparse
+import statistics
+import time
+
+from adb_transport import SocketTransport
+from benchmarks.bench_screenshot import percentile
+from fake_adb_server import FakeAdbServer
+from pyadb import PyAdb
+from text_entry import ADB_KEYBOARD_PACKAGE
+
+PAYLOADS = {
+    "short": "qa@example.com",
+    "form": "Jane Q. Tester\n42 Example Street, Apt 7\nSpringfield, 12345\njane.tester+qa@example.com\t+1 555 0100",
+    "fixture": " ".join(f"item-{index}: lorem ipsum dolor sit amet, 100% ok;" for index in range(60)),
+    "unicode": "Grüße aus München — café, naïve, 東京, Ελληνικά ✓",
+}
+
+
+def measure(adb, serial, payload, method, iterations, device=None):
+    """
+    Returns:
+        dict: chars/s at p50 and p95 latency, or the error if the path failed
+    """
+    latencies = []
+    for _ in range(iterations):
+        if device is not None:
+            device.typed = ""
+        start = time.perf_counter()
+        result = adb.input_text(payload, device_id=serial, method=method)
+        latencies.append(time.perf_counter() - start)
+        if not result["success"]:
+            return {"error": result.get("error") or result.get("stderr")}
+        if device is not None and device.typed != payload:
+            return {"error": f"typed {device.typed!r}"}
+    return {
+        "method": result["method"],
+        "p50_cps": len(payload) / statistics.median(latencies),
+        "p95_cps": len(payload) / percentile(latencies, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serial", help="Device to type on")
+    parser.add_argument("--fake", action="store_true", help="Use an in-process fake adb server")
+    parser.add_argument("--input-latency", type=float, default=0.15, help="Seconds per fake `input` call")
+    parser.add_argument("--iterations", type=int, default=3)
+    options = parser.parse_args()
+
+    server = None
+    device = None
+    serial = options.serial
+    if options.fake or serial is None:
+        server = FakeAdbServer().start()
+        serial = "emulator-5554"
+        device = server.add_device(serial)
+        device.input_latency = options.input_latency
+        device.packages[ADB_KEYBOARD_PACKAGE] = 1
+        adb = PyAdb(transport=SocketTransport(port=server.port))
+    else:
+        adb = PyAdb(transport=SocketTransport())
+
+    try:
+        print(f"{'payload':<10}{'chars':>6}  {'path':<6}{'method':>8}{'p50 chars/s':>14}{'p95 chars/s':>14}")
+        for name, payload in PAYLOADS.items():
+            for method in ("input", "ime", "auto"):
+                row = measure(adb, serial, payload, method, options.iterations, device)
+                if "error" in row:
+                    print(f"{name:<10}{len(payload):>6}  {method:<6}  error: {row['error']}")
+                    continue
+                print(f"{name:<10}{len(payload):>6}  {method:<6}{row['method']:>8}"
+                      f"{row['p50_cps']:>14.0f}{row['p95_cps']:>14.0f}")
+    finally:
+        adb.close()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the `adb` client binary that talks to a FakeAdbServer, so the
+subprocess transport (one process per command) can be benchmarked offline.
+
+The server port is read from FAKE_ADB_PORT. Supports `devices`, `get-state`,
+`version`, `shell` (one-shot and interactive) and `exec-out`, with `-s SERIAL`.
+
+Usage:
+    FAKE_ADB_PORT=5038 benchmarks/fake_adb.py -s emulator-5554 shell getprop
+"""
+import os
+import struct
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adb_protocol import (AdbClient, AdbProtocolError, SHELL_ID_CLOSE_STDIN, SHELL_ID_EXIT,  # noqa: E402
+                          SHELL_ID_STDERR, SHELL_ID_STDIN, SHELL_ID_STDOUT)
+
+
+def interactive_shell(client, serial):
+    connection = client.open_service(serial, "shell,v2,raw:")
+
+    def pump_stdin():
+        while True:
+            data = os.read(sys.stdin.fileno(), 65536)
+            if not data:
+                connection.write_shell_v2(SHELL_ID_CLOSE_STDIN)
+                return
+            connection.write_shell_v2(SHELL_ID_STDIN, data)
+
+    threading.Thread(target=pump_stdin, daemon=True).start()
+    while True:
+        header = connection.read_exactly(5)
+        packet_id, length = header[0], struct.unpack("<I", header[1:])[0]
+        data = connection.read_exactly(length) if length else b""
+        if packet_id == SHELL_ID_STDOUT:
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+        elif packet_id == SHELL_ID_STDERR:
+            sys.stderr.buffer.write(data)
+            sys.stderr.buffer.flush()
+        elif packet_id == SHELL_ID_EXIT:
+            return data[0] if data else 0
+
+
+def main(args):
+    client = AdbClient(port=int(os.environ.get("FAKE_ADB_PORT", "5037")))
+    serial = None
+    if len(args) >= 2 and args[0] == "-s":
+        serial, args = args[1], args[2:]
+    if not args:
+        sys.stderr.write("usage: fake_adb.py [-s SERIAL] COMMAND\n")
+        return 1
+
+    command, rest = args[0], args[1:]
+    if command == "devices":
+        listing = client.host_command("host:devices").decode("utf-8")
+        sys.stdout.write("List of devices attached\n" + listing + "\n")
+        return 0
+    if command == "get-state":
+        print(client.get_state(serial))
+        return 0
+    if command == "version":
+        print(f"Android Debug Bridge version 1.0.{client.version()}")
+        return 0
+    if command == "shell" and not rest:
+        return interactive_shell(client, serial)
+    if command == "shell":
+        stdout, stderr, code = client.shell(serial, " ".join(rest))
+        sys.stdout.buffer.write(stdout)
+        sys.stderr.buffer.write(stderr)
+        return code
+    if command == "exec-out":
+        sys.stdout.buffer.write(client.exec_out(serial, " ".join(rest)))
+        return 0
+    sys.stderr.write(f"fake_adb.py: unsupported command {command}\n")
+    return 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except (AdbProtocolError, ConnectionError) as e:
+        sys.stderr.write(f"error: {e}\n")
+        sys.exit(1)
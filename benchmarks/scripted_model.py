@@ -0,0 +1,81 @@
+"""
+A stand-in for `genai.Client` that answers from a script instead of calling
+Gemini, and records what each request would have sent.
+"""
+import asyncio
+import time
+from typing import List, Optional
+
+from google.genai import types
+
+from conversation_context import part_size
+
+# A short sign-in flow touching every kind of tool; afterwards the task is reported done
+DEFAULT_SCRIPT = [
+    [("launch_app", {"package_name": "com.android.chrome"})],
+    [("tap_element", {"text": "Gmail"})],
+    [("tap", {"x": 360, "y": 800})],
+    [("run_actions", {"actions": [{"action": "input_text", "text": "qa@example.com"},
+                                  {"action": "press_key", "keycode": "ENTER"}]})],
+    [("get_device_details", {"device_id": "emulator-5554"}), ("get_installed_packages", {})],
+    [("swipe", {"x1": 360, "y1": 1200, "x2": 360, "y2": 400})],
+]
+
+
+def scripted_response(calls=None, text=None) -> types.GenerateContentResponse:
+    parts = [types.Part(function_call=types.FunctionCall(name=name, args=args)) for name, args in (calls or [])]
+    if not parts:
+        parts = [types.Part(text=text)]
+    return types.GenerateContentResponse(candidates=[types.Candidate(content=types.Content(role="model", parts=parts))])
+
+
+class ScriptedModels:
+    """
+    Returns the script's turns in order, then '{success: true}'.
+
+    Attributes:
+        requests (list): Per request: (start, end, request_bytes) with perf_counter times
+    """
+
+    def __init__(self, script: Optional[List[list]] = None, latency: float = 0.0):
+        self.script = DEFAULT_SCRIPT if script is None else script
+        self.latency = latency
+        self.requests = []
+        self._turn = 0
+
+    def _respond(self, contents):
+        size = sum(part_size(part)[0] for content in contents for part in content.parts or [])
+        turn, self._turn = self._turn, self._turn + 1
+        if turn < len(self.script):
+            return size, scripted_response(self.script[turn])
+        return size, scripted_response(text="{success: true}")
+
+    def generate_content(self, model=None, config=None, contents=None):
+        start = time.perf_counter()
+        size, response = self._respond(contents or [])
+        if self.latency:
+            time.sleep(self.latency)
+        self.requests.append((start, time.perf_counter(), size))
+        return response
+
+
+class AsyncScriptedModels(ScriptedModels):
+    async def generate_content(self, model=None, config=None, contents=None):
+        start = time.perf_counter()
+        size, response = self._respond(contents or [])
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.requests.append((start, time.perf_counter(), size))
+        return response
+
+
+class ScriptedClient:
+    """Drop-in for genai.Client in main.py: `client.models` and `client.aio.models`."""
+
+    class _Aio:
+        def __init__(self, models):
+            self.models = models
+
+    def __init__(self, script: Optional[List[list]] = None, latency: float = 0.0):
+        self.models = ScriptedModels(script, latency)
+        self.aio = self._Aio(AsyncScriptedModels(script, latency))
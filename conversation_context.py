@@ -0,0 +1,217 @@
+"""Bounded conversation history for the agent loop."""
+import io
+import json
+import math
+from typing import Callable, List, Optional
+
+from google.genai import types
+
+from image_budget import describes_image
+
+# Gemini bills an image as 258 tokens per 768x768 tile (one tile if both sides are <= 384)
+TOKENS_PER_IMAGE_TILE = 258
+IMAGE_TILE_SIZE = 768
+
+
+def image_tokens(data: bytes) -> int:
+    """Estimates the tokens an inline image costs from its dimensions."""
+    try:
+        from PIL import Image
+
+        width, height = Image.open(io.BytesIO(data)).size
+    except Exception:
+        return TOKENS_PER_IMAGE_TILE
+    if width <= 384 and height <= 384:
+        return TOKENS_PER_IMAGE_TILE
+    return TOKENS_PER_IMAGE_TILE * math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+
+
+def part_size(part: types.Part):
+    """
+    Returns:
+        tuple: (bytes, estimated_tokens) of one part
+    """
+    if part.inline_data is not None and part.inline_data.data:
+        return len(part.inline_data.data), image_tokens(part.inline_data.data)
+    if part.text:
+        size = len(part.text.encode("utf-8"))
+    elif part.function_response is not None:
+        size = len(json.dumps(part.function_response.response, default=str))
+    elif part.function_call is not None:
+        size = len(json.dumps(part.function_call.args, default=str)) + len(part.function_call.name or "")
+    else:
+        size = 0
+    return size, math.ceil(size / 4)
+
+
+class ConversationContext:
+    """
+    The contents sent with every request, kept within a budget so that long
+    sessions cost roughly the same per step.
+
+    Only the most recent `max_inline_images` screenshots stay inline; older ones
+    are replaced by a short placeholder naming the step they came from. If the
+    history is still over `max_bytes` or `max_tokens`, older inline images are
+    evicted further and then old function responses are shortened to their
+    summary. The first turn (the task) is never touched, and turns are never
+    removed, so function calls and their responses stay paired.
+
+    An ImagePreparer may send only the region that changed since its previous
+    image. Such crops are meaningless without the images before them, so the
+    latest full screen image and every crop after it stay inline even beyond
+    `max_inline_images`. Once that chain reaches `max_inline_images` images,
+    `reset_images` is called so that the next screenshot is a full one again. Only
+    a context still over budget evicts part of the chain, and it then resets too.
+
+    Args:
+        max_inline_images (int): Screenshots kept inline
+        max_bytes (int, optional): Budget for the serialized size of all parts
+        max_tokens (int, optional): Budget for the estimated token count of all parts
+        reset_images (callable, optional): Makes the next screenshot a full screen
+            image, e.g. ImagePreparer.reset
+    """
+
+    def __init__(self, max_inline_images: int = 3, max_bytes: Optional[int] = 8_000_000,
+                 max_tokens: Optional[int] = 200_000, reset_images: Optional[Callable[[], None]] = None):
+        self.max_inline_images = max_inline_images
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.reset_images = reset_images
+        self._contents: List[types.Content] = []
+        self._summaries: List[Optional[str]] = []
+        self._steps: List[Optional[int]] = []
+        self.evicted_images = 0
+
+    @property
+    def contents(self) -> List[types.Content]:
+        return self._contents
+
+    def append(self, content: types.Content, summary: Optional[str] = None, step: Optional[int] = None):
+        """
+        Adds a turn and enforces the budget.
+
+        Args:
+            content (types.Content): The turn to add
+            summary (str, optional): Short description of the step, used in place
+                of the turn's screenshot and payload once they are evicted
+            step (int, optional): The agent step the turn belongs to, named in placeholders
+        """
+        self._contents.append(content)
+        self._summaries.append(summary)
+        self._steps.append(step)
+        self._enforce()
+
+    def size(self):
+        """
+        Returns:
+            tuple: (bytes, estimated_tokens, inline_images) of the current history
+        """
+        total_bytes = total_tokens = images = 0
+        for content in self._contents:
+            for part in content.parts or []:
+                size, tokens = part_size(part)
+                total_bytes += size
+                total_tokens += tokens
+                if part.inline_data is not None:
+                    images += 1
+        return total_bytes, total_tokens, images
+
+    def metrics(self) -> dict:
+        size_bytes, tokens, images = self.size()
+        return {
+            "turns": len(self._contents),
+            "bytes": size_bytes,
+            "estimated_tokens": tokens,
+            "inline_images": images,
+            "evicted_images": self.evicted_images,
+        }
+
+    def _over_budget(self):
+        size_bytes, tokens, _ = self.size()
+        return ((self.max_bytes is not None and size_bytes > self.max_bytes)
+                or (self.max_tokens is not None and tokens > self.max_tokens))
+
+    def _image_positions(self):
+        """(index, part_index, full) of the inline images after the task, oldest first."""
+        positions = []
+        for index, content in enumerate(self._contents):
+            parts = content.parts or []
+            for part_index, part in enumerate(parts):
+                if index == 0 or part.inline_data is None:
+                    continue
+                following = parts[part_index + 1] if part_index + 1 < len(parts) else None
+                # Images without a description were sent whole
+                full = describes_image(following.text if following is not None else None) is not False
+                positions.append((index, part_index, full))
+        return positions
+
+    @staticmethod
+    def _chains(positions):
+        """Splits the images into chains: a full screen image and the crops after it, each relative to the image before."""
+        chains = []
+        for position in positions:
+            if position[2] or not chains:
+                chains.append([])
+            chains[-1].append(position)
+        return chains
+
+    def _placeholder(self, index):
+        summary, step = self._summaries[index], self._steps[index]
+        where = f"from step {step}" if step is not None else "from an earlier step"
+        return f"[screenshot {where} omitted" + (f": {summary}]" if summary else "]")
+
+    def _evict_image(self, index, part_index):
+        parts = self._contents[index].parts
+        parts[part_index] = types.Part(text=self._placeholder(index))
+        # The note on the image's coordinate space goes with it
+        if part_index + 1 < len(parts) and describes_image(parts[part_index + 1].text) is not None:
+            del parts[part_index + 1]
+        self.evicted_images += 1
+
+    def _reset_images(self):
+        if self.reset_images is not None:
+            self.reset_images()
+
+    def _enforce(self):
+        positions = self._image_positions()
+        chains = self._chains(positions)
+        chain = chains[-1] if chains else []
+        newest = set(positions[-self.max_inline_images:]) if self.max_inline_images > 0 else set()
+        keep = set(chain)
+        for older in chains[:-1]:
+            # A crop is only kept together with every image back to its full screen image
+            if older[0][2] and newest.issuperset(older):
+                keep.update(older)
+            else:
+                keep.update(position for position in older if position[2] and position in newest)
+        # Newest first, so deleting a description does not move the parts still to evict
+        for index, part_index, _ in reversed([position for position in positions if position not in keep]):
+            self._evict_image(index, part_index)
+        if len(chain) >= self.max_inline_images:
+            self._reset_images()
+
+        if not self._over_budget():
+            return
+        for protect_chain in (True, False):
+            while True:
+                positions = self._image_positions()
+                chains = self._chains(positions)
+                chain = set(chains[-1]) if protect_chain and chains else set()
+                evictable = [position for position in positions[:-1] if position not in chain]
+                if not evictable:
+                    break
+                index, part_index, _ = evictable[0]
+                self._evict_image(index, part_index)
+                if not protect_chain:
+                    self._reset_images()
+                if not self._over_budget():
+                    return
+        # Keep the most recent two turns intact; shorten older function responses
+        for index in range(1, max(1, len(self._contents) - 2)):
+            shortened = {"result": self._summaries[index] or "omitted"}
+            for part_index, part in enumerate(self._contents[index].parts or []):
+                if part.function_response is not None and part.function_response.response != shortened:
+                    self._contents[index].parts[part_index] = types.Part.from_function_response(
+                        name=part.function_response.name, response=shortened)
+            if not self._over_budget():
+                return
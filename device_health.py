@@ -0,0 +1,108 @@
+"""Per-device circuit breaker that isolates devices which stop answering adb."""
+import threading
+from typing import Callable, Dict, Optional
+
+
+class DeviceHealth:
+    """
+    Counts consecutive timeouts per device. After `threshold` of them the device's
+    circuit opens: check() reports it unavailable so calls fail at once instead of
+    each waiting out its deadline. A background thread probes the device every
+    `probe_interval` seconds and closes the circuit on the first answer.
+
+    close() stops the probes; like PyAdb's other background work they start again
+    when a circuit is used afterwards.
+
+    Args:
+        probe (callable): probe(device_id) -> bool, True if the device answered.
+            It must not go through the breaker.
+        threshold (int): Consecutive timeouts that open a device's circuit
+        probe_interval (float): Seconds between health probes of an open circuit
+    """
+
+    def __init__(self, probe: Callable[[Optional[str]], bool], threshold: int = 3, probe_interval: float = 5.0):
+        self.probe = probe
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._timeouts: Dict[Optional[str], int] = {}
+        self._open = set()
+        self._probers: Dict[Optional[str], threading.Thread] = {}
+        # Set by close(); each generation of probers waits on its own event
+        self._stop = threading.Event()
+
+    def check(self, device_id: Optional[str]) -> Optional[str]:
+        """
+        Returns:
+            str or None: Why the device is skipped, or None if calls may go through
+        """
+        if self.is_open(device_id):
+            return f"device {device_id or '(default)'} is not responding; skipped until a health probe succeeds"
+        return None
+
+    def is_open(self, device_id: Optional[str]) -> bool:
+        with self._lock:
+            if device_id not in self._open:
+                return False
+            self._start_prober(device_id)
+            return True
+
+    def record_success(self, device_id: Optional[str]):
+        with self._lock:
+            self._timeouts.pop(device_id, None)
+
+    def record_timeout(self, device_id: Optional[str]):
+        with self._lock:
+            count = self._timeouts[device_id] = self._timeouts.get(device_id, 0) + 1
+            if count < self.threshold or device_id in self._open:
+                return
+            self._open.add(device_id)
+            print(f"[{device_id}] {count} timeouts in a row; circuit open")
+            self._start_prober(device_id)
+
+    def reset(self, device_id: Optional[str] = None):
+        """Forgets one device's state, e.g. after it reconnected, or every device's if device_id is None."""
+        with self._lock:
+            if device_id is None:
+                self._timeouts.clear()
+                self._open.clear()
+            else:
+                self._timeouts.pop(device_id, None)
+                self._open.discard(device_id)
+
+    def close(self):
+        """Stops the health probes. Open circuits stay open and are probed again once used."""
+        with self._lock:
+            self._stop.set()
+            self._stop = threading.Event()
+            self._probers.clear()
+
+    def _start_prober(self, device_id):
+        # Called with the lock held
+        if device_id in self._probers:
+            return
+        prober = threading.Thread(target=self._probe_until_healthy, args=(device_id, self._stop),
+                                  name=f"health-probe-{device_id}", daemon=True)
+        self._probers[device_id] = prober
+        prober.start()
+
+    def _probe_until_healthy(self, device_id, stop):
+        try:
+            while not stop.wait(self.probe_interval):
+                with self._lock:
+                    if device_id not in self._open:
+                        return
+                try:
+                    healthy = self.probe(device_id)
+                except Exception:
+                    healthy = False
+                if healthy:
+                    with self._lock:
+                        self._open.discard(device_id)
+                        self._timeouts.pop(device_id, None)
+                    print(f"[{device_id}] answering again; circuit closed")
+                    return
+        finally:
+            with self._lock:
+                if self._probers.get(device_id) is threading.current_thread():
+                    del self._probers[device_id]
@@ -0,0 +1,69 @@
+"""Parsing and caching of `getprop` snapshots per device."""
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+_PROPERTY_LINE = re.compile(r"^\[([^\]]+)\]: \[(.*)$")
+
+
+def parse_getprop(output: str) -> Dict[str, str]:
+    """
+    Parses the output of a bare `getprop` into a property map.
+
+    Args:
+        output (str): Lines of the form '[key]: [value]'. Values may span lines.
+
+    Returns:
+        dict: Property name to value
+    """
+    properties = {}
+    key, value_lines = None, []
+    for line in output.splitlines():
+        match = _PROPERTY_LINE.match(line)
+        if match and (key is None or value_lines[-1].endswith("]")):
+            if key is not None:
+                properties[key] = "\n".join(value_lines)[:-1]
+            key, value_lines = match.group(1), [match.group(2)]
+        elif key is not None:
+            value_lines.append(line)
+    if key is not None:
+        joined = "\n".join(value_lines)
+        properties[key] = joined[:-1] if joined.endswith("]") else joined
+    return properties
+
+
+class PropertyCache:
+    """
+    Property snapshots keyed by device id, expiring after `ttl` seconds.
+
+    Entries are also dropped explicitly when a device reconnects or changes state.
+    """
+
+    def __init__(self, ttl: Optional[float] = 300.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}
+
+    def get(self, device_id: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None:
+                return None
+            fetched_at, properties = entry
+            if self.ttl is not None and time.monotonic() - fetched_at > self.ttl:
+                del self._entries[device_id]
+                return None
+            return properties
+
+    def put(self, device_id: str, properties: Dict[str, str]):
+        with self._lock:
+            self._entries[device_id] = (time.monotonic(), properties)
+
+    def invalidate(self, device_id: Optional[str] = None):
+        """Drops one device's snapshot, or every snapshot if device_id is None."""
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)
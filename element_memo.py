@@ -0,0 +1,207 @@
+"""
+Tap positions of elements the model described, remembered per screen so that a
+later step or run can tap them again without finding them in a screenshot.
+
+A screen is identified by a fingerprint: the perceptual hash of a frame, the
+focused window and the screen size. Screens match when their windows and sizes
+are equal and their hashes differ in at most `hash_threshold` bits.
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from frames import hamming_distance
+
+
+def screen_fingerprint(screen_hash: int, size: Tuple[int, int], window: Optional[str] = None) -> dict:
+    """
+    Args:
+        screen_hash (int): frames.difference_hash of the screen
+        size (tuple): (width, height) of the screen in device pixels
+        window (str, optional): The focused window, e.g. from get_foreground_state
+
+    Returns:
+        dict: The fingerprint as stored in the memo
+    """
+    return {"hash": f"{screen_hash:x}", "size": [int(size[0]), int(size[1])], "window": window}
+
+
+def normalize_element(element: str) -> str:
+    return " ".join(element.lower().split())
+
+
+class ElementMemo:
+    """
+    Remembered (screen, element) -> device coordinates, stored as one JSON file and
+    evicted least recently used first once there are more than `max_entries`.
+
+    Each entry also keeps the screen its tap led to. A remembered tap that leads
+    elsewhere has gone stale (the app changed its layout) and should be
+    invalidated; one that leads to the same screen again earns a hit. Entries with
+    `confident_hits` hits on a screen within `confident_distance` bits are
+    confident enough to be tapped without asking the model.
+
+    Args:
+        path (str): The memo file
+        max_entries (int): Maximum number of remembered elements
+        hash_threshold (int): Maximum differing hash bits for a screen to match a remembered one
+        confident_distance (int): Maximum differing hash bits for a confident match
+        confident_hits (int): Confirmed taps an entry needs for a confident match
+        tolerance (float): Fraction of the screen width within which a repeated tap
+            counts as the same position
+    """
+
+    def __init__(self, path: str = ".element_memo.json", max_entries: int = 2000, hash_threshold: int = 24,
+                 confident_distance: int = 8, confident_hits: int = 2, tolerance: float = 0.03):
+        self.path = path
+        self.max_entries = max_entries
+        self.hash_threshold = hash_threshold
+        self.confident_distance = confident_distance
+        self.confident_hits = confident_hits
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._load()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def lookup(self, fingerprint: dict, element: Optional[str] = None) -> List[dict]:
+        """
+        Finds the elements remembered on a matching screen and marks them as used;
+        the use is saved with the next change.
+
+        Args:
+            fingerprint (dict): The current screen, from screen_fingerprint
+            element (str, optional): Only return this element
+
+        Returns:
+            list: Copies of the matching entries, closest screen first, each with
+                'key', 'element' (as first described), 'x', 'y' (device pixels),
+                'hits', 'distance' and 'confident'
+        """
+        wanted = normalize_element(element) if element else None
+        matches = []
+        with self._lock:
+            for key, entry in self._entries.items():
+                if wanted is not None and entry["key_element"] != wanted:
+                    continue
+                distance = self._distance(entry["screen"], fingerprint)
+                if distance is None:
+                    continue
+                entry["used"] = time.time()
+                confident = entry["hits"] >= self.confident_hits and distance <= self.confident_distance
+                matches.append(dict(entry, key=key, distance=distance, confident=confident))
+        matches.sort(key=lambda match: (match["distance"], -match["hits"]))
+        return matches
+
+    def remember(self, fingerprint: dict, element: str, x: int, y: int, result: Optional[dict] = None) -> str:
+        """
+        Records a tap the model aimed at an element. Tapping the same position on a
+        matching screen again counts as a hit; a different position replaces the
+        remembered one.
+
+        Args:
+            fingerprint (dict): The screen the tap was aimed at
+            element (str): The model's description of the element
+            x, y (int): The tap in device pixels
+            result (dict, optional): The screen the tap led to
+
+        Returns:
+            str: The entry's key
+        """
+        wanted = normalize_element(element)
+        with self._lock:
+            key, entry = self._closest(fingerprint, wanted)
+            if entry is not None and self._same_position(entry, x, y, fingerprint):
+                entry["hits"] += 1
+            else:
+                key = key or f"{wanted}|{fingerprint['window']}|{fingerprint['hash']}"
+                entry = self._entries[key] = {"element": element, "key_element": wanted, "screen": fingerprint,
+                                              "hits": 1}
+            entry.update(x=int(x), y=int(y), used=time.time())
+            if result is not None:
+                entry["result"] = result
+            self._evict()
+            self._save()
+        return key
+
+    def verify(self, key: str, fingerprint: Optional[dict]) -> bool:
+        """
+        Checks the screen a remembered tap led to. A match earns the entry a hit, a
+        different screen invalidates it.
+
+        Returns:
+            bool: False if the entry was invalidated
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or fingerprint is None:
+                return True
+            expected = entry.get("result")
+            if expected is not None and self._distance(expected, fingerprint) is None:
+                del self._entries[key]
+                self._save()
+                return False
+            entry["hits"] += 1
+            entry["result"] = fingerprint
+            self._save()
+        return True
+
+    def invalidate(self, key: Optional[str] = None):
+        """Forgets one entry, or every entry if key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._save()
+
+    def _distance(self, remembered, fingerprint):
+        # Hash distance of two screens, or None if they do not match
+        if remembered["size"] != fingerprint["size"] or remembered["window"] != fingerprint["window"]:
+            return None
+        distance = hamming_distance(int(remembered["hash"], 16), int(fingerprint["hash"], 16))
+        return distance if distance <= self.hash_threshold else None
+
+    def _closest(self, fingerprint, wanted):
+        best = (None, None, None)
+        for key, entry in self._entries.items():
+            if entry["key_element"] != wanted:
+                continue
+            distance = self._distance(entry["screen"], fingerprint)
+            if distance is not None and (best[2] is None or distance < best[2]):
+                best = (key, entry, distance)
+        return best[0], best[1]
+
+    def _same_position(self, entry, x, y, fingerprint):
+        limit = self.tolerance * fingerprint["size"][0]
+        return abs(entry["x"] - x) <= limit and abs(entry["y"] - y) <= limit
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            oldest = min(self._entries, key=lambda key: self._entries[key]["used"])
+            del self._entries[oldest]
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _save(self):
+        # Called with the lock held
+        temporary = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"Error writing element memo {self.path}: {e}")
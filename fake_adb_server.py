@@ -0,0 +1,672 @@
+"""
+A local stand-in for the adb server, speaking the smart-socket protocol on a
+loopback port, so the socket transport can be exercised without a device.
+
+Example:
+    with FakeAdbServer() as server:
+        server.add_device("emulator-5554", {"ro.product.model": "sdk_gphone64"})
+        adb = PyAdb(transport=SocketTransport(port=server.port))
+        adb.list_android_devices()
+"""
+import base64
+import re
+import shlex
+import socket
+import socketserver
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from adb_protocol import SHELL_ID_CLOSE_STDIN, SHELL_ID_EXIT, SHELL_ID_STDERR, SHELL_ID_STDIN, SHELL_ID_STDOUT
+
+# (args, stdin) -> (stdout, stderr, exit_code)
+CommandHandler = Callable[[List[str], bytes], Tuple[bytes, bytes, int]]
+
+DEFAULT_PROPERTIES = {
+    "ro.product.model": "Pixel 7",
+    "ro.product.manufacturer": "Google",
+    "ro.build.version.release": "14",
+    "ro.build.fingerprint": "google/panther/panther:14/UQ1A.240105.004/11206848:user/release-keys",
+    "ro.hardware": "panther",
+}
+
+DEFAULT_UI_XML = (
+    "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>"
+    '<hierarchy rotation="0">'
+    '<node index="0" text="" resource-id="" class="android.widget.FrameLayout" package="com.android.launcher" '
+    'content-desc="" clickable="false" enabled="true" focused="false" bounds="[0,0][1080,2400]">'
+    '<node index="0" text="Chrome" resource-id="com.android.launcher:id/icon" class="android.widget.TextView" '
+    'package="com.android.launcher" content-desc="Chrome" clickable="true" enabled="true" focused="false" '
+    'bounds="[100,1800][300,2000]" />'
+    '<node index="1" text="Gmail" resource-id="com.android.launcher:id/icon" class="android.widget.TextView" '
+    'package="com.android.launcher" content-desc="Gmail" clickable="true" enabled="true" focused="false" '
+    'bounds="[400,1800][600,2000]" />'
+    '<node index="2" text="" resource-id="com.android.launcher:id/search" class="android.widget.EditText" '
+    'package="com.android.launcher" content-desc="Search" clickable="true" enabled="true" focused="false" '
+    'bounds="[60,2100][1020,2220]" />'
+    "</node></hierarchy>"
+)
+
+
+def make_png(width: int, height: int, color: Tuple[int, int, int] = (32, 32, 32)) -> bytes:
+    """Builds a solid-color RGB PNG without any imaging dependency."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    row = b"\x00" + bytes(color) * width
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height))
+            + chunk(b"IEND", b""))
+
+
+class FakeDevice:
+    """
+    A scripted device. Shell commands are interpreted by a tiny shell that
+    understands `;`, `&&`, `||`, `|`, `>&2`, `$?` and variable assignment.
+    Individual commands are looked up in `commands`, so callers can add or
+    override behaviour.
+    """
+
+    def __init__(self, serial: str, properties: Optional[Dict[str, str]] = None, state: str = "device",
+                 screen_size: Tuple[int, int] = (1080, 2400), latency: float = 0.0,
+                 features: Optional[List[str]] = None, png_encode_delay: float = 0.0):
+        self.serial = serial
+        self.state = state
+        self.properties = dict(DEFAULT_PROPERTIES if properties is None else properties)
+        self.properties.setdefault("ro.serialno", serial)
+        self.screen_size = screen_size
+        self.screen_png = make_png(*screen_size)
+        # Extra time `screencap -p` spends compressing on a real device
+        self.png_encode_delay = png_encode_delay
+        self.latency = latency
+        self.features = ["shell_v2", "cmd", "stat_v2"] if features is None else features
+        self.packages: Dict[str, int] = {
+            "com.android.chrome": 1,
+            "com.google.android.gm": 1,
+            "com.android.settings": 1,
+        }
+        self.files: Dict[str, bytes] = {}
+        # Returned by `uiautomator dump`
+        self.ui_xml = DEFAULT_UI_XML
+        # Reported by `dumpsys`; `am start` and `monkey` move the focus. focus_window overrides
+        # the focused window title, e.g. 'Application Not Responding: com.example'.
+        self.foreground = "com.google.android.apps.nexuslauncher/.NexusLauncherActivity"
+        self.focus_window: Optional[str] = None
+        self.keyboard_shown = False
+        self.screen_on = True
+        # Text typed by `input text`/`input keyevent` and ADBKeyBoard broadcasts
+        self.typed = ""
+        self.ime = "com.android.inputmethod.latin/.LatinIME"
+        # Start-up time of each `input` process; tens to hundreds of ms on a real device
+        self.input_latency = 0.0
+        # Events written by `sendevent` as (path, type, code, value); with touch_writable False
+        # the input nodes refuse writes, as on a device whose shell lacks the input group
+        self.touch_events: List[Tuple[str, int, int, int]] = []
+        self.touch_writable = True
+        # Cleared to make the device hang: commands and frames block until it is set again
+        self.responsive = threading.Event()
+        self.responsive.set()
+        self.history: List[str] = []
+        self.commands: Dict[str, CommandHandler] = {
+            "echo": self._echo,
+            "printf": self._printf,
+            "true": lambda args, stdin: (b"", b"", 0),
+            "false": lambda args, stdin: (b"", b"", 1),
+            "sleep": self._sleep,
+            "cat": self._cat,
+            "grep": self._grep,
+            "getprop": self._getprop,
+            "screencap": self._screencap,
+            "input": self._input,
+            "getevent": self._getevent,
+            "sendevent": self._sendevent,
+            "ime": self._ime,
+            "settings": self._settings,
+            "pm": self._pm,
+            "cmd": self._cmd,
+            "am": self._am,
+            "monkey": self._monkey,
+            "wm": self._wm,
+            "uiautomator": self._uiautomator,
+            "dumpsys": self._dumpsys,
+        }
+
+    # -- shell interpreter -------------------------------------------------
+
+    def run_script(self, script: str, variables: Optional[Dict[str, str]] = None) -> Tuple[bytes, bytes, int]:
+        """
+        Runs a shell script and returns its combined (stdout, stderr, exit_code).
+
+        Args:
+            script (str): One or more commands separated by newlines or `;`
+            variables (dict, optional): Shell variables, updated in place so an
+                interactive session keeps them between lines
+        """
+        self.responsive.wait()
+        variables = {"?": "0"} if variables is None else variables
+        variables.setdefault("?", "0")
+        stdout, stderr = bytearray(), bytearray()
+        for line in script.splitlines():
+            out, err, _ = self._run_line(line, variables)
+            stdout.extend(out)
+            stderr.extend(err)
+        return bytes(stdout), bytes(stderr), int(variables["?"])
+
+    def _run_line(self, line, variables):
+        lexer = shlex.shlex(line, posix=True, punctuation_chars=";&|>")
+        lexer.whitespace_split = True
+        lexer.commenters = ""
+        try:
+            tokens = list(lexer)
+        except ValueError as e:
+            return b"", f"sh: {e}\n".encode(), 2
+
+        stdout, stderr = bytearray(), bytearray()
+        pipeline, operator = [], ";"
+        for token in tokens + [";"]:
+            if token in (";", "&&", "||", "&"):
+                if pipeline:
+                    skip = (operator == "&&" and variables["?"] != "0") or (operator == "||" and variables["?"] == "0")
+                    if not skip:
+                        out, err, code = self._run_pipeline(pipeline, variables)
+                        stdout.extend(out)
+                        stderr.extend(err)
+                        variables["?"] = str(code)
+                pipeline, operator = [], token
+            else:
+                pipeline.append(token)
+        return bytes(stdout), bytes(stderr), int(variables["?"])
+
+    def _expand(self, token, variables):
+        return re.sub(r"\$(\?|\{\w+\}|\w+)", lambda m: variables.get(m.group(1).strip("{}"), ""), token)
+
+    def _run_pipeline(self, tokens, variables):
+        stages, current = [], []
+        for token in tokens:
+            if token == "|":
+                stages.append(current)
+                current = []
+            else:
+                current.append(token)
+        stages.append(current)
+
+        stdin, stderr, code = b"", bytearray(), 0
+        for stage in stages:
+            stdin, err, code = self._run_simple(stage, stdin, variables)
+            stderr.extend(err)
+        return stdin, bytes(stderr), code
+
+    def _run_simple(self, tokens, stdin, variables):
+        args, redirects = [], {}
+        tokens = iter(tokens)
+        for token in tokens:
+            if token in (">&", ">", ">>"):
+                fd = int(args.pop()) if args and args[-1] in ("1", "2") else 1
+                target = next(tokens, "")
+                redirects[fd] = ("&" + target) if token == ">&" else None
+            else:
+                args.append(self._expand(token, variables))
+
+        if len(args) == 1 and re.fullmatch(r"\w+=.*", args[0]):
+            name, value = args[0].split("=", 1)
+            variables[name] = value
+            return b"", b"", int(variables["?"])
+        if not args:
+            return b"", b"", 0
+
+        self.history.append(" ".join(args))
+        if self.latency:
+            time.sleep(self.latency)
+        handler = self.commands.get(args[0])
+        if handler is None:
+            return b"", f"/system/bin/sh: {args[0]}: inaccessible or not found\n".encode(), 127
+        stdout, stderr, code = handler(args[1:], stdin)
+        if 1 in redirects:
+            stdout, stderr = b"", stderr + stdout if redirects[1] == "&2" else stderr
+        if 2 in redirects:
+            stdout, stderr = stdout + stderr if redirects[2] == "&1" else stdout, b""
+        return stdout, stderr, code
+
+    # -- commands ----------------------------------------------------------
+
+    def _echo(self, args, stdin):
+        newline = True
+        if args and args[0] == "-n":
+            newline, args = False, args[1:]
+        return (" ".join(args) + ("\n" if newline else "")).encode(), b"", 0
+
+    def _printf(self, args, stdin):
+        # Only %s and %d conversions and the \n and \t escapes
+        if not args:
+            return b"", b"printf: need format\n", 1
+        values = iter(args[1:])
+        text = re.sub(r"%[sd]", lambda m: next(values, ""), args[0])
+        return text.replace("\\n", "\n").replace("\\t", "\t").encode(), b"", 0
+
+    def _sleep(self, args, stdin):
+        time.sleep(float(args[0]) if args else 0)
+        return b"", b"", 0
+
+    def _cat(self, args, stdin):
+        if not args:
+            return stdin, b"", 0
+        if args[0] in self.files:
+            return self.files[args[0]], b"", 0
+        return b"", f"cat: {args[0]}: No such file or directory\n".encode(), 1
+
+    def _grep(self, args, stdin):
+        patterns = [arg for arg in args if not arg.startswith("-")]
+        if not patterns:
+            return b"", b"usage: grep PATTERN\n", 2
+        regex = re.compile(patterns[0].encode())
+        lines = [line for line in stdin.splitlines(keepends=True) if regex.search(line)]
+        return b"".join(lines), b"", 0 if lines else 1
+
+    def _getprop(self, args, stdin):
+        if args:
+            return (self.properties.get(args[0], "") + "\n").encode(), b"", 0
+        dump = "".join(f"[{key}]: [{value}]\n" for key, value in sorted(self.properties.items()))
+        return dump.encode(), b"", 0
+
+    def _screencap(self, args, stdin):
+        if "-p" in args:
+            if self.png_encode_delay:
+                time.sleep(self.png_encode_delay)
+            return self.screen_png, b"", 0
+        width, height = self.screen_size
+        header = struct.pack("<IIII", width, height, 1, 0)
+        return header + self.raw_pixels(), b"", 0
+
+    def raw_pixels(self) -> bytes:
+        """The current screen as RGBA_8888."""
+        width, height = self.screen_size
+        return b"\x20\x20\x20\xff" * (width * height)
+
+    def framebuffer(self) -> bytes:
+        """The current screen as a version 2 `framebuffer:` reply."""
+        self.responsive.wait()
+        width, height = self.screen_size
+        header = struct.pack("<14I", 2, 32, 0, width * height * 4, width, height, 0, 8, 16, 8, 8, 8, 24, 8)
+        return header + self.raw_pixels()
+
+    def _pm(self, args, stdin):
+        if args[:2] == ["list", "packages"]:
+            show_versions = "--show-versioncode" in args
+            lines = []
+            for package, version in sorted(self.packages.items()):
+                lines.append(f"package:{package}" + (f" versionCode:{version}" if show_versions else ""))
+            return ("\n".join(lines) + "\n").encode(), b"", 0
+        return b"", b"Unknown command\n", 1
+
+    def _cmd(self, args, stdin):
+        if args[:2] == ["package", "resolve-activity"]:
+            package = args[-1]
+            if package not in self.packages:
+                return b"No activity found\n", b"", 0
+            return f"priority=0 preferredOrder=0 match=0x108000 specificIndex=-1 isDefault=true\n{package}/.Main\n".encode(), b"", 0
+        return b"", f"cmd: Can't find service: {args[0] if args else ''}\n".encode(), 20
+
+    def _input(self, args, stdin):
+        if self.input_latency:
+            time.sleep(self.input_latency)
+        if args[:1] == ["text"] and len(args) > 1:
+            self.typed += args[1].replace("%s", " ")
+        elif args[:1] == ["keyevent"]:
+            self.typed += "".join({"KEYCODE_ENTER": "\n", "KEYCODE_TAB": "\t"}.get(key, "") for key in args[1:])
+        return b"", b"", 0
+
+    def _getevent(self, args, stdin):
+        if args[:1] != ["-p"]:
+            return b"", b"", 1
+        return (
+            "add device 1: /dev/input/event0\n"
+            '  name:     "gpio-keys"\n'
+            "  events:\n"
+            "    KEY (0001): 0072  0073  0074\n"
+            "    SW  (0005): 0002\n"
+            "  input props:\n"
+            "    <none>\n"
+            "add device 2: /dev/input/event2\n"
+            '  name:     "fake_touchscreen"\n'
+            "  events:\n"
+            "    KEY (0001): 014a\n"
+            "    ABS (0003): 002f  : value 0, min 0, max 9, fuzz 0, flat 0, resolution 0\n"
+            "                0030  : value 0, min 0, max 255, fuzz 0, flat 0, resolution 0\n"
+            "                0035  : value 0, min 0, max 4095, fuzz 0, flat 0, resolution 0\n"
+            "                0036  : value 0, min 0, max 4095, fuzz 0, flat 0, resolution 0\n"
+            "                0039  : value 0, min 0, max 65535, fuzz 0, flat 0, resolution 0\n"
+            "                003a  : value 0, min 0, max 1023, fuzz 0, flat 0, resolution 0\n"
+            "  input props:\n"
+            "    INPUT_PROP_DIRECT\n"
+        ).encode(), b"", 0
+
+    def _sendevent(self, args, stdin):
+        if len(args) != 4:
+            return b"", b"usage: sendevent DEVICE TYPE CODE VALUE\n", 1
+        if not self.touch_writable:
+            return b"", f"sendevent: {args[0]}: Permission denied\n".encode(), 1
+        self.touch_events.append((args[0], int(args[1]), int(args[2]), int(args[3])))
+        return b"", b"", 0
+
+    def _ime(self, args, stdin):
+        if args[:1] in (["enable"], ["set"]) and len(args) > 1:
+            if args[0] == "set":
+                self.ime = args[1]
+            return f"Input method {args[1]} selected\n".encode(), b"", 0
+        return b"", b"", 0
+
+    def _settings(self, args, stdin):
+        if args == ["get", "secure", "default_input_method"]:
+            return f"{self.ime}\n".encode(), b"", 0
+        return b"null\n", b"", 0
+
+    def _am(self, args, stdin):
+        if args[:1] == ["broadcast"] and "-a" in args:
+            action = args[args.index("-a") + 1]
+            if action == "ADB_INPUT_B64" and "--es" in args and self.ime.startswith("com.android.adbkeyboard/"):
+                self.typed += base64.b64decode(args[args.index("--es") + 2]).decode("utf-8")
+            return (f"Broadcasting: Intent {{ act={action} flg=0x400000 }}\n"
+                    "Broadcast completed: result=0\n").encode(), b"", 0
+        if args[:1] == ["start"] and "-n" in args:
+            component = args[args.index("-n") + 1]
+            self.foreground = component
+            return f"Starting: Intent {{ cmp={component} }}\n".encode(), b"", 0
+        return b"", b"Error: unknown command\n", 1
+
+    def _monkey(self, args, stdin):
+        if "-p" in args and args[args.index("-p") + 1] in self.packages:
+            self.foreground = f"{args[args.index('-p') + 1]}/.Main"
+            return b"Events injected: 1\n", b"", 0
+        return b"** No activities found to run, monkey aborted.\n", b"", 252
+
+    def _uiautomator(self, args, stdin):
+        if args[:1] != ["dump"]:
+            return b"", b"Usage: uiautomator dump [FILE]\n", 1
+        path = args[1] if len(args) > 1 and not args[1].startswith("-") else "/sdcard/window_dump.xml"
+        status = f"UI hierchary dumped to: {path}\n".encode()
+        if path == "/dev/tty":
+            return self.ui_xml.encode() + status, b"", 0
+        self.files[path] = self.ui_xml.encode()
+        return status, b"", 0
+
+    def _dumpsys(self, args, stdin):
+        service = args[0] if args else ""
+        if service == "window":
+            window = self.focus_window or self.foreground
+            return (f"  mCurrentFocus=Window{{5e2a u0 {window}}}\n"
+                    f"  mFocusedApp=ActivityRecord{{91c u0 {self.foreground} t7}}\n").encode(), b"", 0
+        if service == "input_method":
+            shown = "true" if self.keyboard_shown else "false"
+            return f"  mShowRequested={shown} mShowForced=false mInputShown={shown}\n".encode(), b"", 0
+        if service == "power":
+            wakefulness, display = ("Awake", "ON") if self.screen_on else ("Asleep", "OFF")
+            return f"Display Power: state={display}\n  mWakefulness={wakefulness}\n".encode(), b"", 0
+        return b"", f"Can't find service: {service}\n".encode(), 0
+
+    def _wm(self, args, stdin):
+        if args[:1] == ["size"]:
+            return f"Physical size: {self.screen_size[0]}x{self.screen_size[1]}\n".encode(), b"", 0
+        return b"", b"", 0
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.server_ref: "FakeAdbServer" = self.server.fake
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _read_exactly(self, size):
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = self.request.recv(size - len(buffer))
+            if not chunk:
+                raise ConnectionError("client closed")
+            buffer.extend(chunk)
+        return bytes(buffer)
+
+    def _read_request(self):
+        length = int(self._read_exactly(4), 16)
+        return self._read_exactly(length).decode("utf-8")
+
+    def _okay(self, payload: Optional[bytes] = None):
+        self.request.sendall(b"OKAY" + (b"" if payload is None else b"%04x" % len(payload) + payload))
+
+    def _fail(self, message: str):
+        data = message.encode("utf-8")
+        self.request.sendall(b"FAIL" + b"%04x" % len(data) + data)
+
+    def handle(self):
+        try:
+            self._handle()
+        except (ConnectionError, OSError):
+            pass
+
+    def _handle(self):
+        server = self.server_ref
+        request = self._read_request()
+        if server.latency:
+            time.sleep(server.latency)
+
+        if request == "host:version":
+            return self._okay(b"0029")
+        if request in ("host:devices", "host:devices-l"):
+            listing = "".join(f"{device.serial}\t{device.state}\n" for device in server.devices.values())
+            return self._okay(listing.encode())
+        if request in ("host:features", "host:get-state"):
+            if len(server.devices) != 1:
+                return self._fail("more than one device/emulator" if server.devices else "no devices/emulators found")
+            device = next(iter(server.devices.values()))
+            return self._okay((",".join(device.features) if request == "host:features" else device.state).encode())
+        if request.startswith("host-serial:"):
+            serial, _, query = request[len("host-serial:"):].rpartition(":")
+            device = server.devices.get(serial)
+            if device is None:
+                return self._fail(f"device '{serial}' not found")
+            if query == "features":
+                return self._okay(",".join(device.features).encode())
+            if query == "get-state":
+                return self._okay(device.state.encode())
+            return self._fail(f"unknown host service {request}")
+        if request.startswith("host:transport"):
+            device = self._select(request)
+            if device is None:
+                return
+            self._okay()
+            return self._serve_device(device, self._read_request())
+        self._fail(f"unknown host service {request}")
+
+    def _select(self, request):
+        devices = self.server_ref.devices
+        if request == "host:transport-any":
+            if len(devices) != 1:
+                self._fail("more than one device/emulator" if devices else "no devices/emulators found")
+                return None
+            device = next(iter(devices.values()))
+        else:
+            serial = request[len("host:transport:"):]
+            device = devices.get(serial)
+            if device is None:
+                self._fail(f"device '{serial}' not found")
+                return None
+        if device.state != "device":
+            self._fail(f"device {device.state}")
+            return None
+        return device
+
+    def _serve_device(self, device, service):
+        if service.startswith("shell,v2"):
+            _, _, command = service.partition(":")
+            self._okay()
+            return self._serve_shell_v2(device, command)
+        if service.startswith("shell:"):
+            command = service[len("shell:"):]
+            self._okay()
+            if not command:
+                return self._serve_interactive_v1(device)
+            stdout, stderr, _ = device.run_script(command)
+            return self.request.sendall(stdout + stderr)
+        if service.startswith("exec:"):
+            self._okay()
+            stdout, _, _ = device.run_script(service[len("exec:"):])
+            return self.request.sendall(stdout)
+        if service == "framebuffer:":
+            self._okay()
+            return self.request.sendall(device.framebuffer())
+        if service == "sync:":
+            self._okay()
+            return self._serve_sync(device)
+        self._fail(f"unknown service {service}")
+
+    def _packet(self, packet_id, data=b""):
+        self.request.sendall(struct.pack("<BI", packet_id, len(data)) + data)
+
+    def _serve_shell_v2(self, device, command):
+        if command:
+            stdout, stderr, code = device.run_script(command)
+            if stdout:
+                self._packet(SHELL_ID_STDOUT, stdout)
+            if stderr:
+                self._packet(SHELL_ID_STDERR, stderr)
+            return self._packet(SHELL_ID_EXIT, bytes([code & 0xff]))
+
+        variables, pending = {}, b""
+        while True:
+            header = self._read_exactly(5)
+            packet_id, length = header[0], struct.unpack("<I", header[1:])[0]
+            data = self._read_exactly(length) if length else b""
+            if packet_id == SHELL_ID_CLOSE_STDIN:
+                return self._packet(SHELL_ID_EXIT, bytes([int(variables.get("?", "0")) & 0xff]))
+            if packet_id != SHELL_ID_STDIN:
+                continue
+            pending += data
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                text = line.decode("utf-8", "replace")
+                if text.strip() == "exit":
+                    return self._packet(SHELL_ID_EXIT, bytes([int(variables.get("?", "0")) & 0xff]))
+                stdout, stderr, _ = device.run_script(text, variables)
+                if stdout:
+                    self._packet(SHELL_ID_STDOUT, stdout)
+                if stderr:
+                    self._packet(SHELL_ID_STDERR, stderr)
+
+    def _serve_interactive_v1(self, device):
+        variables, pending = {}, b""
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            pending += data
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                text = line.decode("utf-8", "replace")
+                if text.strip() == "exit":
+                    return
+                stdout, stderr, _ = device.run_script(text, variables)
+                self.request.sendall(stdout + stderr)
+
+    def _serve_sync(self, device):
+        while True:
+            header = self._read_exactly(8)
+            command, length = header[:4], struct.unpack("<I", header[4:])[0]
+            payload = self._read_exactly(length) if length else b""
+            if command == b"QUIT":
+                return
+            if command == b"STAT":
+                data = device.files.get(payload.decode())
+                if data is None:
+                    self.request.sendall(b"STAT" + struct.pack("<III", 0, 0, 0))
+                else:
+                    self.request.sendall(b"STAT" + struct.pack("<III", 0o100644, len(data), int(time.time())))
+            elif command == b"RECV":
+                data = device.files.get(payload.decode())
+                if data is None:
+                    message = b"No such file or directory"
+                    self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                    continue
+                for offset in range(0, len(data), 65536):
+                    block = data[offset:offset + 65536]
+                    self.request.sendall(b"DATA" + struct.pack("<I", len(block)) + block)
+                self.request.sendall(b"DONE" + struct.pack("<I", 0))
+            elif command == b"SEND":
+                path = payload.decode().rsplit(",", 1)[0]
+                data = bytearray()
+                while True:
+                    chunk_header = self._read_exactly(8)
+                    kind, size = chunk_header[:4], struct.unpack("<I", chunk_header[4:])[0]
+                    if kind == b"DONE":
+                        break
+                    data.extend(self._read_exactly(size))
+                device.files[path] = bytes(data)
+                self.request.sendall(b"OKAY" + struct.pack("<I", 0))
+            else:
+                return
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+
+class FakeAdbServer:
+    """
+    A threaded fake adb server bound to a loopback port.
+
+    Args:
+        port (int): Port to listen on. 0 picks a free port; read it back from `port`.
+        latency (float): Seconds to wait before answering each request
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0):
+        self.devices: Dict[str, FakeDevice] = {}
+        self.latency = latency
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def add_device(self, serial: str, properties: Optional[Dict[str, str]] = None, **kwargs) -> FakeDevice:
+        device = FakeDevice(serial, properties, **kwargs)
+        self.devices[serial] = device
+        return device
+
+    def remove_device(self, serial: str):
+        self.devices.pop(serial, None)
+
+    def start(self):
+        # A short poll so that stop() returns quickly
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake adb server for local testing.")
+    parser.add_argument("--port", type=int, default=5037)
+    parser.add_argument("--devices", type=int, default=1, help="Number of fake devices to expose")
+    parser.add_argument("--latency", type=float, default=0.0, help="Per-command device latency in seconds")
+    options = parser.parse_args()
+
+    fake = FakeAdbServer(port=options.port)
+    for index in range(options.devices):
+        fake.add_device(f"emulator-{5554 + 2 * index}", latency=options.latency)
+    print(f"fake adb server listening on 127.0.0.1:{fake.port}")
+    fake._server.serve_forever()
@@ -0,0 +1,100 @@
+"""
+A cheap probe of what the device is showing: focused app and window, keyboard,
+screen power and system error dialogs, from one batched dumpsys query.
+"""
+import re
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+# One shell round-trip; grep keeps the transfer to a handful of lines
+FOREGROUND_COMMAND = (
+    "dumpsys window | grep -E 'mCurrentFocus=|mFocusedApp='; "
+    "dumpsys input_method | grep -E 'mInputShown=|mIsInputViewShown='; "
+    "dumpsys power | grep -E 'mWakefulness=|Display Power: state='"
+)
+
+# 'Window{4a1 u0 com.android.chrome/org.chromium.ChromeTabbedActivity}' or 'ActivityRecord{... u0 pkg/.Act t12}'
+_COMPONENT = re.compile(r"\s(?:u\d+\s)?([\w.]+)/([\w.$]+)")
+_WINDOW = re.compile(r"mCurrentFocus=Window\{\S+ (?:u\d+ )?([^}]*)\}")
+_DIALOGS = (("Application Not Responding: ", "anr"), ("Application Error: ", "crash"))
+
+# Fields a screenshot depends on; while they are equal the device shows the same app state
+SCREEN_FIELDS = ("package", "activity", "window", "keyboard_shown", "screen_on", "dialog")
+
+
+@dataclass
+class ForegroundState:
+    package: Optional[str] = None
+    activity: Optional[str] = None
+    window: Optional[str] = None
+    keyboard_shown: bool = False
+    screen_on: bool = True
+    dialog: Optional[str] = None
+    dialog_package: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def describe(self) -> str:
+        if not self.screen_on:
+            return "screen is off"
+        activity = self.activity or ""
+        if self.package and activity.startswith(f"{self.package}."):
+            activity = activity[len(self.package):]
+        parts = [f"foreground {self.package}/{activity}" if activity else f"foreground {self.package}"]
+        if self.keyboard_shown:
+            parts.append("keyboard shown")
+        if self.dialog == "anr":
+            parts.append(f"'Application Not Responding' dialog for {self.dialog_package}")
+        elif self.dialog == "crash":
+            parts.append(f"crash dialog for {self.dialog_package}")
+        return ", ".join(parts)
+
+
+def parse_foreground_state(output: str) -> ForegroundState:
+    """
+    Parses the output of FOREGROUND_COMMAND.
+
+    Raises:
+        ValueError: If the output has no focus information
+    """
+    state = ForegroundState()
+    focused_app = None
+    seen = False
+    for line in output.splitlines():
+        line = line.strip()
+        # With several displays the default display comes first
+        if line.startswith("mCurrentFocus="):
+            seen = True
+            match = _WINDOW.search(line)
+            if match and state.window is None:
+                state.window = match.group(1).strip()
+        elif line.startswith("mFocusedApp="):
+            seen = True
+            focused_app = focused_app or line
+        elif "mInputShown=" in line or "mIsInputViewShown=" in line:
+            if "mInputShown=true" in line or "mIsInputViewShown=true" in line:
+                state.keyboard_shown = True
+        elif line.startswith("mWakefulness="):
+            state.screen_on = state.screen_on and line.split("=", 1)[1].strip() == "Awake"
+        elif line.startswith("Display Power: state="):
+            state.screen_on = state.screen_on and line.split("=", 1)[1].strip() == "ON"
+
+    if not seen:
+        raise ValueError("no window focus in dumpsys output")
+
+    window = state.window or ""
+    for prefix, kind in _DIALOGS:
+        if window.startswith(prefix):
+            state.dialog, state.dialog_package = kind, window[len(prefix):].strip()
+
+    match = _COMPONENT.search(" " + window) if "/" in window else None
+    if match is None and focused_app is not None:
+        match = _COMPONENT.search(focused_app)
+    if match:
+        state.package, activity = match.group(1), match.group(2)
+        state.activity = f"{state.package}{activity}" if activity.startswith(".") else activity
+    elif window and state.dialog is None:
+        # Windows without an activity, e.g. StatusBar or NotificationShade
+        state.package = window
+    return state
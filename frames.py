@@ -0,0 +1,223 @@
+"""Raw (unencoded) screen frames as returned by `screencap` and the `framebuffer:` service."""
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+# android::PixelFormat values reported by screencap, with bytes per pixel
+PIXEL_FORMATS = {
+    1: ("RGBA", 4),  # RGBA_8888
+    2: ("RGBX", 4),  # RGBX_8888
+    3: ("RGB", 3),   # RGB_888
+    4: ("BGR;16", 2),  # RGB_565, as PIL names its little-endian layout
+    5: ("BGRA", 4),  # BGRA_8888
+}
+
+
+@dataclass
+class RawFrame:
+    """
+    An unencoded frame. `pixels` is a memoryview into the buffer the frame was
+    received in, so no pixel data is copied until the caller decides to.
+    """
+    width: int
+    height: int
+    mode: str
+    bytes_per_pixel: int
+    pixels: memoryview
+    timestamp: float = 0.0
+
+    @property
+    def stride(self) -> int:
+        return self.width * self.bytes_per_pixel
+
+    def row(self, y: int) -> memoryview:
+        return self.pixels[y * self.stride:(y + 1) * self.stride]
+
+    def to_image(self):
+        """Wraps the pixels in a PIL image (RGB or RGBA) without re-encoding."""
+        from PIL import Image
+
+        if self.mode in ("RGBA", "BGRA"):
+            return Image.frombuffer("RGBA", (self.width, self.height), self.pixels, "raw", self.mode, 0, 1)
+        return Image.frombuffer("RGB", (self.width, self.height), self.pixels, "raw", self.mode, 0, 1).copy()
+
+    def to_png(self, compress_level: int = 1) -> bytes:
+        """Encodes the frame as PNG on the host."""
+        import io
+
+        buffer = io.BytesIO()
+        self.to_image().save(buffer, format="PNG", compress_level=compress_level)
+        return buffer.getvalue()
+
+
+def parse_screencap_raw(data: bytes) -> RawFrame:
+    """
+    Parses the output of `screencap` without -p.
+
+    The header is width, height and pixel format as little-endian u32, followed on
+    Android 8+ by a u32 dataspace. Which header is present is inferred from the size.
+
+    Raises:
+        ValueError: If the data does not look like a screencap frame
+    """
+    if len(data) < 12:
+        raise ValueError("screencap output too short")
+    width, height, pixel_format = struct.unpack_from("<III", data)
+    if pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f"unsupported pixel format {pixel_format}")
+    mode, bytes_per_pixel = PIXEL_FORMATS[pixel_format]
+    size = width * height * bytes_per_pixel
+    for header_size in (16, 12):
+        if len(data) >= header_size + size and (len(data) - header_size - size) < 4:
+            view = memoryview(data)[header_size:header_size + size]
+            return RawFrame(width, height, mode, bytes_per_pixel, view)
+    raise ValueError(f"expected {size} bytes of pixels for {width}x{height}, got {len(data) - 12}")
+
+
+def parse_framebuffer(data: bytes) -> RawFrame:
+    """
+    Parses the reply of the adb `framebuffer:` service (header version 1 or 2).
+
+    Raises:
+        ValueError: If the header is unknown or the pixel data is truncated
+    """
+    version = struct.unpack_from("<I", data)[0]
+    if version == 1:
+        fields, header_size = struct.unpack_from("<12I", data, 4), 52
+        bpp, size, width, height = fields[:4]
+        offsets = fields[4:]
+    elif version == 2:
+        fields, header_size = struct.unpack_from("<13I", data, 4), 56
+        bpp, _colorspace, size, width, height = fields[:5]
+        offsets = fields[5:]
+    else:
+        raise ValueError(f"unsupported framebuffer version {version}")
+    if len(data) < header_size + size:
+        raise ValueError("truncated framebuffer data")
+
+    red_offset, _, blue_offset, _, green_offset, _, alpha_offset, alpha_length = offsets
+    if bpp == 32:
+        order = sorted([(red_offset, "R"), (green_offset, "G"), (blue_offset, "B"),
+                        (alpha_offset, "A" if alpha_length else "X")])
+        mode = "".join(channel for _, channel in order)
+        if mode not in ("RGBA", "RGBX", "BGRA"):
+            raise ValueError(f"unsupported channel layout {mode}")
+        bytes_per_pixel = 4
+    elif bpp == 24:
+        mode, bytes_per_pixel = "RGB", 3
+    elif bpp == 16:
+        mode, bytes_per_pixel = "BGR;16", 2
+    else:
+        raise ValueError(f"unsupported bits per pixel {bpp}")
+    return RawFrame(width, height, mode, bytes_per_pixel, memoryview(data)[header_size:header_size + size])
+
+
+def png_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Width and height from a PNG's IHDR chunk without decoding it, or None if data is not a PNG."""
+    if len(data) < 24 or data[:8] != b"\x89PNG\r\n\x1a\n":
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+def frame_from_png(data: bytes) -> RawFrame:
+    """Decodes a PNG (e.g. from take_screenshot) into an RGBA RawFrame."""
+    import io
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data)).convert("RGBA")
+    return RawFrame(image.width, image.height, "RGBA", 4, memoryview(image.tobytes()))
+
+
+def sample_luma(frame: RawFrame, columns: int = 32, rows: int = 64) -> bytes:
+    """
+    Samples the frame's luminance on a columns x rows grid of pixel centres.
+
+    Reading a few thousand pixels straight out of the raw buffer keeps frame
+    comparison cheap without decoding or resizing the full frame.
+    """
+    pixels, width, height, bpp = frame.pixels, frame.width, frame.height, frame.bytes_per_pixel
+    if frame.mode == "BGRA":
+        red, blue = 2, 0
+    else:
+        red, blue = 0, 2
+    samples = bytearray(columns * rows)
+    index = 0
+    for row in range(rows):
+        y = (2 * row + 1) * height // (2 * rows)
+        base = y * width
+        for column in range(columns):
+            offset = (base + (2 * column + 1) * width // (2 * columns)) * bpp
+            if bpp == 2:
+                value = pixels[offset] | (pixels[offset + 1] << 8)
+                r, g, b = (value >> 11) << 3, ((value >> 5) & 0x3f) << 2, (value & 0x1f) << 3
+            else:
+                r, g, b = pixels[offset + red], pixels[offset + 1], pixels[offset + blue]
+            samples[index] = (r * 299 + g * 587 + b * 114) // 1000
+            index += 1
+    return bytes(samples)
+
+
+def luma_difference(a: bytes, b: bytes) -> float:
+    """Mean absolute difference of two luma samples, from 0.0 (identical) to 1.0."""
+    if len(a) != len(b) or not a:
+        return 1.0
+    return sum(abs(x - y) for x, y in zip(a, b)) / (255.0 * len(a))
+
+
+def difference_hash(frame: RawFrame, size: int = 8) -> int:
+    """
+    A perceptual hash (dHash) of size*size bits, 64 by default: each bit tells
+    whether a sample on a (size+1) x size luma grid is brighter than its right
+    neighbour. Small visual changes flip few bits, so compare hashes with
+    hamming_distance.
+    """
+    samples = sample_luma(frame, size + 1, size)
+    value = 0
+    for row in range(size):
+        for column in range(size):
+            left, right = samples[row * (size + 1) + column], samples[row * (size + 1) + column + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SettleDetector:
+    """
+    Decides when the screen has stopped changing, from frames fed one at a time.
+
+    The screen counts as settled once `stable_frames` consecutive frame pairs
+    differ by at most `threshold` (mean luma difference, 'pixel' method) or by at
+    most `hash_threshold` bits of their difference_hash ('phash' method).
+    """
+
+    def __init__(self, threshold: float = 0.005, stable_frames: int = 1, method: str = "pixel",
+                 hash_threshold: int = 2):
+        if method not in ("pixel", "phash"):
+            raise ValueError(f"unknown settle method {method}")
+        self.threshold = threshold
+        self.stable_frames = stable_frames
+        self.method = method
+        self.hash_threshold = hash_threshold
+        self.last_difference = None
+        self._previous = None
+        self._stable = 0
+
+    def add(self, frame: RawFrame) -> bool:
+        """
+        Returns:
+            bool: True once the screen is considered settled
+        """
+        signature = difference_hash(frame) if self.method == "phash" else sample_luma(frame)
+        if self._previous is not None:
+            if self.method == "phash":
+                self.last_difference = hamming_distance(signature, self._previous)
+                similar = self.last_difference <= self.hash_threshold
+            else:
+                self.last_difference = luma_difference(signature, self._previous)
+                similar = self.last_difference <= self.threshold
+            self._stable = self._stable + 1 if similar else 0
+        self._previous = signature
+        return self._stable >= self.stable_frames
@@ -0,0 +1,207 @@
+"""
+Shrinks screenshots before they are sent to the model: downscaling, re-encoding,
+grayscale, and sending only the changed region when most of the screen is unchanged.
+
+All images of a session share one coordinate space, the downscaled full screen,
+so the model's coordinates map back to device pixels with a single scale factor.
+"""
+import io
+from typing import Optional, Tuple
+
+from PIL import Image, ImageChops
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class ImageBudget:
+    """
+    Limits for images sent to the model.
+
+    Args:
+        max_width (int, optional): Maximum width of the full screen image in pixels
+        max_height (int, optional): Maximum height of the full screen image in pixels
+        max_bytes (int, optional): Byte budget per image. Quality is lowered, then the
+            image is shrunk further, until it fits.
+        format (str): 'png', 'jpeg' or 'webp'
+        quality (int): Starting quality for jpeg/webp
+        grayscale (bool): Drop color
+        crop_changes (bool): Send only the changed bounding region when it is small
+        max_changed_fraction (float): Largest changed area, as a fraction of the screen,
+            that is still sent as a crop
+        change_tolerance (int): Per-pixel luma difference (0-255) ignored as noise
+    """
+
+    def __init__(self, max_width: Optional[int] = 720, max_height: Optional[int] = 1600,
+                 max_bytes: Optional[int] = 150_000, format: str = "jpeg", quality: int = 80,
+                 grayscale: bool = False, crop_changes: bool = True, max_changed_fraction: float = 0.35,
+                 change_tolerance: int = 8):
+        if format not in MIME_TYPES:
+            raise ValueError(f"unsupported image format {format}")
+        self.max_width = max_width
+        self.max_height = max_height
+        self.max_bytes = max_bytes
+        self.format = format
+        self.quality = quality
+        self.grayscale = grayscale
+        self.crop_changes = crop_changes
+        self.max_changed_fraction = max_changed_fraction
+        self.change_tolerance = change_tolerance
+
+
+class PreparedImage:
+    """
+    An image ready for the model.
+
+    Attributes:
+        data (bytes): Encoded image
+        mime_type (str): MIME type of data
+        scale (float): Device pixels per image pixel
+        region (tuple or None): (left, top, right, bottom) of a crop in full screen image
+            coordinates, or None if the image is the full screen
+        size (tuple): (width, height) of the full screen image
+        unchanged (bool): Nothing changed since the previous image; data is a tiny crop
+    """
+
+    def __init__(self, data: bytes, mime_type: str, scale: float, size: Tuple[int, int],
+                 region: Optional[Tuple[int, int, int, int]] = None, unchanged: bool = False):
+        self.data = data
+        self.mime_type = mime_type
+        self.scale = scale
+        self.size = size
+        self.region = region
+        self.unchanged = unchanged
+
+    def describe(self) -> str:
+        """A note for the model explaining what the image shows and its coordinate space."""
+        width, height = self.size
+        if self.unchanged:
+            return "The screen has not changed since the previous screenshot."
+        if self.region is None:
+            return f"Screenshot ({width}x{height}). Give coordinates in this image's pixels."
+        left, top, right, bottom = self.region
+        return (f"Only part of the screen changed since the previous screenshot. This image is the region "
+                f"left={left}, top={top}, right={right}, bottom={bottom} of the {width}x{height} screen; the rest "
+                f"is unchanged. Keep giving coordinates in full {width}x{height} screenshot pixels.")
+
+
+def describes_image(text: Optional[str]) -> Optional[bool]:
+    """
+    Recognizes the note PreparedImage.describe() sends after an image.
+
+    Returns:
+        bool or None: True for a full screen image, False for a changed region or an
+            unchanged screen (both relative to the image before), None for other text
+    """
+    if not text:
+        return None
+    if text.startswith("Screenshot ("):
+        return True
+    if text.startswith(("Only part of the screen changed", "The screen has not changed")):
+        return False
+    return None
+
+
+class ImagePreparer:
+    """
+    Prepares successive screenshots of one device under an ImageBudget and maps the
+    model's coordinates back to device space.
+    """
+
+    def __init__(self, budget: Optional[ImageBudget] = None):
+        self.budget = budget if budget is not None else ImageBudget()
+        self.scale = 1.0
+        self._previous = None
+
+    def to_device(self, x, y) -> Tuple[int, int]:
+        """Maps a point in screenshot coordinates to device pixels."""
+        return int(round(float(x) * self.scale)), int(round(float(y) * self.scale))
+
+    def reset(self):
+        """Forces the next image to be a full screen image."""
+        self._previous = None
+
+    def prepare(self, png: bytes) -> PreparedImage:
+        """
+        Args:
+            png (bytes): Full resolution screenshot, e.g. from take_screenshot
+
+        Returns:
+            PreparedImage: The image to send and its coordinate mapping
+        """
+        budget = self.budget
+        image = Image.open(io.BytesIO(png))
+        image = image.convert("L" if budget.grayscale else "RGB")
+
+        device_width = image.width
+        scale = 1.0
+        if budget.max_width and image.width > budget.max_width:
+            scale = max(scale, image.width / budget.max_width)
+        if budget.max_height and image.height > budget.max_height:
+            scale = max(scale, image.height / budget.max_height)
+        if scale > 1.0:
+            image = image.resize((round(image.width / scale), round(image.height / scale)), Image.BILINEAR)
+
+        region, unchanged = self._changed_region(image, scale)
+        if region is None:
+            data, encoded = self._encode_within_budget(image, resize=True)
+            if encoded.size != image.size:
+                image, scale = encoded, device_width / encoded.width
+        else:
+            data, _ = self._encode_within_budget(image.crop(region), resize=False)
+        self._previous = (image, scale)
+        self.scale = scale
+        return PreparedImage(data, MIME_TYPES[budget.format], scale, image.size, region, unchanged)
+
+    def _changed_region(self, image, scale):
+        """
+        Returns:
+            tuple: (region, unchanged) where region is the crop box to send, or None to send the full image
+        """
+        budget = self.budget
+        if not budget.crop_changes or self._previous is None:
+            return None, False
+        previous, previous_scale = self._previous
+        if previous_scale != scale or previous.size != image.size:
+            return None, False
+        difference = ImageChops.difference(image.convert("L"), previous.convert("L"))
+        mask = difference.point(lambda value: 255 if value > budget.change_tolerance else 0)
+        box = mask.getbbox()
+        if box is None:
+            # Nothing changed; a token crop keeps the turn shape the same
+            return (0, 0, min(image.width, 16), min(image.height, 16)), True
+        left, top, right, bottom = box
+        margin = 8
+        box = (max(0, left - margin), max(0, top - margin), min(image.width, right + margin), min(image.height, bottom + margin))
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        if area > budget.max_changed_fraction * image.width * image.height:
+            return None, False
+        return box, False
+
+    def _encode(self, image, quality):
+        buffer = io.BytesIO()
+        if self.budget.format == "png":
+            image.save(buffer, format="PNG", optimize=True)
+        else:
+            image.save(buffer, format=self.budget.format.upper(), quality=quality)
+        return buffer.getvalue()
+
+    def _encode_within_budget(self, image, resize):
+        """
+        Lowers quality, then (if resize) shrinks the image until it fits max_bytes.
+
+        Returns:
+            tuple: (data, image) where image is the possibly shrunk image that was encoded
+        """
+        budget = self.budget
+        quality = budget.quality
+        data = self._encode(image, quality)
+        if budget.max_bytes is None:
+            return data, image
+        while len(data) > budget.max_bytes and budget.format != "png" and quality > 30:
+            quality -= 15
+            data = self._encode(image, quality)
+        # Shrinking a crop would change its coordinate space, so only full images are shrunk
+        while resize and len(data) > budget.max_bytes and image.width > 64:
+            image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.BILINEAR)
+            data = self._encode(image, quality)
+        return data, image
@@ -1,3 +1,7 @@
+import asyncio
+import concurrent.futures
+import functools
+import inspect
 import os
 import time
 
@@ -5,7 +9,18 @@ from google import genai
 from google.genai import  types
 from dotenv import load_dotenv
 import pyadb
+from adb_transport import SocketTransport
+from async_pyadb import AsyncPyAdb
+from conversation_context import ConversationContext, part_size
+from element_memo import ElementMemo, screen_fingerprint
+from foreground_state import SCREEN_FIELDS
+from frames import difference_hash, frame_from_png, png_size
+from image_budget import ImageBudget, ImagePreparer
 from pyadb import PyAdb, function_declarations
+from screenshot_store import ScreenshotStore
+from speculative_capture import SpeculativeCapture
+from trace_cache import HASH_SIZE, TraceCache, TraceRecorder, replay_trace, task_key
+from tracing import Tracer, default_tracer
 from PIL import Image
 
 load_dotenv()
@@ -28,14 +43,16 @@ Report outcomes, observations, or errors based on tool results and screenshot an
 
 Operational Strategy & Workflow (CRITICAL):
 functions provided: All device interactions MUST use the provided function tools (details supplied via the SDK).
-Screenshot Reliance: You DO NOT have direct access to the UI object hierarchy. Your understanding of the screen state depends entirely on analyzing screenshots.
-Mandatory Workflow for Visual UI Interaction: When asked to interact with a specific UI element (e.g., "tap button X", "enter text in field Y"):
+Foreground State: get_foreground_state cheaply tells you the focused app and activity, whether the keyboard is shown, whether the screen is on and whether an 'Application Not Responding' or crash dialog is showing. When the screen has not changed since the last screenshot you get this state instead of a new screenshot.
+UI Hierarchy: You can query the UI object hierarchy with find_element, and tap an element by its text, resource id or content description with tap_element. Prefer tap_element for elements that have text or an id; it does not need a screenshot. Coordinates returned by find_element are device pixels, not screenshot pixels.
+Workflow for Visual UI Interaction: When the target element has no text or id (e.g., images, canvas content) or the hierarchy lookup fails:
 
 If requried you will be provided with screenshot of current visual state.
 
 Analyze this screenshot using your multimodal capabilities to locate the target element and determine necessary parameters (e.g., coordinates for tap/swipe , identify input fields).
 
-Execute the action using the most specific interaction tool available.
+Execute the action using the most specific interaction tool available. Use long_press to open context menus or start drags, and pinch to zoom maps, images and documents.
+Remembered Elements: When you tap or long_press an element found in a screenshot, describe it in the element argument. You may be told which elements are remembered on the current screen; tap them with tap_remembered instead of looking for them again.
 Tool Prioritization: Utilize the specialized tools provided (for tapping, swiping, text input, key presses, app launching, getting device info, etc.) whenever applicable. Use the generic run_command tool only for ADB actions not covered by specific tools, and do so cautiously.
 Device Context: Use tools for listing devices and getting device details as needed, especially if multiple devices might be connected. Ensure you target the correct device ID if required by the tools.
 
@@ -52,102 +69,748 @@ Your primary directive is to function as a reliable QA agent, navigating and int
 """)
 
 
-def main():
-    pyadb = PyAdb()
-    # pyadb.take_screenshot()
-    # return
+DEFAULT_PROMPT = "launch the chrome app in my connected device and open gmail on it"
+# Sent when the model answers with text but no function calls, so that the next request differs
+CONTINUE_PROMPT = "Continue the task with the tools, or report success if it is complete."
+
+# For calls whose span is recorded by the caller
+NULL_TRACER = Tracer(enabled=False)
+
+
+# Tools that act on one device; in a session bound to a device they always get its id
+DEVICE_TOOLS = {
+    "get_device_details",
+    "get_foreground_state",
+    "launch_app",
+    "take_screenshot",
+    "tap",
+    "swipe",
+    "long_press",
+    "pinch",
+    "input_text",
+    "press_key",
+    "get_installed_packages",
+    "run_actions",
+    "find_element",
+    "tap_element",
+}
+
+
+def bind_device(function, device_id):
+    """Wraps a tool so it targets device_id whatever device the model names."""
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        kwargs["device_id"] = device_id
+        return function(*args, **kwargs)
+    return bound
+
+
+def make_function_map(adb, device_id=None):
+    """
+    Maps tool names from function_declarations to the methods of a PyAdb or AsyncPyAdb.
+
+    Args:
+        device_id (str, optional): Bind the device tools to this device
+    """
     function_map = {
-        "check_if_adb_installed": pyadb.check_if_adb_installed,
-        "make_adb_command": pyadb.make_adb_command,
-        "run_command": pyadb.run_command,
-        "get_device_details": pyadb.get_device_details,
-        "list_android_devices": pyadb.list_android_devices,
-        "launch_app": pyadb.launch_app,
-        "take_screenshot": pyadb.take_screenshot,
-        "tap": pyadb.tap,
-        "swipe": pyadb.swipe,
-        "input_text": pyadb.input_text,
-        "press_key": pyadb.press_key,
-        "get_installed_packages": pyadb.get_installed_packages
+        "check_if_adb_installed": adb.check_if_adb_installed,
+        "make_adb_command": adb.make_adb_command,
+        "run_command": adb.run_command,
+        "get_device_details": adb.get_device_details,
+        "list_android_devices": adb.list_android_devices,
+        "launch_app": adb.launch_app,
+        "take_screenshot": adb.take_screenshot,
+        "tap": adb.tap,
+        "swipe": adb.swipe,
+        "long_press": adb.long_press,
+        "pinch": adb.pinch,
+        "input_text": adb.input_text,
+        "press_key": adb.press_key,
+        "get_installed_packages": adb.get_installed_packages,
+        "run_actions": adb.run_actions,
+        "find_element": adb.find_element,
+        "tap_element": adb.tap_element,
+        "get_foreground_state": adb.get_foreground_state
     }
-   
-    contents = [
-        types.Content(
-            role="user", parts=[types.Part(text="launch the chrome app in my connected device and open gmail on it")]
-        ) 
-    ]
+    if device_id is not None:
+        for name in DEVICE_TOOLS:
+            function_map[name] = bind_device(function_map[name], device_id)
+    return function_map
+
+
+# Tool arguments that are screen coordinates, as (x, y) pairs
+COORDINATE_ARGS = {
+    "tap": [("x", "y")],
+    "swipe": [("x1", "y1"), ("x2", "y2")],
+    "long_press": [("x", "y")],
+    "pinch": [("x", "y")],
+}
+
+# Tool arguments that are distances in screen pixels
+DISTANCE_ARGS = {
+    "pinch": ["start_span", "end_span"],
+}
+
+
+# Tools whose optional 'element' argument describes the tapped element for the ElementMemo
+MEMO_TOOLS = {"tap", "long_press"}
+
+
+def to_device_args(tool_name, args, preparer):
+    """
+    Maps coordinates the model gave in screenshot space back to device pixels.
+    """
+    args = dict(args or {})
+    if preparer is None:
+        return args
+    if tool_name == "run_actions":
+        args["actions"] = [to_device_args(action.get("action"), action, preparer) if isinstance(action, dict) else action
+                           for action in args.get("actions", [])]
+        return args
+    for x_name, y_name in COORDINATE_ARGS.get(tool_name, []):
+        if x_name in args and y_name in args:
+            args[x_name], args[y_name] = preparer.to_device(args[x_name], args[y_name])
+    for name in DISTANCE_ARGS.get(tool_name, []):
+        if name in args:
+            args[name] = preparer.to_device(args[name], 0)[0]
+    return args
+
+
+def is_task_complete(response):
+    return (response.candidates[0].content.parts[0].text and "success" in response.candidates[0].content.parts[0].text) or (response.text and "success" in response.text)
+
+
+def build_response_parts(results, screen, error_screen, preparer=None, tracer=default_tracer, note=None):
+    """
+    Builds the user turn that answers the function calls of one model turn: the
+    screenshot taken after the calls (or the screenshot error) followed by one
+    function response per call, in call order.
+
+    With a preparer the screenshot is downscaled, re-encoded or cropped to its
+    changed region first, with a note on the coordinate space.
+
+    Args:
+        results (list): (tool_name, result) for each call
+        note (str, optional): Text sent before the function responses, e.g. the
+            foreground state; sent instead of the screenshot if screen is None
+    """
+    if(error_screen):
+        print(f"Error taking screenshot: {error_screen}")
+        parts=[types.Part(text=f"Error taking screenshot: {error_screen}")]
+    elif screen is None:
+        parts=[]
+    elif preparer is not None:
+        with tracer.span("image.prepare", bytes=len(screen)) as span:
+            prepared = preparer.prepare(screen)
+            span.set(prepared_bytes=len(prepared.data), mime_type=prepared.mime_type)
+        parts=[types.Part.from_bytes(data=prepared.data, mime_type=prepared.mime_type),
+               types.Part(text=prepared.describe())]
+    else:
+        parts=[types.Part.from_bytes(data=screen, mime_type="image/png")]
+    if note:
+        parts.append(types.Part(text=note))
+
+    for tool_name, result in results:
+        if not result:
+            response = {"result": "unknown state"}
+        elif isinstance(result, bytes) or (isinstance(result, tuple) and result and isinstance(result[0], bytes)):
+            response = {"result": "attaching screenshot"}
+        else:
+            response = {"result": result}
+        parts.append(types.Part.from_function_response(name=tool_name, response=response))
+    return parts
+
+
+# Tools that neither change the screen nor depend on it; they run concurrently with the rest
+READ_ONLY_TOOLS = {
+    "check_if_adb_installed",
+    "make_adb_command",
+    "get_device_details",
+    "list_android_devices",
+    "get_installed_packages",
+    "get_foreground_state",
+}
+
+
+def call_function(function_map, function_call, preparer, tracer=default_tracer):
+    """
+    Returns:
+        The tool's result, or a dict with an error for unknown tools and exceptions
+    """
+    if function_call.name not in function_map:
+        print(f"Unknown function: {function_call.name}")
+        return {"success": False, "error": f"Unknown function: {function_call.name}"}
+    with tracer.span("tool", tool=function_call.name) as span:
+        args = to_device_args(function_call.name, function_call.args, preparer)
+        if function_call.name in MEMO_TOOLS:
+            # Only the loop's memo uses it
+            args.pop("element", None)
+        try:
+            result = function_map[function_call.name](**args)
+        except Exception as e:
+            result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+        span.set(success=bool(is_successful(result)))
+        return result
+
+
+def dispatch_calls(function_calls, function_map, preparer, executor=None, tracer=default_tracer):
+    """
+    Runs the function calls of one model turn. Read-only calls run concurrently on
+    the executor while the calls that act on the screen run in order on this
+    thread, so a turn takes about as long as its slowest chain.
+
+    Args:
+        executor (concurrent.futures.Executor, optional): Without one, every call runs in order
+
+    Returns:
+        list: (tool_name, result) in call order
+    """
+    futures = {}
+    if executor is not None:
+        for index, function_call in enumerate(function_calls):
+            if function_call.name in READ_ONLY_TOOLS:
+                futures[index] = executor.submit(call_function, function_map, function_call, preparer, tracer)
+    results = {index: call_function(function_map, function_call, preparer, tracer)
+               for index, function_call in enumerate(function_calls) if index not in futures}
+    for index, future in futures.items():
+        results[index] = future.result()
+    return [(function_call.name, results[index]) for index, function_call in enumerate(function_calls)]
+
+
+async def dispatch_calls_async(function_calls, function_map, preparer, tracer=default_tracer):
+    """
+    The asyncio version of dispatch_calls: read-only calls are gathered while the
+    screen-changing calls are awaited in order.
+    """
+    async def run(function_call):
+        # Time the await too, not only the creation of the coroutine
+        with tracer.span("tool", tool=function_call.name) as span:
+            result = call_function(function_map, function_call, preparer, NULL_TRACER)
+            if inspect.isawaitable(result):
+                try:
+                    result = await result
+                except Exception as e:
+                    result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+            span.set(success=bool(is_successful(result)))
+        return result
+
+    async def run_ordered(indexed_calls):
+        return [(index, await run(function_call)) for index, function_call in indexed_calls]
+
+    read_only = [(index, call) for index, call in enumerate(function_calls) if call.name in READ_ONLY_TOOLS]
+    ordered = [(index, call) for index, call in enumerate(function_calls) if call.name not in READ_ONLY_TOOLS]
+    read_only_results = asyncio.gather(*(run(call) for _, call in read_only))
+    ordered_results, concurrent_results = await asyncio.gather(run_ordered(ordered), read_only_results)
+    results = dict(ordered_results)
+    results.update({index: result for (index, _), result in zip(read_only, concurrent_results)})
+    return [(function_call.name, results[index]) for index, function_call in enumerate(function_calls)]
+
+
+def same_screen(state, previous):
+    """Whether two get_foreground_state results show the same app state, so a new screenshot can be skipped."""
+    if previous is None or not state.get("success") or not previous.get("success"):
+        return False
+    return all(state.get(field) == previous.get(field) for field in SCREEN_FIELDS)
+
+
+def screen_note(state, previous, changes_screen):
+    """
+    Decides whether a turn needs a screenshot from the foreground state.
+
+    Args:
+        state (dict): get_foreground_state after the turn's calls
+        previous (dict or None): get_foreground_state when the last screenshot was taken
+        changes_screen (bool): Whether the turn ran a call that acts on the screen
+
+    Returns:
+        tuple: (capture, note) where note describes the state for the model
+    """
+    if not state.get("success"):
+        return True, None
+    if not state["screen_on"]:
+        return False, "The screen is off; press_key WAKEUP turns it on."
+    if not changes_screen and same_screen(state, previous):
+        return False, f"Screen unchanged since the last screenshot: {state['summary']}."
+    return True, f"Foreground state: {state['summary']}."
+
+
+def step_summary(tool_name, args, result):
+    """One line describing a step, kept in the context once its screenshot is evicted."""
+    arguments = ", ".join(f"{name}={value}" for name, value in (args or {}).items())
+    if isinstance(result, bytes) or (isinstance(result, tuple) and result and isinstance(result[0], bytes)):
+        outcome = "screenshot"
+    elif isinstance(result, dict) and "success" in result:
+        outcome = "ok" if result["success"] else f"failed: {str(result.get('stderr', ''))[:80]}"
+    else:
+        outcome = str(result)[:80]
+    return f"{tool_name}({arguments}) -> {outcome}"
+
+
+# Calls left out of recorded traces: they only read state, so replaying them is wasted time
+NOT_REPLAYED_TOOLS = READ_ONLY_TOOLS | {"take_screenshot", "find_element"}
+
+
+def is_successful(result):
+    """Whether a tool result reports success, for the tools' dict and (value, error) shapes."""
+    if isinstance(result, dict):
+        return result.get("success", True) and "error" not in result
+    if isinstance(result, tuple) and len(result) == 2:
+        return result[1] is None
+    return result is not None
+
+
+def screen_hash(adb, png=None, device_id=None):
+    """
+    Perceptual hash of the screen, from a screenshot already taken or from a raw capture.
+
+    Returns:
+        int or None: None if the screen could not be captured
+    """
+    if png is not None:
+        try:
+            return difference_hash(frame_from_png(png), HASH_SIZE)
+        except Exception:
+            return None
+    frame, error = adb.capture_raw_frame(device_id)
+    return difference_hash(frame, HASH_SIZE) if error is None else None
+
 
+def replay_cached_trace(adb, function_map, cache, task, device_id=None):
+    """
+    Replays the recorded trace of a task while the screen matches it.
+
+    Returns:
+        tuple: (key, replayed_steps, completed). key is None if the screen could not be captured.
+    """
+    frame, error = adb.capture_raw_frame(device_id)
+    if error is not None:
+        return None, [], False
+    key = task_key(task, (frame.width, frame.height))
+    trace = cache.get(key)
+    if trace is None:
+        return key, [], False
+
+    def execute(name, args):
+        if name not in function_map:
+            return False
+        print(f"Replaying {name}({args})")
+        result = function_map[name](**args)
+        adb.wait_for_ui_idle(device_id)
+        return is_successful(result)
+
+    replayed, completed = replay_trace(cache, trace, lambda: screen_hash(adb, device_id=device_id), execute)
+    print(f"Replayed {len(replayed)} of {len(trace.get('steps', []))} cached steps")
+    return key, replayed, completed
+
+
+def replay_note(replayed):
+    """Tells the model which steps of the task were already replayed from the cache."""
+    calls = [f"{call['name']}({call['args']})" for step in replayed for call in step["calls"]]
+    return ("These actions were already performed for this task (coordinates in device pixels): "
+            + "; ".join(calls) + ". Continue the task from the current screen.")
+
+
+def current_fingerprint(adb, state, png=None, device_id=None):
+    """
+    Fingerprint of the screen for the ElementMemo, from a screenshot already taken
+    or from a raw capture, and the focused window of a get_foreground_state result.
+
+    Returns:
+        dict or None: None if the screen could not be captured
+    """
+    window = (state.get("window") or state.get("package")) if state.get("success") else None
+    if png is not None:
+        try:
+            return screen_fingerprint(difference_hash(frame_from_png(png), HASH_SIZE), png_size(png), window)
+        except Exception:
+            return None
+    frame, error = adb.capture_raw_frame(device_id)
+    if error is not None:
+        return None
+    return screen_fingerprint(difference_hash(frame, HASH_SIZE), (frame.width, frame.height), window)
+
+
+def tap_remembered(adb, memo, preparer, applied, element, device_id=None):
+    """
+    The tap_remembered tool: taps an element remembered on a screen matching the
+    current one if the memo is confident of its position, and otherwise returns
+    the remembered position in screenshot pixels for the model to check.
+
+    Args:
+        applied (list): Receives the memo key of a tap made, for the loop to verify
+            against the screen it leads to
+    """
+    fingerprint = current_fingerprint(adb, adb.get_foreground_state(device_id), device_id=device_id)
+    matches = memo.lookup(fingerprint, element) if fingerprint is not None else []
+    if not matches:
+        return {"success": False, "error": f"no remembered position of '{element}' on this screen; "
+                                           "find it in the screenshot and tap it with element set"}
+    match = matches[0]
+    if not match["confident"]:
+        x, y = round(match["x"] / preparer.scale), round(match["y"] / preparer.scale)
+        return {"success": False, "error": f"'{element}' was seen at ({x}, {y}) on a similar screen; "
+                                           "check the screenshot and tap it with element set"}
+    result = adb.tap(match["x"], match["y"], device_id=device_id)
+    result["remembered"] = {"element": match["element"], "x": match["x"], "y": match["y"], "hits": match["hits"]}
+    if result.get("success"):
+        applied.append(match["key"])
+    return result
+
+
+def update_memo(memo, function_calls, results, preparer, seen, current, applied, note=None):
+    """
+    Learns from and checks the taps of one turn. Only a turn with a single call that
+    acts on the screen is used, so the screens before and after it are known: a tap
+    with an element description is remembered on the screen the model saw, and a
+    tap_remembered whose screen differs from the one it led to before is forgotten.
+
+    Args:
+        seen (dict or None): Fingerprint of the screen in the model's latest screenshot
+        current (dict or None): Fingerprint of the screen after the turn
+        applied (list): Memo keys tapped by tap_remembered this turn; emptied
+        note (str, optional): The turn's note to the model, extended if a position is forgotten
+
+    Returns:
+        str or None: The note
+    """
+    acting = [(call, result) for call, (_, result) in zip(function_calls, results) if call.name not in READ_ONLY_TOOLS]
+    keys = list(applied)
+    applied.clear()
+    if len(acting) != 1 or current is None or not is_successful(acting[0][1]):
+        return note
+    call, result = acting[0]
+    if call.name in MEMO_TOOLS and (call.args or {}).get("element") and seen is not None:
+        args = to_device_args(call.name, call.args, preparer)
+        memo.remember(seen, args["element"], args["x"], args["y"], current)
+    for key in keys:
+        if not memo.verify(key, current):
+            forgotten = f"Tapping the remembered '{result['remembered']['element']}' led to a different screen " \
+                        "than before, so its position is forgotten."
+            note = f"{note} {forgotten}" if note else forgotten
+    return note
+
+
+def memo_note(matches, preparer):
+    """Tells the model which elements are remembered on the current screen, at most 10, closest screens first."""
+    closest = {}
+    for match in matches:
+        closest.setdefault(match["key_element"], match)
+    elements = [f"'{match['element']}' at ({round(match['x'] / preparer.scale)}, {round(match['y'] / preparer.scale)})"
+                for match in list(closest.values())[:10]]
+    return ("Remembered elements on this screen (screenshot pixels), tap them with tap_remembered: "
+            + "; ".join(elements) + ".")
+
+
+def recorded_call(call, result, preparer):
+    """A successful call as stored in a trace, with tap_remembered replaced by the tap it made."""
+    if call.name == "tap_remembered":
+        return {"name": "tap", "args": {"x": result["remembered"]["x"], "y": result["remembered"]["y"]}}
+    return {"name": call.name, "args": to_device_args(call.name, call.args, preparer)}
+
+
+def session_name(device_id=None):
+    """Names a run's screenshot index after its start time and device."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{device_id or 'default'}"
+
+
+def main(parallel_calls=True, replay=True, adb=None, prompt=DEFAULT_PROMPT, trace_path="agent-trace.jsonl",
+         metrics_path="agent-metrics.prom", device_id=None, max_steps=None, stop_event=None, pipelined=True,
+         session=None, memo=True):
+    """
+    Args:
+        parallel_calls (bool): Run the read-only calls of a model turn concurrently
+            with its other calls instead of strictly in order
+        replay (bool or TraceCache): Replay the recorded calls of an earlier successful
+            run of the same task while the screen matches, and record this run's calls.
+            True uses a TraceCache in the working directory.
+        adb (PyAdb, optional): Device access to use; it is left open. Defaults to a PyAdb
+            on a SocketTransport, closed at the end.
+        prompt (str): The task for the model
+        trace_path (str, optional): JSONL file the spans of this run are appended to, when
+            main creates the PyAdb; a passed-in PyAdb keeps its own tracer
+        metrics_path (str, optional): Where the Prometheus-text metrics are written at the end
+        device_id (str, optional): Device to drive. If None, uses the default device.
+        max_steps (int, optional): Give up after this many model turns
+        stop_event (threading.Event, optional): Checked before each model turn; once set the run stops
+        pipelined (bool): Capture the screen on a background thread as soon as a turn's
+            actions return, while the foreground state is read and the turn is recorded,
+            instead of settling and then taking a screenshot
+        session (str, optional): Name of the screenshot store index linking each step to
+            its screenshot. Defaults to the start time and device.
+        memo (bool or ElementMemo): Remember where described elements were tapped on
+            each screen, offer them to the model on matching screens and let it tap
+            them with tap_remembered. True uses an ElementMemo in the working directory.
+
+    Returns:
+        str or None: The model's final text, a note if the task was completed from the
+            trace cache, or None if the run stopped before the task was complete
+    """
+    pyadb = adb if adb is not None else PyAdb(transport=SocketTransport(), tracer=Tracer(trace_path))
+    tracer = pyadb.tracer
+    # pyadb.take_screenshot()
+    # return
+    function_map = make_function_map(pyadb, device_id)
+    preparer = ImagePreparer(ImageBudget())
+    session = session or session_name(device_id)
+    element_memo = ElementMemo() if memo is True else (None if memo is False else memo)
+    # Memo keys tapped by tap_remembered during the current turn
+    applied = []
+    if element_memo is not None:
+        function_map["tap_remembered"] = bind_device(
+            functools.partial(tap_remembered, pyadb, element_memo, preparer, applied), device_id)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=4) if parallel_calls else None
+
+    trace_cache = TraceCache() if replay is True else (None if replay is False else replay)
+    key, replayed, completed = (replay_cached_trace(pyadb, function_map, trace_cache, prompt, device_id)
+                                if trace_cache is not None else (None, [], False))
+    if completed:
+        print("Task completed from the trace cache")
+        if adb is None:
+            pyadb.close()
+            tracer.close()
+        return "Task completed from the trace cache"
+    recorder = TraceRecorder(prompt, replayed)
+    before = screen_hash(pyadb, device_id=device_id) if key is not None else None
+
+    context = ConversationContext(reset_images=preparer.reset)
+    prompt_parts = [types.Part(text=prompt)]
+    if replayed:
+        prompt_parts.append(types.Part(text=replay_note(replayed)))
+    context.append(types.Content(role="user", parts=prompt_parts))
+
+    final_text = None
+    screenshot_state = None
+    # Fingerprint of the screen in the model's latest screenshot
+    seen = None
+    step = 0
     while True:
+        if (max_steps is not None and step >= max_steps) or (stop_event is not None and stop_event.is_set()):
+            print(f"Stopped after {step} steps")
+            break
+        if pyadb.health.is_open(device_id):
+            # Every call would fail at once; leave the task to a device that answers
+            print(f"Stopped after {step} steps: device is not responding")
+            break
+        step += 1
         # Send request with function declarations
-        response = client.models.generate_content(
-            model="gemini-2.0-flash", config=config, contents=contents
-        )
-        if (response.candidates[0].content.parts[0].text and "success" in response.candidates[0].content.parts[0].text) or (response.text and "success" in response.text):
+        with tracer.span("model.generate_content", device_id=device_id, step=step) as span:
+            span.set(bytes=sum(part_size(part)[0] for content in context.contents for part in content.parts or []))
+            response = client.models.generate_content(
+                model="gemini-2.0-flash", config=config, contents=context.contents
+            )
+        if is_task_complete(response):
+            if key is not None and recorder.steps and before is not None:
+                trace_cache.put(key, recorder.trace(before))
+            final_text = response.text
             break
         
         if response.text:
             print(response.text)
-        if response.function_calls:
-            print(response.function_calls)
-
-            for function_call in response.function_calls:
-                tool_call = function_call
-  
-            
-                # Append the model's function call message
-            
-                # Execute the function if it exists in the map
-                if tool_call.name in function_map:
-                    contents.append(types.Content(role="model", parts=[types.Part(function_call=tool_call)]))
-
-                    result = function_map[tool_call.name](**tool_call.args)
-                    time.sleep(1)
-                    print(f"Function execution result: {result}")
-                    screen,error_screen = pyadb.take_screenshot()
-                    if(error_screen):
-                        print(f"Error taking screenshot: {error_screen}")
-                        function_response_part_screenshot_error = types.Part.text(f"Error taking screenshot: {error_screen}")
-                        parts=[function_response_part_screenshot_error]
-                    else:
-                        parts=[types.Part.from_bytes(data=screen, mime_type="image/png")]
-
-                    if result: 
-                        if isinstance(result, bytes):
-                            function_response_part = types.Part.from_function_response(
-                                name=tool_call.name,
-                                response={"result": "attaching screenshot"},
-                            )
-                            parts.append(function_response_part)
-                        else:
-                            function_response_part = types.Part.from_function_response(
-                                name=tool_call.name,
-                                response={"result": result},
-                            )
-                            parts.append(function_response_part)
-
-                        
-                    else:
-                        function_response_part = types.Part.from_function_response(
-                            name=tool_call.name,
-                            response={"result": "unknown state"},
-                        )
-                        parts=[function_response_part]
-                        
-                    contents.append(types.Content(role="user", parts=parts))
-                else:
-                    parts.append(types.Part.text(text=f"Unknown function: {tool_call.name}"))
-                    print(f"Unknown function: {tool_call.name}")
-                    contents.append(types.Content(role="user", parts=parts))
-
-
-            
+        function_calls = response.function_calls or []
+        if not function_calls:
+            context.append(types.Content(role="model", parts=[types.Part(text=response.text or "")]))
+            context.append(types.Content(role="user", parts=[types.Part(text=CONTINUE_PROMPT)]))
+            continue
+        print(function_calls)
 
+        # Append the model's function calls, then answer all of them in one turn
+        context.append(types.Content(role="model", parts=[types.Part(function_call=call) for call in function_calls]))
+        start = time.monotonic()
+        with tracer.span("agent.tools", device_id=device_id, step=step, calls=len(function_calls)):
+            results = dispatch_calls(function_calls, function_map, preparer, executor, tracer)
+        print(f"Function execution results ({(time.monotonic() - start) * 1000:.0f} ms): {results}")
 
+        # One settle and at most one screenshot for the whole batch
+        changes_screen = any(call.name not in READ_ONLY_TOOLS for call in function_calls)
+        speculative = None
+        if changes_screen and pipelined:
+            speculative = SpeculativeCapture(pyadb, device_id, tracer=tracer).start()
+        elif changes_screen:
+            settle = pyadb.wait_for_ui_idle(device_id)
+            if settle.get("error"):
+                with tracer.span("ui.sleep", device_id=device_id, seconds=1):
+                    time.sleep(1)
+            print(f"settled={settle['settled']} in {settle['elapsed'] * 1000:.0f} ms ({settle['frames']} frames)")
+        state = pyadb.get_foreground_state(device_id)
+        capture, note = screen_note(state, screenshot_state, changes_screen)
+        if key is not None and before is not None:
+            recorder.add_step(before, [recorded_call(call, result, preparer)
+                                       for call, (_, result) in zip(function_calls, results)
+                                       if call.name not in NOT_REPLAYED_TOOLS and is_successful(result)])
+        if capture and speculative is not None:
+            screen, error_screen = speculative.result()
+            if error_screen:
+                with tracer.span("ui.sleep", device_id=device_id, seconds=1):
+                    time.sleep(1)
+                screen, error_screen = pyadb.take_screenshot(device_id)
+            else:
+                settle = speculative.settle
+                print(f"settled={settle['settled']} in {settle['elapsed'] * 1000:.0f} ms ({settle['frames']} frames, "
+                      f"{speculative.refreshes} refreshes)")
+            screenshot_state = state
+        elif capture:
+            screen,error_screen = pyadb.take_screenshot(device_id)
+            screenshot_state = state
+        else:
+            if speculative is not None:
+                speculative.cancel()
+            screen, error_screen = None, None
+            print(note)
+        if screen and pyadb.screenshots is not None:
+            pyadb.screenshots.record(session, step, screen, device_id)
+        if key is not None:
+            if capture:
+                before = screen_hash(pyadb, screen) if screen else screen_hash(pyadb, device_id=device_id)
+        offered = []
+        if element_memo is not None:
+            if screen:
+                current = current_fingerprint(pyadb, state, screen)
+            elif capture:
+                current = None
+            else:
+                # Unchanged since the model's latest screenshot
+                current = seen
+            note = update_memo(element_memo, function_calls, results, preparer, seen, current, applied, note)
+            if capture:
+                seen = current
+            if screen and current is not None:
+                offered = element_memo.lookup(current)
+        parts = build_response_parts(results, screen, error_screen, preparer, tracer, note)
+        if offered:
+            # After the screenshot was prepared, so the coordinates use its scale; before the function responses
+            parts.insert(len(parts) - len(results), types.Part(text=memo_note(offered, preparer)))
+        summary = "; ".join(step_summary(call.name, call.args, result)
+                            for call, (_, result) in zip(function_calls, results))
+        context.append(types.Content(role="user", parts=parts), summary=summary, step=step)
+        print(f"Context: {context.metrics()}")
+
+    if executor is not None:
+        executor.shutdown()
+    if metrics_path:
+        tracer.write_metrics(metrics_path)
+    if adb is None:
+        pyadb.close()
+        tracer.close()
+    return final_text
 
     # print(pyadb.list_android_devices())
     # pyadb.launch_app("com.android.chrome")
     #take_screenshot()
 
 
+def no_remembered_elements(element, device_id=None):
+    """tap_remembered in sessions without an ElementMemo."""
+    return {"success": False, "error": "no remembered elements in this session; find the element in the screenshot"}
+
+
+async def run_session_async(adb, prompt=DEFAULT_PROMPT, tracer=default_tracer, max_steps=30, stop_event=None):
+    """
+    Runs the agent loop for one device on the current event loop.
+
+    Args:
+        adb (AsyncPyAdb): Session bound to the device to drive
+        prompt (str): The task for the model
+        tracer (Tracer): Records the model, tool and sleep spans of the session
+        max_steps (int, optional): Give up after this many model turns. None never gives up.
+        stop_event (asyncio.Event, optional): Checked before each model turn; once set the session stops
+
+    Returns:
+        str or None: The model's final text, or None if the session stopped before
+            the task was complete
+    """
+    function_map = make_function_map(adb)
+    function_map["tap_remembered"] = no_remembered_elements
+    preparer = ImagePreparer(ImageBudget())
+    context = ConversationContext(reset_images=preparer.reset)
+    context.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
+    screenshot_state = None
+    session = session_name(adb.serial)
+    step = 0
+
+    while True:
+        if (max_steps is not None and step >= max_steps) or (stop_event is not None and stop_event.is_set()):
+            print(f"[{adb.serial}] Stopped after {step} steps")
+            return None
+        step += 1
+        with tracer.span("model.generate_content", device_id=adb.serial) as span:
+            span.set(bytes=sum(part_size(part)[0] for content in context.contents for part in content.parts or []))
+            response = await client.aio.models.generate_content(
+                model="gemini-2.0-flash", config=config, contents=context.contents
+            )
+        if is_task_complete(response):
+            return response.text
+
+        if response.text:
+            print(f"[{adb.serial}] {response.text}")
+        function_calls = response.function_calls or []
+        if not function_calls:
+            context.append(types.Content(role="model", parts=[types.Part(text=response.text or "")]))
+            context.append(types.Content(role="user", parts=[types.Part(text=CONTINUE_PROMPT)]))
+            continue
+
+        context.append(types.Content(role="model", parts=[types.Part(function_call=call) for call in function_calls]))
+        results = await dispatch_calls_async(function_calls, function_map, preparer, tracer)
+        print(f"[{adb.serial}] Function execution results: {results}")
+        changes_screen = any(call.name not in READ_ONLY_TOOLS for call in function_calls)
+        if changes_screen:
+            with tracer.span("ui.settle", device_id=adb.serial) as span:
+                settle = await adb.wait_for_ui_idle()
+                span.set(settled=settle["settled"], frames=settle["frames"])
+                if settle.get("error"):
+                    span.set(error=settle["error"])
+            if settle.get("error"):
+                with tracer.span("ui.sleep", device_id=adb.serial, seconds=1):
+                    await asyncio.sleep(1)
+            print(f"[{adb.serial}] settled={settle['settled']} in {settle['elapsed'] * 1000:.0f} ms "
+                  f"({settle['frames']} frames)")
+        # After an action a screenshot is almost always needed; take it alongside the probe
+        # and drop it if the probe says the screen is off
+        speculative = asyncio.ensure_future(adb.take_screenshot()) if changes_screen else None
+        state = await adb.get_foreground_state()
+        capture, note = screen_note(state, screenshot_state, changes_screen)
+        screen, error_screen = None, None
+        if capture:
+            screen, error_screen = await (speculative if speculative is not None else adb.take_screenshot())
+            screenshot_state = state
+            if screen:
+                adb.screenshots.record(session, step, screen, adb.serial)
+        elif speculative is not None:
+            speculative.cancel()
+        summary = "; ".join(step_summary(call.name, call.args, result)
+                            for call, (_, result) in zip(function_calls, results))
+        context.append(types.Content(role="user", parts=build_response_parts(results, screen, error_screen, preparer,
+                                                                             tracer, note)),
+                       summary=summary, step=step)
+
+
+async def main_async(prompt=DEFAULT_PROMPT, max_steps=30):
+    """
+    Runs the same task on every ready device concurrently in one event loop.
+
+    Args:
+        max_steps (int, optional): Model turns per device before its session gives up
+
+    Returns:
+        dict: Device id to the model's final text (None if the session gave up), or
+            the exception the session raised
+    """
+    screenshots = ScreenshotStore()
+    try:
+        devices = await AsyncPyAdb(screenshots=screenshots).list_android_devices()
+        if isinstance(devices, tuple):
+            print(f"Error listing devices: {devices[1]}")
+            return {}
+
+        serials = [device['id'] for device in devices if device['detail'][1] is None]
+        results = await asyncio.gather(*(run_session_async(AsyncPyAdb(serial=serial, screenshots=screenshots), prompt,
+                                                           max_steps=max_steps)
+                                         for serial in serials),
+                                       return_exceptions=True)
+        return dict(zip(serials, results))
+    finally:
+        # Finish the screenshots still being written
+        screenshots.close()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,116 @@
+"""Per-device index of installed packages and their resolved launcher activities."""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+LIST_PACKAGES_COMMAND = "pm list packages --show-versioncode"
+
+
+def parse_package_list(output: str) -> Dict[str, int]:
+    """
+    Parses `pm list packages [--show-versioncode]` output.
+
+    Args:
+        output (str): Lines of the form 'package:NAME' or 'package:NAME versionCode:N'
+
+    Returns:
+        dict: Package name to version code (0 when the listing has no versions)
+    """
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith("package:"):
+            continue
+        name, _, rest = line[8:].strip().partition(" ")
+        version = 0
+        if rest.startswith("versionCode:"):
+            try:
+                version = int(rest[12:].split()[0])
+            except (ValueError, IndexError):
+                pass
+        packages[name] = version
+    return packages
+
+
+def parse_resolved_activity(output: str) -> Optional[str]:
+    """
+    Extracts the component from `cmd package resolve-activity --brief` output.
+
+    Returns:
+        str or None: 'package/activity', or None if no activity was resolved
+    """
+    lines = [line.strip() for line in output.strip().splitlines()]
+    if len(lines) < 2 or "/" not in lines[-1] or "No activity found" in output:
+        return None
+    return lines[-1]
+
+
+class PackageIndex:
+    """
+    Installed packages with version codes and resolved launcher activities, keyed
+    by device id.
+
+    A listing is trusted for `ttl` seconds. After that the next listing is diffed
+    against it: packages that were removed or changed version lose their resolved
+    activity, every other activity is kept.
+    """
+
+    def __init__(self, ttl: Optional[float] = 60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # device_id -> [listed_at, {package: version}, {package: activity}]
+        self._entries: Dict[Optional[str], list] = {}
+
+    def get_packages(self, device_id: Optional[str]) -> Optional[Dict[str, int]]:
+        """Returns the device's packages and version codes, or None if never listed or stale."""
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None or entry[1] is None:
+                return None
+            if self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                return None
+            return dict(entry[1])
+
+    def update(self, device_id: Optional[str], packages: Dict[str, int]) -> Tuple[set, set, set]:
+        """
+        Stores a fresh listing.
+
+        Returns:
+            tuple: (added, removed, changed) package names against the previous listing
+        """
+        with self._lock:
+            entry = self._entries.setdefault(device_id, [0.0, None, {}])
+            previous = entry[1] or {}
+            added = packages.keys() - previous.keys()
+            removed = previous.keys() - packages.keys() if entry[1] is not None else set()
+            changed = {name for name in packages.keys() & previous.keys() if packages[name] != previous[name]}
+            activities = entry[2]
+            for name in list(activities):
+                if name not in packages or name in changed:
+                    del activities[name]
+            entry[0] = time.monotonic()
+            entry[1] = dict(packages)
+            return set(added), set(removed), changed
+
+    def get_activity(self, device_id: Optional[str], package: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(device_id)
+            return entry[2].get(package) if entry is not None else None
+
+    def put_activity(self, device_id: Optional[str], package: str, activity: str):
+        with self._lock:
+            self._entries.setdefault(device_id, [0.0, None, {}])[2][package] = activity
+
+    def invalidate(self, device_id: Optional[str] = None, package: Optional[str] = None):
+        """
+        Drops a package's activity on one device, one device's index, or every
+        index if device_id is None.
+        """
+        with self._lock:
+            if package is not None:
+                entry = self._entries.get(device_id)
+                if entry is not None:
+                    entry[2].pop(package, None)
+            elif device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)
@@ -1,13 +1,34 @@
+import concurrent.futures
+import itertools
+import re
+import shlex
 import shutil
-import subprocess
 from platform import system
+import threading
 import time
+import uuid
 from sys import stdout
 from PIL import Image
 from typing import List, Optional, Tuple
 
 from PIL.ImagePalette import raw
 
+from adb_protocol import AdbProtocolError
+from adb_transport import AdbError, AdbTimeoutError, SubprocessTransport
+from device_health import DeviceHealth
+from device_properties import PropertyCache, parse_getprop
+from foreground_state import FOREGROUND_COMMAND, SCREEN_FIELDS, parse_foreground_state
+from frames import SettleDetector, parse_framebuffer, parse_screencap_raw, png_size
+from package_index import LIST_PACKAGES_COMMAND, PackageIndex, parse_package_list, parse_resolved_activity
+from screen_stream import ScreenStream
+from screenshot_store import DEFAULT_MAX_BYTES, DEFAULT_ROOT, ScreenshotStore
+from shell_session import ShellSessionError, ShellTimeoutError
+from text_entry import (ADB_KEYBOARD_PACKAGE, CURRENT_IME_COMMAND, IME_MIN_LENGTH, choose_method, ime_script,
+                        ime_status, input_script, is_input_typeable)
+from touch_events import PROBE_COMMAND, parse_touchscreen, pinch_script, swipe_script, tap_script
+from tracing import default_tracer
+from ui_hierarchy import DUMP_COMMAND, DUMP_FILE_COMMAND, HierarchyCache, parse_hierarchy
+
 function_declarations = [
     {
         "name": "check_if_adb_installed",
@@ -55,7 +76,12 @@ function_declarations = [
         "description": "Lists all connected Android devices with their details and status. Returns a list of device objects or an error.",
         "parameters": {
             "type": "object",
-            "properties": {},
+            "properties": {
+                "incremental": {
+                    "type": "boolean",
+                    "description": "Only re-check devices that changed since the last listing. Defaults to false."
+                }
+            },
             "required": []
         }
     },
@@ -140,6 +166,14 @@ function_declarations = [
                 "y": {
                     "type": "integer",
                     "description": "Y coordinate"
+                },
+                "element": {
+                    "type": "string",
+                    "description": "Short description of the element, e.g. 'Gmail compose button'. The agent remembers where it is on this screen for tap_remembered."
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
                 }
             },
             "required": ["x", "y"]
@@ -170,11 +204,79 @@ function_declarations = [
                 "duration": {
                     "type": "integer",
                     "description": "Swipe duration in milliseconds. Defaults to 300."
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
                 }
             },
             "required": ["x1", "y1", "x2", "y2"]
         }
     },
+    {
+        "name": "long_press",
+        "description": "Touches and holds at the specified coordinates, e.g. to open a context menu or start a drag, and returns operation result details.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "x": {
+                    "type": "integer",
+                    "description": "X coordinate"
+                },
+                "y": {
+                    "type": "integer",
+                    "description": "Y coordinate"
+                },
+                "duration": {
+                    "type": "integer",
+                    "description": "Hold time in milliseconds. Defaults to 800."
+                },
+                "element": {
+                    "type": "string",
+                    "description": "Short description of the element, e.g. 'Gmail compose button'. The agent remembers where it is on this screen for tap_remembered."
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
+                }
+            },
+            "required": ["x", "y"]
+        }
+    },
+    {
+        "name": "pinch",
+        "description": "Pinches with two fingers around a point to zoom in (end_span larger than start_span) or out, and returns operation result details.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "x": {
+                    "type": "integer",
+                    "description": "X coordinate of the centre"
+                },
+                "y": {
+                    "type": "integer",
+                    "description": "Y coordinate of the centre"
+                },
+                "start_span": {
+                    "type": "integer",
+                    "description": "Distance between the fingers at the start, in pixels"
+                },
+                "end_span": {
+                    "type": "integer",
+                    "description": "Distance between the fingers at the end, in pixels"
+                },
+                "duration": {
+                    "type": "integer",
+                    "description": "Gesture duration in milliseconds. Defaults to 400."
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
+                }
+            },
+            "required": ["x", "y", "start_span", "end_span"]
+        }
+    },
     {
         "name": "input_text",
         "description": "Inputs text on the device with special character handling and returns operation result details.",
@@ -183,7 +285,11 @@ function_declarations = [
             "properties": {
                 "text": {
                     "type": "string",
-                    "description": "Text to input (spaces will be converted to %s and single quotes will be escaped)"
+                    "description": "Text to input, typed as is. Newlines and tabs press ENTER and TAB. Long or non-ASCII text is typed through the ADBKeyBoard IME when it is installed."
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
                 }
             },
             "required": ["text"]
@@ -198,6 +304,10 @@ function_declarations = [
                 "keycode": {
                     "type": "string",
                     "description": "Key code (e.g., 'HOME', 'BACK'). Will be prefixed with 'KEYCODE_' if not already present."
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
                 }
             },
             "required": ["keycode"]
@@ -212,6 +322,10 @@ function_declarations = [
                 "package_name": {
                     "type": "string",
                     "description": "Package name of the app to launch"
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
                 }
             },
             "required": ["package_name"]
@@ -222,13 +336,360 @@ function_declarations = [
         "description": "Gets a list of all installed packages on the device by parsing the output of 'pm list packages'.",
         "parameters": {
             "type": "object",
-            "properties": {},
+            "properties": {
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
+                }
+            },
             "required": []
         }
+    },
+    {
+        "name": "get_foreground_state",
+        "description": "Cheaply checks what the device is showing without a screenshot: the focused package, activity and window, whether the keyboard is shown, whether the screen is on, and whether an 'Application Not Responding' or crash dialog is showing.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
+                }
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "run_actions",
+        "description": "Runs several input actions (tap, swipe, input_text, press_key, sleep) in order on the device in a single call, e.g. to fill a form, and returns a result for each step. Use it when the whole sequence can be decided from the current screen.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "actions": {
+                    "type": "array",
+                    "description": "The actions in the order to run them",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "action": {
+                                "type": "string",
+                                "enum": ["tap", "swipe", "input_text", "press_key", "sleep"],
+                                "description": "The action to run"
+                            },
+                            "x": {"type": "integer", "description": "X coordinate (tap)"},
+                            "y": {"type": "integer", "description": "Y coordinate (tap)"},
+                            "x1": {"type": "integer", "description": "Starting X coordinate (swipe)"},
+                            "y1": {"type": "integer", "description": "Starting Y coordinate (swipe)"},
+                            "x2": {"type": "integer", "description": "Ending X coordinate (swipe)"},
+                            "y2": {"type": "integer", "description": "Ending Y coordinate (swipe)"},
+                            "duration": {"type": "integer", "description": "Swipe duration in milliseconds, or sleep duration in milliseconds (sleep)"},
+                            "text": {"type": "string", "description": "Text to input (input_text)"},
+                            "keycode": {"type": "string", "description": "Key code, e.g. 'ENTER' or 'TAB' (press_key)"},
+                            "delay_ms": {"type": "integer", "description": "Milliseconds to wait after this action before the next one"}
+                        },
+                        "required": ["action"]
+                    }
+                },
+                "stop_on_error": {
+                    "type": "boolean",
+                    "description": "Skip the remaining actions after one fails. Defaults to true."
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
+                }
+            },
+            "required": ["actions"]
+        }
+    },
+    {
+        "name": "find_element",
+        "description": "Finds UI elements on the current screen in the view hierarchy by text, resource-id, content description or class, without a screenshot. Returns each match's text, ids, bounds and center in device pixels.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "text": {
+                    "type": "string",
+                    "description": "Visible text of the element (case-insensitive, substring match if no exact match)"
+                },
+                "resource_id": {
+                    "type": "string",
+                    "description": "Resource id, either full (com.example:id/button) or just the id name (button)"
+                },
+                "content_desc": {
+                    "type": "string",
+                    "description": "Content description (accessibility label) of the element"
+                },
+                "class_name": {
+                    "type": "string",
+                    "description": "Widget class, e.g. 'android.widget.Button' or 'Button'"
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
+                }
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "tap_element",
+        "description": "Finds a UI element in the view hierarchy by text, resource-id, content description or class and taps its center. Prefer this over tap when the element has text or an id.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "text": {
+                    "type": "string",
+                    "description": "Visible text of the element (case-insensitive, substring match if no exact match)"
+                },
+                "resource_id": {
+                    "type": "string",
+                    "description": "Resource id, either full (com.example:id/button) or just the id name (button)"
+                },
+                "content_desc": {
+                    "type": "string",
+                    "description": "Content description (accessibility label) of the element"
+                },
+                "class_name": {
+                    "type": "string",
+                    "description": "Widget class, e.g. 'android.widget.Button' or 'Button'"
+                },
+                "match_index": {
+                    "type": "integer",
+                    "description": "Which match to tap when several elements match, in the order find_element returns them. Defaults to 0."
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
+                }
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "tap_remembered",
+        "description": "Taps an element by the description it was given in an earlier tap or long_press on a screen like the current one, without finding it in a screenshot. If the remembered position is not certain it is returned for you to check instead.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "element": {
+                    "type": "string",
+                    "description": "The element's description as given before"
+                },
+                "device_id": {
+                    "type": "string",
+                    "description": "The device identifier. If None, uses the default device."
+                }
+            },
+            "required": ["element"]
+        }
     }
 ]
  
+# Properties that identify emulators: (property, value, check_type)
+EMULATOR_INDICATORS = [
+    # Check the fingerprint (contains 'generic' in emulators)
+    ("ro.build.fingerprint", "generic", "contains"),
+    # Check hardware model
+    ("ro.hardware", "ranchu", "equals"),  # ranchu is the Android emulator hardware name
+    ("ro.hardware", "goldfish", "equals"),  # older emulator identifier
+    # Check product name
+    ("ro.product.model", "Android SDK built for", "contains"),
+    # Check manufacturer
+    ("ro.product.manufacturer", "Google", "equals"),
+    # Check if qemu.hw.mainkeys exists (only exists on emulators)
+    ("qemu.hw.mainkeys", "", "exists")
+]
+
+
+# Oldest streamed frame take_screenshot returns instead of capturing, in seconds
+STREAM_MAX_AGE = 0.5
+
+# Words in a run_command command that mean installed packages may have changed
+PACKAGE_CHANGING_COMMANDS = {"install", "install-multiple", "uninstall"}
+
+# Seconds each kind of adb operation may take before it is abandoned; see PyAdb(timeouts=...)
+DEFAULT_TIMEOUTS = {
+    "command": 120.0,    # run_command, e.g. install
+    "shell": 30.0,       # shell commands, persistent or not
+    "screenshot": 15.0,  # screencap and framebuffer captures
+    "ui_dump": 30.0,     # uiautomator dump
+    "probe": 5.0,        # health probe of a device whose circuit is open
+}
+
+
+def has_emulator_properties(properties):
+    """
+    Checks a device's property map against EMULATOR_INDICATORS.
+
+    Args:
+        properties (dict): Property name to value, as returned by get_device_properties
+
+    Returns:
+        bool: True if any indicator matches
+    """
+    for prop, value, check_type in EMULATOR_INDICATORS:
+        output = properties.get(prop, "").strip()
+
+        if check_type == "contains" and value in output:
+            return True
+        elif check_type == "equals" and output == value:
+            return True
+        elif check_type == "exists" and output:
+            return True
+
+    # If none of the indicators match, it's likely a physical device
+    return False
+
+
+def action_command(action: dict) -> str:
+    """
+    Builds the shell command for one run_actions step.
+
+    Raises:
+        ValueError: If the action is unknown or misses an argument
+    """
+    name = action.get("action") if isinstance(action, dict) else None
+    try:
+        if name == "tap":
+            return f"input tap {int(action['x'])} {int(action['y'])}"
+        if name == "swipe":
+            duration = int(action.get("duration", 300))
+            return (f"input swipe {int(action['x1'])} {int(action['y1'])} "
+                    f"{int(action['x2'])} {int(action['y2'])} {duration}")
+        if name == "input_text":
+            return input_script(str(action["text"]))
+        if name == "press_key":
+            keycode = str(action["keycode"])
+            if not keycode.startswith("KEYCODE_"):
+                keycode = f"KEYCODE_{keycode}"
+            return f"input keyevent {keycode}"
+        if name == "sleep":
+            return f"sleep {int(action.get('duration', 0)) / 1000:g}"
+    except KeyError as e:
+        raise ValueError(f"{name} needs {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid arguments for {name}: {action}")
+    raise ValueError(f"unknown action {name}")
+
+
+def build_action_script(actions: List[dict], stop_on_error: bool = True):
+    """
+    Chains run_actions steps into one shell script. Each step's stderr is folded
+    into its stdout and followed by a marker line carrying the step's exit code.
+    The marker is printed after a newline of its own, so it starts a line even when
+    the step's output does not end with one.
+
+    Returns:
+        tuple: (script, commands, marker)
+
+    Raises:
+        ValueError: If an action is unknown or misses an argument
+    """
+    commands = [action_command(action) for action in actions]
+    marker = f"__STEP_{uuid.uuid4().hex[:8]}"
+    separator = " && " if stop_on_error else "; "
+    pieces = []
+    for index, (action, command) in enumerate(zip(actions, commands)):
+        piece = f"{command} 2>&1{separator}printf '\\n%s\\n' \"{marker}:{index}:$?\""
+        delay = action.get("delay_ms")
+        if delay and index < len(commands) - 1:
+            piece += f"{separator}sleep {int(delay) / 1000:g}"
+        pieces.append(piece)
+    script = separator.join(pieces) + f"; printf '\\n%s\\n' \"{marker}:end:$?\""
+    return script, commands, marker
+
+
+def parse_action_output(actions, commands, marker, stdout, returncode, script) -> dict:
+    """Splits the output of a build_action_script script into per-step results."""
+    outputs, codes, end_code = {}, {}, returncode
+    trailing, start = "", 0
+    for match in re.finditer(rf"\n{re.escape(marker)}:(\d+|end):(-?\d+)\n", stdout):
+        # The match takes the newline the script printed before the marker; the
+        # step's own final newline is dropped too
+        output = stdout[start:match.start()].removesuffix("\n")
+        step, code = match.group(1), int(match.group(2))
+        if step == "end":
+            end_code, trailing = code, output
+        else:
+            outputs[int(step)], codes[int(step)] = output, code
+        start = match.end()
+
+    steps, failed = [], False
+    for index, (action, command) in enumerate(zip(actions, commands)):
+        step = {"action": action.get("action"), "command": command}
+        if index in codes:
+            step.update(success=codes[index] == 0, return_code=codes[index], output=outputs[index])
+        elif not failed:
+            # With && the failing step prints no marker; its exit code is the script's
+            step.update(success=False, return_code=end_code or 1, output=trailing)
+            failed = True
+        else:
+            step.update(success=False, skipped=True)
+        steps.append(step)
+    return {
+        "success": all(step["success"] for step in steps),
+        "steps": steps,
+        "command": script
+    }
+
+
 class PyAdb:
+    def __init__(self, transport=None, persistent_shell=True, property_ttl=300.0,
+                 discovery_workers=8, device_timeout=10.0, tracer=None, package_ttl=60.0, direct_touch=True,
+                 screenshot_dir=DEFAULT_ROOT, screenshot_retention=DEFAULT_MAX_BYTES, timeouts=None,
+                 breaker_threshold=3, probe_interval=5.0):
+        """
+        Args:
+            transport (optional): Executes adb commands. Defaults to a SubprocessTransport;
+                pass an adb_transport.SocketTransport to talk to the adb server directly.
+            persistent_shell (bool): Send device shell commands through one long-lived
+                shell session per device instead of a new `adb shell` per command.
+            property_ttl (float, optional): Seconds a device's getprop snapshot stays cached.
+                None keeps it until the device reconnects.
+            discovery_workers (int): Maximum number of devices probed concurrently when listing.
+            device_timeout (float): Seconds to wait for a device's details when listing before
+                reporting it as an error entry.
+            tracer (tracing.Tracer, optional): Receives spans for adb commands, shell commands,
+                screenshots and settling. Defaults to the metrics-only tracing.default_tracer.
+            package_ttl (float, optional): Seconds a device's package listing is reused before it
+                is listed again and diffed. Resolved launch activities are kept until their package
+                changes version or is removed. None keeps the listing until the device reconnects.
+            direct_touch (bool): Write gestures to the touchscreen's input node with `sendevent`
+                instead of starting an `input` process per gesture, where the node is writable.
+            screenshot_dir (str, optional): Root of the screenshot_store.ScreenshotStore that
+                screenshots are saved to. None does not save them.
+            screenshot_retention (int, optional): Bytes of screenshots kept before the least
+                recently used are deleted. None keeps them all.
+            timeouts (dict, optional): Deadlines in seconds overriding DEFAULT_TIMEOUTS, by
+                operation kind. On expiry the adb process or connection is torn down and the
+                call returns its usual error shape with a 'timed out after ...' message.
+            breaker_threshold (int): Consecutive timeouts after which a device's calls fail
+                at once, until a health probe every probe_interval seconds gets an answer.
+        """
+        self.transport = transport if transport is not None else SubprocessTransport()
+        self.persistent_shell = persistent_shell
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self.properties = PropertyCache(property_ttl)
+        self._device_states = {}
+        self.discovery_workers = discovery_workers
+        self.device_timeout = device_timeout
+        self._discovery_pool = None
+        self._last_device_entries = {}
+        self.ui_hierarchies = HierarchyCache()
+        self._streams = {}
+        self.tracer = tracer if tracer is not None else default_tracer
+        self.packages = PackageIndex(package_ttl)
+        self.direct_touch = direct_touch
+        self._touchscreens = {}
+        self._screen_sizes = {}
+        self._tracking_ids = itertools.count(1)
+        self.screenshots = (ScreenshotStore(screenshot_dir, screenshot_retention, self.tracer)
+                            if screenshot_dir is not None else None)
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.health = DeviceHealth(self._health_probe, breaker_threshold, probe_interval)
+
     def check_if_adb_installed(self):
         """
         Checks if ADB is installed and available in the system path.
@@ -238,8 +699,9 @@ class PyAdb:
                 - path_to_adb (str or None): Path to the ADB executable if found
                 - error_message (str or None): Error message if ADB is not found
         """
-        if shutil.which('adb') is not None:
-            return shutil.which('adb'), None
+        path = shutil.which('adb')
+        if path is not None:
+            return path, None
         else:
             return None, "Error can't locate adb"
 
@@ -256,55 +718,165 @@ class PyAdb:
         """
         return f"{adb} {command}"
 
-    def run_command(self, command):
+    def run_command(self, command, timeout=None):
         """
         Executes an ADB command and returns the result.
 
         Args:
             command (str): The ADB command to execute (without the ADB path)
+            timeout (float, optional): Deadline in seconds. Defaults to timeouts['command'].
 
         Returns:
             tuple: (result, error)
                 - result (subprocess.CompletedProcess or None): Result of command execution
                 - error (str or None): Error message if ADB is not installed
         """
-        path, error = self.check_if_adb_installed()
+        if PACKAGE_CHANGING_COMMANDS.intersection(command.split()):
+            # Some device's packages changed; it is cheaper to re-list than to find out which
+            self.packages.invalidate()
+        args = command.split()
+        device_id = args[1] if len(args) > 1 and args[0] == "-s" else None
+        timeout = self.timeouts["command"] if timeout is None else timeout
+        with self.tracer.span("adb.command", command=command) as span:
+            try:
+                result = self._device_call(device_id, self.transport.run, command, timeout=timeout)
+            except AdbError as e:
+                span.set(error=str(e), timed_out=isinstance(e, AdbTimeoutError))
+                return None, str(e)
+            span.set(return_code=result.returncode, bytes=len(result.stdout or ""))
+        return result, None
 
-        if error is not None:
-            return None, error
+    def get_shell_session(self, device_id=None):
+        """
+        Returns the persistent shell session for a device, creating it on first use.
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            shell_session.ShellSession: The device's session. It restarts itself if it dies.
+        """
+        with self._sessions_lock:
+            session = self._sessions.get(device_id)
+            if session is None:
+                session = self.transport.open_shell(device_id, timeout=self.timeouts["shell"])
+                self._sessions[device_id] = session
+            return session
 
-        task = self.make_adb_command(path, command)
-        print(task)
-        result = subprocess.run(task, shell=True, capture_output=True, text=True)
+    def run_shell(self, command, device_id=None):
+        """
+        Runs a shell command on the device through its persistent shell session.
+
+        Args:
+            command (str): The shell command to execute on the device
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            tuple: (result, error)
+                - result (subprocess.CompletedProcess or None): stdout, stderr and exit code of the command
+                - error (str or None): Error message if the command could not be run
+        """
+        if not self.persistent_shell:
+            device_param = f"-s {device_id} " if device_id else ""
+            # The transports split the command line, so keep the device command one argument
+            return self.run_command(f"{device_param}shell {shlex.quote(command)}", self.timeouts["shell"])
+
+        with self.tracer.span("adb.shell", device_id=device_id, command=command) as span:
+            try:
+                result = self._device_call(device_id, self._run_in_session, command, device_id)
+            except (AdbError, AdbProtocolError, ShellSessionError, OSError) as e:
+                span.set(error=str(e), timed_out=isinstance(e, AdbTimeoutError))
+                return None, str(e)
+            span.set(return_code=result.returncode, bytes=len(result.stdout))
         return result, None
 
-    def list_android_devices(self):
+    def _run_in_session(self, command, device_id):
+        try:
+            return self.get_shell_session(device_id).run(command, timeout=self.timeouts["shell"])
+        except ShellTimeoutError:
+            # The session has killed its shell; the next command starts a new one
+            raise AdbTimeoutError(command, self.timeouts["shell"]) from None
+
+    def _device_call(self, device_id, operation, *args, **kwargs):
+        """
+        Runs one transport operation under the device's circuit breaker.
+
+        Raises:
+            AdbError: Whatever the operation raises, or at once if the device's circuit is open
+        """
+        unavailable = self.health.check(device_id)
+        if unavailable is not None:
+            raise AdbError(unavailable)
+        try:
+            result = operation(*args, **kwargs)
+        except AdbTimeoutError:
+            self.health.record_timeout(device_id)
+            raise
+        self.health.record_success(device_id)
+        return result
+
+    def _health_probe(self, device_id):
+        """Whether the device answers a trivial shell command, bypassing the breaker."""
+        device_param = f"-s {device_id} " if device_id else ""
+        try:
+            result = self.transport.run(f"{device_param}shell echo ok", timeout=self.timeouts["probe"])
+        except AdbError:
+            return False
+        return result.returncode == 0 and "ok" in result.stdout
+
+    def close(self):
+        """Closes all persistent shell sessions."""
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+        self.health.close()
+        for stream in list(self._streams.values()):
+            stream.stop()
+        self._streams.clear()
+        if self._discovery_pool is not None:
+            self._discovery_pool.shutdown(wait=False)
+            self._discovery_pool = None
+        if self.screenshots is not None:
+            # Finish the screenshots still being written
+            self.screenshots.close()
+
+    def list_android_devices(self, incremental=False):
         """
         Lists all connected Android devices.
 
+        Args:
+            incremental (bool): Only probe devices that are new or changed state since the
+                last listing and reuse the previous entries for the rest.
+
         Returns:
             tuple: (devices_list, error)
                 - devices_list (list or None): List of connected devices with their details
                 - error (str or None): Error message if ADB is not installed or fails
         """
-        path, error = self.check_if_adb_installed()
-        if error is not None:
-            return None, error
+        try:
+            result = self.transport.run("devices", timeout=self.timeouts["command"])
+        except AdbError as e:
+            return None, str(e)
+        if result.returncode != 0:
+            return None, result.stderr
         else:
-            command = self.make_adb_command(path, "devices")
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
-            if result.returncode != 0:
-                return None, result.stderr
-            else:
-                return self.parse_device_list(path, result.stdout)
+            return self.parse_device_list(None, result.stdout, incremental)
 
-    def parse_device_list(self, adb_path, raw_device_list):
+    def parse_device_list(self, adb_path, raw_device_list, incremental=False):
         """
         Parses the raw output from 'adb devices' command and extracts device information.
 
+        Devices are probed concurrently on a bounded worker pool. A device that is not
+        ready (e.g. 'unauthorized', 'offline') or does not answer within device_timeout
+        comes back as an entry whose detail carries the error, without holding up the rest.
+
         Args:
-            adb_path (str): Path to the ADB executable
+            adb_path (str): Path to the ADB executable (unused, the transport resolves it)
             raw_device_list (str): Raw output from 'adb devices' command
+            incremental (bool): Reuse entries from the last listing for devices whose status
+                has not changed and that were probed successfully
 
         Returns:
             list: List of dictionaries containing device information with keys:
@@ -313,7 +885,7 @@ class PyAdb:
                 - is_emulator: Boolean indicating if the device is an emulator
                 - detail: Tuple containing (device_details, error)
         """
-        device_map = []
+        devices = []
 
         # Split by lines and skip the first line (header line "List of devices attached")
         device_lines = raw_device_list.strip().split('\n')
@@ -324,26 +896,113 @@ class PyAdb:
             if device_line.strip():  # Skip empty lines
                 parts = device_line.strip().split('\t')
                 if len(parts) >= 2:
-                    device_id = parts[0]
-                    status = parts[1]
-                    detail = self.get_device_details(device_id, adb_path)
-                    # Create a device entry with basic info
-                    device_map.append({
-                        'status': status,
-                        'id': device_id,
-                        'is_emulator': self.is_emulator(device_id, adb_path),
-                        'detail': detail
-                    })
+                    devices.append((parts[0], parts[1]))
 
-        return device_map
+        states = dict(devices)
+        entries = {}
+        pending = {}
+        for device_id, status in devices:
+            # A device that is new or changed state may have rebooted or been swapped
+            changed = self._device_states.get(device_id) != status
+            if changed:
+                self.properties.invalidate(device_id)
+                self.packages.invalidate(device_id)
+                self._touchscreens.pop(device_id, None)
+                self.health.reset(device_id)
 
-    def is_emulator(self, device_id, adb_path):
+            previous = self._last_device_entries.get(device_id)
+            if incremental and not changed and previous is not None and previous['detail'][1] is None:
+                entries[device_id] = previous
+            elif status != 'device':
+                entries[device_id] = self._device_error_entry(device_id, status, f"device {status}")
+            else:
+                pending[self._get_discovery_pool().submit(self._probe_device, device_id, status)] = device_id
+
+        done, not_done = concurrent.futures.wait(pending, timeout=self.device_timeout)
+        for future in done:
+            device_id = pending[future]
+            try:
+                entries[device_id] = future.result()
+            except Exception as e:
+                entries[device_id] = self._device_error_entry(device_id, states[device_id], str(e))
+        for future in not_done:
+            device_id = pending[future]
+            future.cancel()
+            entries[device_id] = self._device_error_entry(
+                device_id, states[device_id], f"timed out after {self.device_timeout}s")
+
+        for device_id in self._device_states.keys() - states.keys():
+            self.properties.invalidate(device_id)
+            self.packages.invalidate(device_id)
+            self._touchscreens.pop(device_id, None)
+            self.health.reset(device_id)
+        self._device_states = states
+        self._last_device_entries = entries
+        return [entries[device_id] for device_id, _ in devices]
+
+    def _get_discovery_pool(self):
+        if self._discovery_pool is None:
+            self._discovery_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.discovery_workers, thread_name_prefix="pyadb-discovery")
+        return self._discovery_pool
+
+    def _probe_device(self, device_id, status):
+        detail = self.get_device_details(device_id)
+        return {
+            'status': status,
+            'id': device_id,
+            'is_emulator': self.is_emulator(device_id),
+            'detail': detail
+        }
+
+    def _device_error_entry(self, device_id, status, error):
+        return {
+            'status': status,
+            'id': device_id,
+            'is_emulator': device_id.startswith('emulator-') or device_id.startswith('localhost:'),
+            'detail': (None, error)
+        }
+
+    def get_device_properties(self, device_id, refresh=False):
+        """
+        Gets all system properties of a device from a single `getprop` dump.
+
+        The snapshot is cached per device until it expires, the device reconnects,
+        or refresh is requested.
+
+        Args:
+            device_id (str): The device identifier
+            refresh (bool): Ignore the cached snapshot and query the device again
+
+        Returns:
+            tuple: (properties, error)
+                - properties (dict or None): Property name to value
+                - error (str or None): Error message if the properties could not be read
+        """
+        if not refresh:
+            properties = self.properties.get(device_id)
+            if properties is not None:
+                return properties, None
+
+        try:
+            result = self._device_call(device_id, self.transport.run, f"-s {device_id} shell getprop",
+                                       timeout=self.timeouts["shell"])
+        except AdbError as e:
+            return None, str(e)
+        if result.returncode != 0:
+            return None, result.stderr
+
+        properties = parse_getprop(result.stdout)
+        self.properties.put(device_id, properties)
+        return properties, None
+
+    def is_emulator(self, device_id, adb_path=None):
         """
         Determines if a device is an emulator or a physical device.
 
         Args:
             device_id (str): The device identifier
-            adb_path (str): Path to the ADB executable
+            adb_path (str, optional): Path to the ADB executable (unused, the transport resolves it)
 
         Returns:
             bool: True if the device is an emulator, False if it's a physical device
@@ -353,81 +1012,45 @@ class PyAdb:
             return True
 
         # Method 2: Check specific properties that identify emulators
-        indicators = [
-            # Check the fingerprint (contains 'generic' in emulators)
-            ("ro.build.fingerprint", "generic", "contains"),
-            # Check hardware model
-            ("ro.hardware", "ranchu", "equals"),  # ranchu is the Android emulator hardware name
-            ("ro.hardware", "goldfish", "equals"),  # older emulator identifier
-            # Check product name
-            ("ro.product.model", "Android SDK built for", "contains"),
-            # Check manufacturer
-            ("ro.product.manufacturer", "Google", "equals"),
-            # Check if qemu.hw.mainkeys exists (only exists on emulators)
-            ("qemu.hw.mainkeys", "", "exists")
-        ]
-
-        for prop, value, check_type in indicators:
-            cmd = self.make_adb_command(adb_path, f"-s {device_id} shell getprop {prop}")
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-            if result.returncode == 0:
-                output = result.stdout.strip()
-
-                if check_type == "contains" and value in output:
-                    return True
-                elif check_type == "equals" and output == value:
-                    return True
-                elif check_type == "exists" and output:
-                    return True
-
-        # If none of the indicators match, it's likely a physical device
-        return False
-
-    def get_device_details(self, device_id, adb_path):
+        properties, error = self.get_device_properties(device_id)
+        if error is not None:
+            return False
+
+        return has_emulator_properties(properties)
+
+    def get_device_details(self, device_id, adb_path=None):
         """
         Gets detailed information about a specific device.
 
         Args:
             device_id (str): The device identifier
-            adb_path (str): Path to the ADB executable
+            adb_path (str, optional): Path to the ADB executable (unused, the transport resolves it)
 
         Returns:
             tuple: (details, error)
                 - details (dict or None): Dictionary containing device details (model, android_version, serial) if successful
                 - error (str or None): Error message if any property retrieval fails
         """
-        details = {}
-
-        # Get device model
-        cmd = self.make_adb_command(adb_path, f"-s {device_id} shell getprop ro.product.model")
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            details['model'] = result.stdout.strip()
-        else:
-            return None, result.stderr
-
-        # Get Android version
-        cmd = self.make_adb_command(adb_path, f"-s {device_id} shell getprop ro.build.version.release")
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            details['android_version'] = result.stdout.strip()
-        else:
-            return None, result.stderr
-
-        # Get device serial number
-        cmd = self.make_adb_command(adb_path, f"-s {device_id} shell getprop ro.serialno")
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            details['serial'] = result.stdout.strip()
-        else:
-            return None, result.stderr
+        properties, error = self.get_device_properties(device_id)
+        if error is not None:
+            return None, error
 
+        details = {
+            'model': properties.get('ro.product.model', ''),
+            'android_version': properties.get('ro.build.version.release', ''),
+            'serial': properties.get('ro.serialno', ''),
+        }
         return details, None
 
     def take_screenshot(self, device_id=None):
         """
-        Takes a screenshot of the connected Android device, saves it as a PNG file with timestamp, and returns the raw PNG data.
+        Takes a screenshot of the connected Android device, saves it to the screenshot store, and returns the raw PNG data.
+
+        The store writes on a background thread (see save_screenshot), so the data is
+        returned without waiting for the disk.
+
+        While a screen stream runs for the device (start_screen_stream), the latest
+        streamed frame is encoded on the host instead of capturing a new one.
 
         Args:
             device_id (str, optional): The device identifier. If None, uses the default device.
@@ -437,16 +1060,32 @@ class PyAdb:
                 - raw_data (bytes or None): Raw PNG data of the screenshot if successful
                 - error (str or None): Error message if the operation fails
         """
-        path, error = self.check_if_adb_installed()
-        if error is not None:
-            return None, error
-
         device_param = f"-s {device_id} " if device_id else ""
-        filename = f"{time.time()}_screen.png"
 
-        # Capture screenshot data using ADB screencap command with -p flag (PNG format)
-        command = self.make_adb_command(path, f"{device_param}shell screencap -p")
-        screen_cap_result = subprocess.run(command, shell=True, capture_output=True)
+        stream = self._streams.get(device_id)
+        frame = stream.latest(max_age=STREAM_MAX_AGE) if stream is not None and stream.running else None
+        if frame is not None:
+            try:
+                with self.tracer.span("screenshot.encode", device_id=device_id) as span:
+                    raw_data = frame.to_png()
+                    span.set(bytes=len(raw_data))
+                self._screen_sizes[device_id] = (frame.width, frame.height)
+                self.save_screenshot(raw_data, device_id)
+                return raw_data, None
+            except Exception as e:
+                return None, f"Error processing screenshot data: {str(e)}"
+
+        # Capture screenshot data using ADB screencap command with -p flag (PNG format).
+        # exec-out keeps the binary stream free of pty newline translation.
+        with self.tracer.span("screenshot.capture", device_id=device_id) as span:
+            try:
+                screen_cap_result = self._device_call(device_id, self.transport.run,
+                                                      f"{device_param}exec-out screencap -p", text=False,
+                                                      timeout=self.timeouts["screenshot"])
+            except AdbError as e:
+                span.set(error=str(e), timed_out=isinstance(e, AdbTimeoutError))
+                return None, str(e)
+            span.set(return_code=screen_cap_result.returncode, bytes=len(screen_cap_result.stdout))
         
         if screen_cap_result.returncode != 0:
             return None, "Failed to capture screenshot"
@@ -454,22 +1093,366 @@ class PyAdb:
         try:
             # Get the raw data
             raw_data = screen_cap_result.stdout
+            self._screen_sizes[device_id] = png_size(raw_data)
             
             # Save it to a file (optional)
-            with open(filename, 'wb') as f:
-                f.write(raw_data)
+            self.save_screenshot(raw_data, device_id)
             
             return raw_data, None
         except Exception as e:
             return None, f"Error processing screenshot data: {str(e)}"
 
-    def tap(self, x: int, y: int) -> dict:
+    def save_screenshot(self, raw_data, device_id=None):
+        """
+        Queues PNG data for the screenshot store. Identical frames are stored once,
+        and the write happens on the store's background thread; close() waits for it.
+
+        Returns:
+            str or None: The frame's digest in self.screenshots, or None if screenshots are not saved
+        """
+        if self.screenshots is None:
+            return None
+        return self.screenshots.put(raw_data, device_id)
+
+    def capture_raw_frame(self, device_id=None, method="screencap"):
+        """
+        Captures the screen as raw pixels, skipping the device-side PNG encoding of take_screenshot.
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the default device.
+            method (str): 'screencap' runs `screencap` without -p; 'framebuffer' reads the adb
+                `framebuffer:` service and needs a transport that talks to the adb server.
+
+        Returns:
+            tuple: (frame, error)
+                - frame (frames.RawFrame or None): Width, height, pixel layout and a zero-copy
+                  view of the pixels. Encode on the host with frame.to_png() if needed.
+                - error (str or None): Error message if the operation fails
+        """
+        try:
+            if method == "framebuffer":
+                read_framebuffer = getattr(self.transport, "framebuffer", None)
+                if read_framebuffer is None:
+                    return None, "framebuffer capture requires a transport connected to the adb server"
+                frame = parse_framebuffer(self._device_call(device_id, read_framebuffer, device_id,
+                                                            timeout=self.timeouts["screenshot"]))
+            else:
+                device_param = f"-s {device_id} " if device_id else ""
+                result = self._device_call(device_id, self.transport.run, f"{device_param}exec-out screencap",
+                                           text=False, timeout=self.timeouts["screenshot"])
+                if result.returncode != 0:
+                    return None, "Failed to capture screenshot"
+                frame = parse_screencap_raw(result.stdout)
+            self._screen_sizes[device_id] = (frame.width, frame.height)
+            return frame, None
+        except (AdbError, ValueError) as e:
+            return None, f"Error capturing raw frame: {e}"
+
+    def start_screen_stream(self, device_id=None, source="raw", buffer_size=8, interval=0.0):
+        """
+        Starts capturing the device's screen continuously into a ring buffer. While it
+        runs, take_screenshot returns the latest streamed frame instead of capturing.
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the default device.
+            source (str): 'raw' for back-to-back raw captures, 'screenrecord' for a decoded
+                h264 screenrecord pipe (needs PyAV)
+            buffer_size (int): Number of recent frames kept
+            interval (float): Seconds between raw captures
+
+        Returns:
+            tuple: (stream, error)
+                - stream (screen_stream.ScreenStream or None): The running stream
+                - error (str or None): Error message if the stream could not be started
+        """
+        self.stop_screen_stream(device_id)
+        try:
+            stream = ScreenStream(self, device_id, source, buffer_size, interval).start()
+        except (RuntimeError, ValueError) as e:
+            return None, str(e)
+        self._streams[device_id] = stream
+        return stream, None
+
+    def stop_screen_stream(self, device_id=None):
+        """Stops the device's screen stream, if one is running."""
+        stream = self._streams.pop(device_id, None)
+        if stream is not None:
+            stream.stop()
+
+    def get_frame_after(self, timestamp, timeout=5.0, device_id=None):
+        """
+        Returns the first streamed frame captured after `timestamp`, e.g. the first frame
+        after an action was sent. Needs a running screen stream.
+
+        Args:
+            timestamp (float): A time.monotonic() value
+            timeout (float): Seconds to wait for such a frame
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            tuple: (frame, error)
+                - frame (frames.RawFrame or None): The frame
+                - error (str or None): Error message if there is no stream or no frame arrived in time
+        """
+        stream = self._streams.get(device_id)
+        if stream is None:
+            return None, "no screen stream running for this device"
+        frame = stream.first_after(timestamp, timeout)
+        if frame is None:
+            return None, stream.error or f"no frame after {timestamp} within {timeout}s"
+        return frame, None
+
+    def wait_for_ui_idle(self, device_id=None, threshold=0.005, timeout=5.0, interval=0.0,
+                         stable_frames=1, method="pixel", hash_threshold=2):
+        """
+        Captures raw frames back to back until consecutive frames match, instead of
+        sleeping a fixed time after an action.
+
+        The frames are full resolution (about 10 MB at 1080x2400). Neither `screencap`
+        nor the `framebuffer:` service can scale on the device, and every device-side
+        way to sample rows costs a process per row. Only a 32x64 luma sample (9x8 for
+        'phash') is read from each frame, through a zero-copy view, so each frame costs
+        its transfer but no decoding. The framebuffer service is preferred because it
+        also skips the shell.
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the default device.
+            threshold (float): Maximum mean luma difference (0.0-1.0) for two frames to match ('pixel')
+            timeout (float): Maximum seconds to wait for the screen to settle
+            interval (float): Seconds to wait between captures
+            stable_frames (int): Number of consecutive matching frame pairs required
+            method (str): 'pixel' compares sampled luma, 'phash' compares perceptual hashes
+            hash_threshold (int): Maximum differing hash bits for two frames to match ('phash')
+
+        Returns:
+            dict: Result of the wait including:
+                - settled (bool): Whether the screen settled before the timeout
+                - elapsed (float): Seconds until the screen settled or the wait gave up
+                - frames (int): Number of frames captured
+                - difference (float or int or None): Difference between the last two frames
+                - error (str): Present if frames could not be captured
+        """
+        with self.tracer.span("ui.settle", device_id=device_id) as span:
+            result = self._wait_for_ui_idle(device_id, threshold, timeout, interval, stable_frames, method,
+                                            hash_threshold)
+            span.set(settled=result["settled"], frames=result["frames"])
+            if "error" in result:
+                span.set(error=result["error"])
+        return result
+
+    def _wait_for_ui_idle(self, device_id, threshold, timeout, interval, stable_frames, method, hash_threshold):
+        detector = SettleDetector(threshold, stable_frames, method, hash_threshold)
+        capture_method = "framebuffer" if hasattr(self.transport, "framebuffer") else "screencap"
+        start = time.monotonic()
+        frames = 0
+        while True:
+            frame, error = self.capture_raw_frame(device_id, method=capture_method)
+            if error is not None and capture_method == "framebuffer":
+                capture_method = "screencap"
+                frame, error = self.capture_raw_frame(device_id, method=capture_method)
+            elapsed = time.monotonic() - start
+            if error is not None:
+                return {"settled": False, "elapsed": elapsed, "frames": frames,
+                        "difference": detector.last_difference, "error": error}
+            frames += 1
+            if detector.add(frame):
+                return {"settled": True, "elapsed": elapsed, "frames": frames,
+                        "difference": detector.last_difference}
+            if elapsed >= timeout:
+                return {"settled": False, "elapsed": elapsed, "frames": frames,
+                        "difference": detector.last_difference}
+            if interval:
+                time.sleep(interval)
+
+    def _screen_signature(self, device_id=None):
+        """
+        What a cached hierarchy is checked against: the foreground state's screen
+        fields, one small dumpsys query instead of a frame capture. Actions sent
+        through PyAdb drop the cached hierarchy themselves.
+
+        Returns:
+            tuple or None: None if the state could not be read
+        """
+        state = self.get_foreground_state(device_id)
+        return tuple(state[field] for field in SCREEN_FIELDS) if state["success"] else None
+
+    def get_ui_hierarchy(self, device_id=None, refresh=False):
+        """
+        Dumps the view hierarchy with uiautomator. The parsed hierarchy is cached and
+        reused until the focused window, keyboard or dialog changes, an action is sent
+        to the device, or it is ui_hierarchies.max_age seconds old.
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the default device.
+            refresh (bool): Dump again even if the cached hierarchy is still current
+
+        Returns:
+            tuple: (hierarchy, error)
+                - hierarchy (ui_hierarchy.UiHierarchy or None): Elements indexed by text,
+                  resource-id, content-desc and class
+                - error (str or None): Error message if the operation fails
+        """
+        signature = None
+        if not refresh and self.ui_hierarchies.has(device_id):
+            signature = self._screen_signature(device_id)
+            hierarchy = self.ui_hierarchies.get(device_id, signature)
+            if hierarchy is not None:
+                return hierarchy, None
+
+        device_param = f"-s {device_id} " if device_id else ""
+        try:
+            result = self._device_call(device_id, self.transport.run, f"{device_param}exec-out {DUMP_COMMAND}",
+                                       timeout=self.timeouts["ui_dump"])
+        except AdbError as e:
+            return None, str(e)
+        output = result.stdout if result.returncode == 0 else ""
+        if "</hierarchy>" not in output:
+            result, error = self.run_shell(DUMP_FILE_COMMAND, device_id)
+            if error:
+                return None, error
+            output = result.stdout
+        try:
+            hierarchy = parse_hierarchy(output)
+        except ValueError as e:
+            return None, f"Error dumping UI hierarchy: {e}"
+        self.ui_hierarchies.put(device_id, signature, hierarchy)
+        return hierarchy, None
+
+    def get_foreground_state(self, device_id: str = None) -> dict:
+        """
+        Reads the focused app and window, keyboard, screen power and error dialogs
+        with one batched dumpsys query; much cheaper than a screenshot.
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            dict: The state including:
+                - success (bool): Whether the state could be read
+                - package, activity, window (str or None): The focused app and window
+                - keyboard_shown (bool): Whether the soft keyboard is up
+                - screen_on (bool): Whether the device is awake with the display on
+                - dialog (str or None): 'anr' or 'crash' if a system error dialog has focus
+                - dialog_package (str or None): The app the dialog is about
+                - summary (str): One line describing the state
+                - error (str): Present if the state could not be read
+        """
+        result, error = self.run_shell(FOREGROUND_COMMAND, device_id)
+        if error:
+            return {"success": False, "error": error}
+        try:
+            state = parse_foreground_state(result.stdout)
+        except ValueError as e:
+            return {"success": False, "error": f"Error reading foreground state: {e}"}
+        return {"success": True, **state.to_dict(), "summary": state.describe()}
+
+    def find_element(self, text: str = None, resource_id: str = None, content_desc: str = None,
+                     class_name: str = None, device_id: str = None) -> dict:
+        """
+        Finds elements on the current screen in the view hierarchy.
+
+        Args:
+            text (str, optional): Visible text (case-insensitive, substring match if no exact match)
+            resource_id (str, optional): Full resource id or just the part after ':id/'
+            content_desc (str, optional): Content description
+            class_name (str, optional): Full or simple widget class name
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            dict: Result of the lookup including:
+                - success (bool): Whether any element matched
+                - elements (list): Up to 10 matches with text, ids, bounds and center in device pixels
+                - count (int): Total number of matches
+                - error (str): Present if the hierarchy could not be dumped
+        """
+        if not any((text, resource_id, content_desc, class_name)):
+            return {"success": False, "error": "give at least one of text, resource_id, content_desc or class_name"}
+        hierarchy, error = self.get_ui_hierarchy(device_id)
+        if error:
+            return {"success": False, "error": error}
+        matches = hierarchy.find(text, resource_id, content_desc, class_name)
+        return {
+            "success": bool(matches),
+            "elements": [element.to_dict() for element in matches[:10]],
+            "count": len(matches)
+        }
+
+    def tap_element(self, text: str = None, resource_id: str = None, content_desc: str = None,
+                    class_name: str = None, match_index: int = 0, device_id: str = None) -> dict:
+        """
+        Finds an element in the view hierarchy and taps its center.
+
+        Args:
+            text (str, optional): Visible text (case-insensitive, substring match if no exact match)
+            resource_id (str, optional): Full resource id or just the part after ':id/'
+            content_desc (str, optional): Content description
+            class_name (str, optional): Full or simple widget class name
+            match_index (int): Which match to tap, in find_element order
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            dict: The tap result (see tap) plus the tapped element, or success False
+                with an error if no element matched
+        """
+        if not any((text, resource_id, content_desc, class_name)):
+            return {"success": False, "error": "give at least one of text, resource_id, content_desc or class_name"}
+        hierarchy, error = self.get_ui_hierarchy(device_id)
+        if error:
+            return {"success": False, "error": error}
+        matches = hierarchy.find(text, resource_id, content_desc, class_name)
+        if not matches:
+            return {"success": False, "error": "no matching element on screen"}
+        if match_index >= len(matches):
+            return {"success": False, "error": f"only {len(matches)} matching elements"}
+        element = matches[match_index]
+        result = self.tap(*element.center, device_id=device_id)
+        result["element"] = element.to_dict()
+        return result
+
+    def run_actions(self, actions: List[dict], stop_on_error: bool = True, device_id: str = None) -> dict:
+        """
+        Runs a sequence of input actions as one chained shell script, in a single
+        round-trip to the device.
+
+        Args:
+            actions (List[dict]): Steps in order. Each has an 'action' ('tap', 'swipe',
+                'input_text', 'press_key' or 'sleep'), the arguments of the matching
+                method, and an optional 'delay_ms' to wait after the step.
+            stop_on_error (bool): Skip the remaining steps after one fails
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            dict: Result of the batch including:
+                - success (bool): Whether every step succeeded
+                - steps (list): Per step: action, command, success, return_code and
+                  output (stdout and stderr), or skipped True if it did not run
+                - command (str): The script that was executed
+                - error (str): Present if the batch could not be built or run
+        """
+        try:
+            script, commands, marker = build_action_script(actions, stop_on_error)
+        except ValueError as e:
+            return {"success": False, "error": str(e), "steps": []}
+        if not commands:
+            return {"success": True, "steps": [], "command": ""}
+
+        self.ui_hierarchies.invalidate(device_id)
+        result, error = self.run_shell(script, device_id)
+        if error:
+            return {"success": False, "error": error, "command": script, "steps": []}
+        return parse_action_output(actions, commands, marker, result.stdout, result.returncode, script)
+
+    def tap(self, x: int, y: int, device_id: str = None) -> dict:
         """
         Taps at the specified coordinates on the device screen.
 
+        Gestures are written to the touchscreen's input node with `sendevent` when the
+        shell can write to it, which skips the start-up of an `input` process.
+
         Args:
             x (int): X coordinate
             y (int): Y coordinate
+            device_id (str, optional): The device identifier. If None, uses the default device.
             
         Returns:
             dict: Result of the tap operation including:
@@ -478,26 +1461,13 @@ class PyAdb:
                 - stdout (str): Standard output if any
                 - stderr (str): Standard error if any
                 - command (str): The command that was executed
+                - method (str): 'sendevent' or 'input'
         """
-        command = f"shell input tap {x} {y}"
-        result, error = self.run_command(command)
-        
-        if error:
-            return {
-                "success": False,
-                "error": error,
-                "command": command
-            }
-        
-        return {
-            "success": result.returncode == 0,
-            "return_code": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "command": command
-        }
+        screen = self._direct_touchscreen(device_id)
+        script = tap_script(screen, x, y, next(self._tracking_ids)) if screen is not None else None
+        return self._run_gesture(script, f"tap {x} {y}", f"input tap {x} {y}", device_id)
 
-    def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int = 300) -> dict:
+    def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int = 300, device_id: str = None) -> dict:
         """
         Swipes from one point to another on the device screen.
 
@@ -507,6 +1477,7 @@ class PyAdb:
             x2 (int): Ending X coordinate
             y2 (int): Ending Y coordinate
             duration (int, optional): Swipe duration in milliseconds. Defaults to 300.
+            device_id (str, optional): The device identifier. If None, uses the default device.
             
         Returns:
             dict: Result of the swipe operation including:
@@ -515,15 +1486,126 @@ class PyAdb:
                 - stdout (str): Standard output if any
                 - stderr (str): Standard error if any
                 - command (str): The command that was executed
+                - method (str): 'sendevent' or 'input'
+        """
+        screen = self._direct_touchscreen(device_id)
+        script = (swipe_script(screen, x1, y1, x2, y2, duration, next(self._tracking_ids))
+                  if screen is not None else None)
+        return self._run_gesture(script, f"swipe {x1} {y1} {x2} {y2} {duration}",
+                                  f"input swipe {x1} {y1} {x2} {y2} {duration}", device_id)
+
+    def long_press(self, x: int, y: int, duration: int = 800, device_id: str = None) -> dict:
+        """
+        Touches and holds at the specified coordinates.
+
+        Args:
+            x (int): X coordinate
+            y (int): Y coordinate
+            duration (int, optional): Hold time in milliseconds. Defaults to 800.
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            dict: Result of the long press, with the same keys as tap
+        """
+        screen = self._direct_touchscreen(device_id)
+        script = tap_script(screen, x, y, next(self._tracking_ids), duration) if screen is not None else None
+        return self._run_gesture(script, f"long_press {x} {y} {duration}",
+                                  f"input swipe {x} {y} {x} {y} {duration}", device_id)
+
+    def pinch(self, x: int, y: int, start_span: int, end_span: int, duration: int = 400,
+              device_id: str = None) -> dict:
+        """
+        Pinches with two fingers on a horizontal line centred on (x, y). `input` has no
+        multi-touch gestures, so this needs a writable multi-touch input node.
+
+        Args:
+            x (int): X coordinate of the centre
+            y (int): Y coordinate of the centre
+            start_span (int): Distance between the fingers at the start, in pixels
+            end_span (int): Distance between the fingers at the end; larger than start_span
+                zooms in, smaller zooms out
+            duration (int, optional): Gesture duration in milliseconds. Defaults to 400.
+            device_id (str, optional): The device identifier. If None, uses the default device.
+
+        Returns:
+            dict: Result of the pinch, with the same keys as tap
+        """
+        screen = self._direct_touchscreen(device_id)
+        if screen is None:
+            return {"success": False, "error": "pinch needs a writable multi-touch input device", "command": ""}
+        try:
+            script = pinch_script(screen, x, y, start_span, end_span, duration, next(self._tracking_ids))
+        except ValueError as e:
+            return {"success": False, "error": str(e), "command": ""}
+        return self._run_gesture(script, f"pinch {x} {y} {start_span} {end_span} {duration}", None, device_id)
+
+    def get_touchscreen(self, device_id: str = None, refresh: bool = False):
+        """
+        Finds the device's touchscreen with `getevent -p` and checks that the shell can
+        write to its input node. The answer is cached until the device reconnects.
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the default device.
+            refresh (bool): Probe again instead of using the cached answer
+
+        Returns:
+            touch_events.TouchScreen or None: None if there is no multi-touch device or its
+                node is not writable
+        """
+        if not refresh and device_id in self._touchscreens:
+            return self._touchscreens[device_id]
+        result, error = self.run_shell(PROBE_COMMAND, device_id)
+        if error:
+            return None
+        screen = parse_touchscreen(result.stdout)
+        if screen is not None:
+            # An empty SYN_REPORT: harmless, and fails with EACCES if the node is not writable
+            check, error = self.run_shell(f"sendevent {screen.path} 0 0 0", device_id)
+            if error:
+                return None
+            if check.returncode != 0:
+                screen = None
+        self._touchscreens[device_id] = screen
+        return screen
+
+    def _direct_touchscreen(self, device_id):
+        """The touchscreen gestures can be written to, or None to use `input`."""
+        if not self.direct_touch:
+            return None
+        screen = self.get_touchscreen(device_id)
+        if screen is None:
+            return None
+        # Input nodes report in the natural orientation. Whether a rotated screen is
+        # at 90 or 270 degrees is unknown here, so leave rotated screens to `input`.
+        size = self._screen_sizes.get(device_id)
+        width, height = screen.display_size
+        if size is not None and (size[0] > size[1]) != (width > height):
+            return None
+        return screen
+
+    def _run_gesture(self, script, gesture, fallback, device_id):
+        """
+        Runs a sendevent gesture script, or the `input` fallback command if script is
+        None or the node refuses the write. A sendevent result reports the gesture
+        instead of its script, which runs to hundreds of lines.
         """
-        command = f"shell input swipe {x1} {y1} {x2} {y2} {duration}"
-        result, error = self.run_command(command)
+        self.ui_hierarchies.invalidate(device_id)
+        if script is not None:
+            method, command = "sendevent", f"sendevent {gesture}"
+            result, error = self.run_shell(script, device_id)
+        if script is None or (error is None and result.returncode != 0 and fallback is not None):
+            if script is not None:
+                # The node stopped accepting writes, e.g. after an SELinux policy change
+                self._touchscreens[device_id] = None
+            method, command = "input", fallback
+            result, error = self.run_shell(command, device_id)
         
         if error:
             return {
                 "success": False,
                 "error": error,
-                "command": command
+                "command": command,
+                "method": method
             }
         
         return {
@@ -531,15 +1613,22 @@ class PyAdb:
             "return_code": result.returncode,
             "stdout": result.stdout,
             "stderr": result.stderr,
-            "command": command
+            "command": command,
+            "method": method
         }
 
-    def input_text(self, text: str) -> dict:
+    def input_text(self, text: str, device_id: str = None, method: str = "auto") -> dict:
         """
         Inputs text on the device.
 
+        Short ASCII text is typed with `input text`, in chunks chained into one shell
+        round-trip. Long or non-ASCII text is committed through the ADBKeyBoard IME
+        when it is installed, which types the whole text at once.
+
         Args:
-            text (str): Text to input
+            text (str): Text to input, typed as is; newlines and tabs press ENTER and TAB
+            device_id (str, optional): The device identifier. If None, uses the default device.
+            method (str): 'auto' to choose by length and charset, 'input' or 'ime'
             
         Returns:
             dict: Result of the text input operation including:
@@ -548,34 +1637,58 @@ class PyAdb:
                 - stdout (str): Standard output if any
                 - stderr (str): Standard error if any
                 - command (str): The command that was executed
+                - method (str): 'input' or 'ime'
         """
-        # Escape special characters for shell
-        text = text.replace("'", "\\'").replace(" ", "%s")
-        command = f"shell input text '{text}'"
-        result, error = self.run_command(command)
+        try:
+            if method == "auto":
+                needs_ime = not is_input_typeable(text) or len(text) >= IME_MIN_LENGTH
+                method = choose_method(text, needs_ime and self.has_adb_keyboard(device_id))
+            if method == "ime":
+                current_ime, error = self.run_shell(CURRENT_IME_COMMAND, device_id)
+                if error:
+                    return {"success": False, "error": error, "command": CURRENT_IME_COMMAND}
+                command = ime_script(text, current_ime.stdout.strip())
+            else:
+                command = input_script(text)
+        except ValueError as e:
+            return {"success": False, "error": str(e), "command": "", "method": method}
+        if not command:
+            return {"success": True, "return_code": 0, "stdout": "", "stderr": "", "command": "", "method": method}
+
+        self.ui_hierarchies.invalidate(device_id)
+        result, error = self.run_shell(command, device_id)
         
         if error:
             return {
                 "success": False,
                 "error": error,
-                "command": command
+                "command": command,
+                "method": method
             }
         
+        returncode = ime_status(result.stdout, result.returncode) if method == "ime" else result.returncode
         return {
-            "success": result.returncode == 0,
-            "return_code": result.returncode,
+            "success": returncode == 0,
+            "return_code": returncode,
             "stdout": result.stdout,
             "stderr": result.stderr,
-            "command": command
+            "command": command,
+            "method": method
         }
 
-    def press_key(self, keycode: str) -> dict:
+    def has_adb_keyboard(self, device_id: str = None) -> bool:
+        """Whether the ADBKeyBoard IME is installed, from the package index."""
+        packages, error = self.get_installed_packages(device_id)
+        return error is None and ADB_KEYBOARD_PACKAGE in packages
+
+    def press_key(self, keycode: str, device_id: str = None) -> dict:
         """
         Presses a key on the device.
 
         Args:
             keycode (str): Key code (e.g., 'HOME', 'BACK')
                 Will be prefixed with 'KEYCODE_' if not already present
+            device_id (str, optional): The device identifier. If None, uses the default device.
 
         Returns:
             dict: Result of the key press operation including:
@@ -588,8 +1701,9 @@ class PyAdb:
         if not keycode.startswith("KEYCODE_"):
             keycode = f"KEYCODE_{keycode}"
 
-        command = f"shell input keyevent {keycode}"
-        result, error = self.run_command(command)
+        command = f"input keyevent {keycode}"
+        self.ui_hierarchies.invalidate(device_id)
+        result, error = self.run_shell(command, device_id)
         
         if error:
             return {
@@ -606,12 +1720,16 @@ class PyAdb:
             "command": command
         }
 
-    def launch_app(self, package_name: str) -> dict:
+    def launch_app(self, package_name: str, device_id: str = None) -> dict:
         """
         Launches an application by package name.
 
+        The launcher activity resolved on the first launch is kept in the package
+        index, so launching the same app again is a single `am start`.
+
         Args:
             package_name (str): Package name of the app to launch
+            device_id (str, optional): The device identifier. If None, uses the default device.
             
         Returns:
             dict: Result of the app launch operation including:
@@ -621,9 +1739,19 @@ class PyAdb:
                 - stderr (str): Standard error if any
                 - command (str): The command that was executed
         """
+        self.ui_hierarchies.invalidate(device_id)
+        activity = self.packages.get_activity(device_id, package_name)
+        if activity is not None:
+            result = self._start_activity(activity, device_id)
+            if result["success"]:
+                result["cached"] = True
+                return result
+            # Uninstalled or updated since it was resolved
+            self.packages.invalidate(device_id, package_name)
+
         # Get launcher activity for the package
-        resolve_cmd = f"shell cmd package resolve-activity --brief {package_name}"
-        result, error = self.run_command(resolve_cmd)
+        resolve_cmd = f"cmd package resolve-activity --brief {package_name}"
+        result, error = self.run_shell(resolve_cmd, device_id)
         
         if error:
             return {
@@ -632,10 +1760,13 @@ class PyAdb:
                 "command": resolve_cmd
             }
 
-        if result.returncode != 0 or result.stderr or "No activity found" in result.stdout:
+        activity = None
+        if result.returncode == 0 and not result.stderr:
+            activity = parse_resolved_activity(result.stdout)
+        if activity is None:
             # Try direct method if activity resolution fails
-            monkey_cmd = f"shell monkey -p {package_name} -c android.intent.category.LAUNCHER 1"
-            monkey_result, monkey_error = self.run_command(monkey_cmd)
+            monkey_cmd = f"monkey -p {package_name} -c android.intent.category.LAUNCHER 1"
+            monkey_result, monkey_error = self.run_shell(monkey_cmd, device_id)
             
             if monkey_error:
                 return {
@@ -652,47 +1783,58 @@ class PyAdb:
                 "command": monkey_cmd,
                 "method": "monkey"
             }
-        else:
-            # Extract and launch the main activity
-            stdout = result.stdout.strip()
-            activity = stdout.splitlines()[1].strip()
-            start_cmd = f"shell am start -n {activity}"
-            start_result, start_error = self.run_command(start_cmd)
-            
-            if start_error:
-                return {
-                    "success": False,
-                    "error": start_error,
-                    "command": start_cmd
-                }
-            
+
+        # Launch the main activity
+        result = self._start_activity(activity, device_id)
+        if result["success"]:
+            self.packages.put_activity(device_id, package_name, activity)
+        return result
+
+    def _start_activity(self, activity: str, device_id: str = None) -> dict:
+        start_cmd = f"am start -n {activity}"
+        start_result, start_error = self.run_shell(start_cmd, device_id)
+
+        if start_error:
             return {
-                "success": start_result.returncode == 0,
-                "return_code": start_result.returncode,
-                "stdout": start_result.stdout,
-                "stderr": start_result.stderr,
-                "command": start_cmd,
-                "method": "am start",
-                "activity": activity
+                "success": False,
+                "error": start_error,
+                "command": start_cmd
             }
 
-    def get_installed_packages(self) -> List[str]:
+        # am start exits 0 even when the activity does not exist
+        failed = "Error" in start_result.stdout or "Error" in start_result.stderr
+        return {
+            "success": start_result.returncode == 0 and not failed,
+            "return_code": start_result.returncode,
+            "stdout": start_result.stdout,
+            "stderr": start_result.stderr,
+            "command": start_cmd,
+            "method": "am start",
+            "activity": activity
+        }
+
+    def get_installed_packages(self, device_id: str = None, refresh: bool = False) -> List[str]:
         """
         Gets a list of installed packages on the device.
 
+        The listing comes from the package index while it is fresh (see package_ttl).
+
+        Args:
+            device_id (str, optional): The device identifier. If None, uses the default device.
+            refresh (bool): List the packages again even if the index is fresh
+
         Returns:
             tuple: (packages, error)
                 - packages (List[str] or None): List of package names if successful
                 - error (str or None): Error message if the operation fails
         """
-        stdout, error = self.run_command("shell pm list packages")
-        if error:
-            return None, error
-        packages = []
-
-        for line in stdout.splitlines():
-            if line.startswith("package:"):
-                package = line[8:].strip()  # Remove 'package:' prefix
-                packages.append(package)
-
-        return packages, None
\ No newline at end of file
+        packages = None if refresh else self.packages.get_packages(device_id)
+        if packages is None:
+            result, error = self.run_shell(LIST_PACKAGES_COMMAND, device_id)
+            if error:
+                return None, error
+            if result.returncode != 0:
+                return None, result.stderr or f"pm list packages exited with {result.returncode}"
+            packages = parse_package_list(result.stdout)
+            self.packages.update(device_id, packages)
+        return sorted(packages), None
@@ -0,0 +1,193 @@
+"""
+Continuous screen capture into a ring buffer of recent frames, so reading the
+screen does not cost a capture and changes between actions are not missed.
+"""
+import collections
+import shlex
+import subprocess
+import threading
+import time
+from typing import List, Optional
+
+from frames import RawFrame
+
+SCREENRECORD_COMMAND = "screenrecord --output-format=h264 -"
+
+
+class FrameRing:
+    """
+    The most recent `size` frames, oldest first. Frame timestamps are
+    time.monotonic() values taken when the frame was received.
+    """
+
+    def __init__(self, size: int = 8):
+        self._frames = collections.deque(maxlen=size)
+        self._cond = threading.Condition()
+
+    def push(self, frame: RawFrame):
+        with self._cond:
+            self._frames.append(frame)
+            self._cond.notify_all()
+
+    def latest(self) -> Optional[RawFrame]:
+        with self._cond:
+            return self._frames[-1] if self._frames else None
+
+    def frames(self) -> List[RawFrame]:
+        with self._cond:
+            return list(self._frames)
+
+    def first_after(self, timestamp: float, timeout: Optional[float] = None) -> Optional[RawFrame]:
+        """
+        Returns the oldest buffered frame received after `timestamp`, waiting up to
+        `timeout` seconds for one to arrive. None if none arrives in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for frame in self._frames:
+                    if frame.timestamp > timestamp:
+                        return frame
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+
+class ScreenStream:
+    """
+    Captures one device's screen continuously on a background thread.
+
+    Sources:
+        'raw': back-to-back raw captures through PyAdb.capture_raw_frame (the
+            adb `framebuffer:` service when the transport talks to the adb server,
+            otherwise `screencap` without PNG encoding). Works everywhere.
+        'screenrecord': keeps `screenrecord --output-format=h264 -` open and decodes
+            it with PyAV (`pip install av`). Frames arrive as the screen changes,
+            but screenrecord restarts every 3 minutes and needs Android 5+.
+
+    Args:
+        adb (PyAdb): Used for captures and to reach the transport
+        device_id (str, optional): The device identifier. If None, uses the default device.
+        source (str): 'raw' or 'screenrecord'
+        buffer_size (int): Frames kept in the ring buffer
+        interval (float): Seconds between raw captures
+    """
+
+    def __init__(self, adb, device_id: Optional[str] = None, source: str = "raw",
+                 buffer_size: int = 8, interval: float = 0.0):
+        if source not in ("raw", "screenrecord"):
+            raise ValueError(f"unknown stream source {source}")
+        self.adb = adb
+        self.device_id = device_id
+        self.source = source
+        self.interval = interval
+        self.ring = FrameRing(buffer_size)
+        self.error = None
+        self._running = False
+        self._thread = None
+        self._close_stream = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return self
+        if self.source == "screenrecord":
+            try:
+                import av  # noqa: F401
+            except ImportError:
+                raise RuntimeError("the screenrecord source requires PyAV (pip install av)")
+        self._running = True
+        target = self._capture_raw if self.source == "raw" else self._capture_screenrecord
+        self._thread = threading.Thread(target=target, name=f"screen-stream-{self.device_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._close_stream is not None:
+            self._close_stream()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[RawFrame]:
+        """The newest frame, or None if there is none or it is older than max_age seconds."""
+        frame = self.ring.latest()
+        if frame is None or (max_age is not None and time.monotonic() - frame.timestamp > max_age):
+            return None
+        return frame
+
+    def first_after(self, timestamp: float, timeout: Optional[float] = 5.0) -> Optional[RawFrame]:
+        """See FrameRing.first_after."""
+        return self.ring.first_after(timestamp, timeout)
+
+    def _capture_raw(self):
+        method = "framebuffer" if hasattr(self.adb.transport, "framebuffer") else "screencap"
+        while self._running:
+            frame, error = self.adb.capture_raw_frame(self.device_id, method=method)
+            if error is not None and method == "framebuffer":
+                method = "screencap"
+                continue
+            if error is not None:
+                self.error = error
+                self._running = False
+                return
+            frame.timestamp = time.monotonic()
+            self.ring.push(frame)
+            if self.interval:
+                time.sleep(self.interval)
+
+    def _open_byte_stream(self, command):
+        """
+        Returns:
+            tuple: (read, close) for the stdout of `adb exec-out <command>`
+        """
+        transport = self.adb.transport
+        client = getattr(transport, "client", None)
+        if client is not None:
+            try:
+                connection = client.open_service(self.device_id, f"exec:{command}")
+                return connection.sock.recv, connection.close
+            except ConnectionRefusedError:
+                transport = transport.fallback
+        device_param = ["-s", self.device_id] if self.device_id else []
+        process = subprocess.Popen([transport.adb_path] + device_param + ["exec-out"] + shlex.split(command),
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return process.stdout.read1, process.kill
+
+    def _capture_screenrecord(self):
+        import av
+
+        while self._running:
+            try:
+                read, self._close_stream = self._open_byte_stream(SCREENRECORD_COMMAND)
+            except Exception as e:
+                self.error = f"Error starting screenrecord: {e}"
+                self._running = False
+                return
+            codec = av.CodecContext.create("h264", "r")
+            frames = 0
+            try:
+                while self._running:
+                    data = read(65536)
+                    if not data:
+                        break
+                    for packet in codec.parse(data):
+                        for decoded in codec.decode(packet):
+                            image = decoded.to_image()
+                            self.ring.push(RawFrame(image.width, image.height, "RGB", 3,
+                                                    memoryview(image.tobytes()), time.monotonic()))
+                            frames += 1
+            except Exception as e:
+                if self._running:
+                    self.error = f"Error decoding screenrecord stream: {e}"
+            finally:
+                self._close_stream()
+            # screenrecord exits on its time limit; reopen unless stopped or it produced nothing
+            if frames == 0:
+                self.error = self.error or "screenrecord produced no frames"
+                self._running = False
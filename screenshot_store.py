@@ -0,0 +1,289 @@
+"""
+Screenshots stored once per content hash, written in the background, bounded by
+size with least-recently-used eviction, and linked to the agent steps they were
+taken at through per-session indexes.
+
+Layout under the store's root:
+    frames/ab/ab12...ef.png       one file per distinct frame
+    sessions/<session>.jsonl      one line per recorded step: step, time, device_id, frame
+
+Usage (from the repository root):
+    python screenshot_store.py                        # list sessions
+    python screenshot_store.py SESSION                # list a session's steps
+    python screenshot_store.py SESSION --step 3 --out step3.png
+"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from tracing import default_tracer
+
+DEFAULT_ROOT = ".screenshots"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def frame_digest(data: bytes) -> str:
+    """Content hash a frame is stored under."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class _RootUsage:
+    """The stored frames of one root, shared by every ScreenshotStore on it in this process."""
+
+    def __init__(self, root: str):
+        self.lock = threading.Lock()
+        # digest -> size, least recently used first
+        self.frames: "collections.OrderedDict[str, int]" = collections.OrderedDict()
+        self.bytes = 0
+        directory = os.path.join(root, "frames")
+        found = []
+        for dirpath, _, filenames in os.walk(directory):
+            for name in filenames:
+                if name.endswith(".png"):
+                    stat = os.stat(os.path.join(dirpath, name))
+                    found.append((stat.st_mtime, name[:-len(".png")], stat.st_size))
+        for _, digest, size in sorted(found):
+            self.frames[digest] = size
+            self.bytes += size
+
+
+_usages: Dict[str, _RootUsage] = {}
+_usages_lock = threading.Lock()
+
+
+def _usage_of(root: str) -> _RootUsage:
+    key = os.path.abspath(root)
+    with _usages_lock:
+        usage = _usages.get(key)
+        if usage is None:
+            usage = _usages[key] = _RootUsage(root)
+        return usage
+
+
+class ScreenshotStore:
+    """
+    Content-addressed screenshot files.
+
+    put() only hashes the data and queues it on a single writer thread, so callers
+    do not wait for the disk; a frame that is already stored is not written again.
+    Once the frames exceed `max_bytes` the least recently stored or opened ones are
+    deleted; session indexes keep their entries, and open() returns None for them.
+    Stores on the same root in one process share the frame accounting, so their
+    writes count against one budget; each evicts down to its own `max_bytes`.
+
+    Args:
+        root (str): Directory of the store, created on the first write
+        max_bytes (int, optional): Retention size of the frames. None keeps every frame.
+        tracer (tracing.Tracer, optional): Receives screenshot.write spans
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT, max_bytes: Optional[int] = DEFAULT_MAX_BYTES, tracer=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.tracer = tracer if tracer is not None else default_tracer
+        self._usage = _usage_of(root)
+        # Guards this store's queue as well as the shared frames
+        self._lock = self._usage.lock
+        self._frames = self._usage.frames
+        # Frames queued but not written yet, readable in the meantime
+        self._pending: Dict[str, bytes] = {}
+        self._writer = None
+
+    @property
+    def size(self) -> int:
+        """Bytes of stored frames."""
+        with self._lock:
+            return self._usage.bytes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames) + len(self._pending)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, "frames", digest[:2], f"{digest}.png")
+
+    def put(self, data: bytes, device_id: Optional[str] = None) -> str:
+        """
+        Queues a frame for writing unless it is already stored.
+
+        Returns:
+            str: The frame's digest
+        """
+        digest = frame_digest(data)
+        with self._lock:
+            if digest in self._pending:
+                return digest
+            if digest in self._frames:
+                self._frames.move_to_end(digest)
+                self._submit(self._touch, digest)
+                return digest
+            self._pending[digest] = bytes(data)
+            self._submit(self._write, digest, device_id)
+        return digest
+
+    def record(self, session: str, step: int, data: bytes, device_id: Optional[str] = None) -> str:
+        """
+        Stores a frame and links it to a step in the session's index.
+
+        Returns:
+            str: The frame's digest
+        """
+        digest = self.put(data, device_id)
+        entry = {"step": step, "time": time.time(), "device_id": device_id, "frame": digest, "bytes": len(data)}
+        with self._lock:
+            self._submit(self._append_index, session, entry)
+        return digest
+
+    def open(self, digest: str):
+        """
+        Maps a stored frame into memory without reading it.
+
+        Returns:
+            mmap.mmap or memoryview or None: A read-only mapping of the PNG (close it when
+                done), a view of the data if the frame is still queued, or None if the
+                frame was evicted or never stored
+        """
+        with self._lock:
+            pending = self._pending.get(digest)
+            if pending is not None:
+                return memoryview(pending)
+            if digest not in self._frames:
+                return None
+            self._frames.move_to_end(digest)
+        try:
+            with open(self.path(digest), "rb") as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+    def sessions(self) -> List[str]:
+        directory = os.path.join(self.root, "sessions")
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len(".jsonl")] for name in os.listdir(directory) if name.endswith(".jsonl"))
+
+    def session(self, session: str) -> List[dict]:
+        """The index entries of a session in step order, after pending writes."""
+        self.flush()
+        entries = []
+        try:
+            with open(self._index_path(session), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entries.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def flush(self):
+        """Waits for the queued writes."""
+        with self._lock:
+            writer = self._writer
+        if writer is not None:
+            writer.submit(lambda: None).result()
+
+    def close(self):
+        """Finishes the queued writes. The store can still be used; the writer restarts on demand."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+
+    def _submit(self, function, *args):
+        # Called with the lock held
+        if self._writer is None:
+            self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot-writer")
+        return self._writer.submit(function, *args)
+
+    def _write(self, digest, device_id):
+        with self._lock:
+            data = self._pending[digest]
+        path = self.path(digest)
+        with self.tracer.span("screenshot.write", device_id=device_id, bytes=len(data)) as span:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temporary = f"{path}.{threading.get_ident()}.tmp"
+                with open(temporary, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, path)
+            except OSError as e:
+                span.set(error=str(e))
+                print(f"Error writing screenshot {path}: {e}")
+                with self._lock:
+                    del self._pending[digest]
+                return
+        with self._lock:
+            del self._pending[digest]
+            if digest in self._frames:
+                # Another store on the root wrote the same frame meanwhile
+                self._frames.move_to_end(digest)
+            else:
+                self._frames[digest] = len(data)
+                self._usage.bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        # Called with the lock held, so that no store on the root writes a frame while its
+        # file is being deleted; the newest frame is always kept
+        while self.max_bytes is not None and self._usage.bytes > self.max_bytes and len(self._frames) > 1:
+            digest, size = self._frames.popitem(last=False)
+            self._usage.bytes -= size
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _touch(self, digest):
+        # The modification time carries the LRU order over to the next process
+        try:
+            os.utime(self.path(digest))
+        except FileNotFoundError:
+            # Deleted behind the store's back; forget it so that the next put writes it again
+            with self._lock:
+                size = self._frames.pop(digest, None)
+                if size is not None:
+                    self._usage.bytes -= size
+
+    def _index_path(self, session):
+        return os.path.join(self.root, "sessions", f"{session}.jsonl")
+
+    def _append_index(self, session, entry):
+        path = self._index_path(session)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing screenshot index {path}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("session", nargs="?", help="Session to list")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="Directory of the store")
+    parser.add_argument("--step", type=int, help="Step whose frame is written to --out")
+    parser.add_argument("--out", help="Where to write the frame of --step")
+    options = parser.parse_args()
+    store = ScreenshotStore(options.root, max_bytes=None)
+    if options.session is None:
+        for name in store.sessions():
+            print(name)
+    elif options.step is None:
+        for entry in store.session(options.session):
+            status = "" if os.path.exists(store.path(entry["frame"])) else "  (evicted)"
+            print(f"{entry['step']:>5}  {entry['frame']}  {entry['bytes']:>9} B  {entry['device_id'] or ''}{status}")
+    else:
+        entries = [entry for entry in store.session(options.session) if entry["step"] == options.step]
+        frame = store.open(entries[-1]["frame"]) if entries else None
+        if frame is None:
+            parser.exit(1, f"no stored frame for step {options.step}\n")
+        with open(options.out or f"{options.session}-{options.step}.png", "wb") as f:
+            f.write(frame)
+        frame.close()
@@ -0,0 +1,227 @@
+"""Long-lived `adb shell` sessions with sentinel-delimited command framing."""
+import socket
+import struct
+import subprocess
+import threading
+import uuid
+from typing import Optional
+
+from adb_protocol import AdbClient, AdbProtocolError, SHELL_ID_EXIT, SHELL_ID_STDERR, SHELL_ID_STDIN, SHELL_ID_STDOUT
+
+
+class ShellSessionError(Exception):
+    """Raised when the session dies or a command does not finish in time."""
+
+
+class ShellTimeoutError(ShellSessionError):
+    """Raised when a command does not finish in time; the session has been torn down."""
+
+
+class ShellSession:
+    """
+    One interactive shell on a device that many commands are sent through.
+
+    Each command is followed by a line that echoes a unique sentinel and the
+    command's exit code to stdout, and the same sentinel to stderr. Output is
+    collected until both sentinels arrive, which frames stdout, stderr and the
+    exit code of every command without reopening the shell.
+
+    Subclasses provide `_start(timeout)`, `_write` and `_stop` and feed output through
+    `_feed(generation, stream, data)` / `_closed(generation)` from their reader threads.
+    """
+
+    def __init__(self, serial: Optional[str] = None, timeout: float = 30.0):
+        self.serial = serial
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._buffers = {1: bytearray(), 2: bytearray()}
+        self._alive = False
+        # Bumped on every (re)start so reader threads of a dead session cannot touch the new one
+        self._generation = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._alive
+
+    def _feed(self, generation: int, stream: int, data: bytes):
+        with self._cond:
+            if generation == self._generation:
+                self._buffers[stream].extend(data)
+                self._cond.notify_all()
+
+    def _closed(self, generation: int):
+        with self._cond:
+            if generation == self._generation:
+                self._alive = False
+                self._cond.notify_all()
+
+    def _ensure_started(self, timeout: Optional[float]):
+        if not self._alive:
+            self._stop()
+            with self._cond:
+                self._generation += 1
+                self._buffers = {1: bytearray(), 2: bytearray()}
+            self._start(timeout)
+            self._alive = True
+
+    def run(self, command: str, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """
+        Runs one shell command in the session, (re)starting the session if needed.
+
+        Args:
+            command (str): Shell command to run on the device
+            timeout (float, optional): Seconds to wait for the command, including (re)starting
+                the session. Defaults to the session timeout.
+
+        Returns:
+            subprocess.CompletedProcess: stdout/stderr as text and the command's exit code
+
+        Raises:
+            ShellSessionError: If the session dies or the command times out. The
+                session is torn down and restarted on the next call.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        token = uuid.uuid4().hex
+        end = f"__END_{token}".encode()
+        framed = f"{command}\n__rc=$?; echo {end.decode()}_$__rc; echo {end.decode()} >&2\n"
+
+        with self._lock:
+            self._ensure_started(timeout)
+            try:
+                self._write(framed.encode("utf-8"))
+            except OSError:
+                # The command never reached the device, so it is safe to send it again on a fresh shell
+                self._closed(self._generation)
+                self._ensure_started(timeout)
+                try:
+                    self._write(framed.encode("utf-8"))
+                except OSError as e:
+                    self._closed(self._generation)
+                    raise ShellSessionError(f"shell session died: {e}")
+
+            with self._cond:
+                finished = self._cond.wait_for(
+                    lambda: not self._alive or (end + b"_" in self._buffers[1] and end in self._buffers[2]),
+                    timeout)
+                if not finished or not self._alive:
+                    self._alive = False
+                    reason = "timed out" if not finished else "died"
+                    stop = True
+                else:
+                    stop = False
+                    stdout_buffer, stderr_buffer = self._buffers[1], self._buffers[2]
+                    out_index = stdout_buffer.index(end + b"_")
+                    line_end = stdout_buffer.find(b"\n", out_index)
+                    line_end = len(stdout_buffer) if line_end < 0 else line_end + 1
+                    returncode = int(stdout_buffer[out_index + len(end) + 1:line_end].strip() or b"0")
+                    err_index = stderr_buffer.index(end)
+                    err_end = stderr_buffer.find(b"\n", err_index)
+                    err_end = len(stderr_buffer) if err_end < 0 else err_end + 1
+                    stdout = bytes(stdout_buffer[:out_index])
+                    stderr = bytes(stderr_buffer[:err_index])
+                    del stdout_buffer[:line_end]
+                    del stderr_buffer[:err_end]
+            if stop:
+                self._stop()
+                if reason == "timed out":
+                    raise ShellTimeoutError(f"timed out after {timeout}s: {command}")
+                raise ShellSessionError(f"shell session {reason} running: {command}")
+
+        return subprocess.CompletedProcess(command, returncode,
+                                           stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace"))
+
+    def close(self):
+        with self._lock:
+            self._stop()
+            self._alive = False
+
+    def _start(self, timeout: Optional[float]):
+        raise NotImplementedError
+
+    def _write(self, data: bytes):
+        raise NotImplementedError
+
+    def _stop(self):
+        raise NotImplementedError
+
+
+class ProcessShellSession(ShellSession):
+    """A session backed by one `adb [-s serial] shell` child process."""
+
+    def __init__(self, adb_path: str, serial: Optional[str] = None, timeout: float = 30.0):
+        super().__init__(serial, timeout)
+        self.adb_path = adb_path
+        self._process = None
+
+    def _start(self, timeout):
+        args = [self.adb_path] + (["-s", self.serial] if self.serial else []) + ["shell"]
+        self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE, bufsize=0)
+        for stream, pipe in ((1, self._process.stdout), (2, self._process.stderr)):
+            threading.Thread(target=self._pump, args=(self._generation, stream, pipe), daemon=True).start()
+
+    def _pump(self, generation, stream, pipe):
+        while True:
+            data = pipe.read(65536)
+            if not data:
+                break
+            self._feed(generation, stream, data)
+        self._closed(generation)
+
+    def _write(self, data: bytes):
+        if self._process is None:
+            raise BrokenPipeError("shell process is not running")
+        self._process.stdin.write(data)
+        self._process.stdin.flush()
+
+    def _stop(self):
+        process, self._process = self._process, None
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+class SocketShellSession(ShellSession):
+    """A session backed by an interactive `shell,v2,raw:` service on the adb server."""
+
+    def __init__(self, client: AdbClient, serial: Optional[str] = None, timeout: float = 30.0):
+        super().__init__(serial, timeout)
+        self.client = client
+        self._connection = None
+
+    def _start(self, timeout):
+        try:
+            connection = self.client.open_service(self.serial, "shell,v2,raw:", timeout)
+        except socket.timeout:
+            raise ShellTimeoutError(f"timed out after {timeout}s opening a shell") from None
+        except (OSError, AdbProtocolError) as e:
+            raise ShellSessionError(f"could not open a shell: {e}") from e
+        # The session outlives the deadline for opening it
+        connection.settimeout(None)
+        self._connection = connection
+        threading.Thread(target=self._pump, args=(self._generation, self._connection), daemon=True).start()
+
+    def _pump(self, generation, connection):
+        try:
+            while True:
+                header = connection.read_exactly(5)
+                packet_id, length = header[0], struct.unpack("<I", header[1:])[0]
+                data = connection.read_exactly(length) if length else b""
+                if packet_id in (SHELL_ID_STDOUT, SHELL_ID_STDERR):
+                    self._feed(generation, packet_id, data)
+                elif packet_id == SHELL_ID_EXIT:
+                    break
+        except Exception:
+            pass
+        self._closed(generation)
+
+    def _write(self, data: bytes):
+        if self._connection is None:
+            raise BrokenPipeError("shell connection is closed")
+        self._connection.write_shell_v2(SHELL_ID_STDIN, data)
+
+    def _stop(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.close()
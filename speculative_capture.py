@@ -0,0 +1,136 @@
+"""
+Screenshots captured on a background thread between an action and the next model
+request, so the request does not wait for a capture after the screen settles.
+"""
+import threading
+import time
+from typing import Optional, Tuple
+
+from frames import SettleDetector, luma_difference, sample_luma
+from tracing import default_tracer
+
+
+class SpeculativeCapture:
+    """
+    Captures one device's screen on a background thread from when an action
+    returns until the screenshot is taken with result().
+
+    Raw frames are fed to a SettleDetector as in PyAdb.wait_for_ui_idle. Once the
+    screen settles (or `timeout` passes) the frame is encoded to PNG, and capturing
+    goes on: a frame that differs from the encoded one replaces it. result() hands
+    over the latest encoded frame, so it costs no capture and is at most one
+    capture old.
+
+    Args:
+        adb (PyAdb): Used for captures and to persist the screenshot
+        device_id (str, optional): The device identifier. If None, uses the default device.
+        threshold (float): Mean luma difference below which two frames are the same
+        timeout (float): Seconds after which an unsettled screen is encoded anyway
+        stable_frames (int): Consecutive similar frame pairs that count as settled
+        interval (float): Seconds between captures once settled
+        tracer (tracing.Tracer, optional): Receives capture.settle and capture.encode spans
+    """
+
+    def __init__(self, adb, device_id: Optional[str] = None, threshold: float = 0.005, timeout: float = 5.0,
+                 stable_frames: int = 1, interval: float = 0.0, tracer=None):
+        self.adb = adb
+        self.device_id = device_id
+        self.threshold = threshold
+        self.timeout = timeout
+        self.stable_frames = stable_frames
+        self.interval = interval
+        self.tracer = tracer if tracer is not None else default_tracer
+        self.error = None
+        # Like wait_for_ui_idle's result, filled in when the screen settles
+        self.settle = None
+        self.refreshes = 0
+        self._png = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._running = False
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._capture, name=f"speculative-capture-{self.device_id}",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stops capturing without waiting for the capture in flight."""
+        self._running = False
+
+    def result(self, timeout: Optional[float] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Stops capturing and returns the latest screenshot, waiting for the screen to
+        settle if it has not yet. The screenshot is saved like take_screenshot's.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a screenshot. Defaults to
+                the settle timeout plus a second for the capture in flight.
+
+        Returns:
+            tuple: (raw_data, error) like PyAdb.take_screenshot
+        """
+        self._ready.wait(self.timeout + 1.0 if timeout is None else timeout)
+        self._running = False
+        with self._lock:
+            png = self._png
+        if png is None:
+            return None, self.error or f"no screenshot within {self.timeout}s"
+        self.adb.save_screenshot(png, self.device_id)
+        return png, None
+
+    def _capture(self):
+        detector = SettleDetector(self.threshold, self.stable_frames)
+        method = "framebuffer" if hasattr(self.adb.transport, "framebuffer") else "screencap"
+        start = time.monotonic()
+        frames = 0
+        with self.tracer.span("capture.settle", device_id=self.device_id) as span:
+            while self._running:
+                frame, error = self.adb.capture_raw_frame(self.device_id, method=method)
+                if error is not None and method == "framebuffer":
+                    method = "screencap"
+                    continue
+                if error is not None:
+                    self.error = error
+                    span.set(error=error)
+                    break
+                frames += 1
+                elapsed = time.monotonic() - start
+                settled = detector.add(frame)
+                if settled or elapsed >= self.timeout:
+                    self.settle = {"settled": settled, "elapsed": elapsed, "frames": frames,
+                                   "difference": detector.last_difference}
+                    span.set(settled=settled, frames=frames)
+                    self._encode(frame, sample_luma(frame))
+                    break
+        self._ready.set()
+
+        while self._running and self.error is None:
+            if self.interval:
+                time.sleep(self.interval)
+            frame, error = self.adb.capture_raw_frame(self.device_id, method=method)
+            if error is not None or not self._running:
+                return
+            signature = sample_luma(frame)
+            if luma_difference(signature, self._signature) > self.threshold:
+                self._encode(frame, signature)
+                self.refreshes += 1
+        self._running = False
+
+    def _encode(self, frame, signature):
+        with self.tracer.span("capture.encode", device_id=self.device_id) as span:
+            png = frame.to_png()
+            span.set(bytes=len(png))
+        with self._lock:
+            self._png = png
+            self._signature = signature
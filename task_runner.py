@@ -0,0 +1,245 @@
+"""
+Runs a file of tasks across every attached device: one agent session per device,
+each device taking the next task as soon as it is idle. The task of a device that
+goes offline is put back on the queue for another device.
+
+The task file has one JSON object per line, like requests.jsonl: the task is its
+'prompt', or else its 'title' and 'body'; its id is 'id' or 'request_id'.
+
+Usage:
+    python task_runner.py tasks.jsonl --results results.jsonl
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+
+import main as agent
+from adb_transport import SocketTransport
+from element_memo import ElementMemo
+from pyadb import PyAdb
+from trace_cache import TraceCache
+from tracing import Tracer
+
+
+@dataclass
+class Task:
+    id: str
+    prompt: str
+    attempts: int = 0
+    devices: List[str] = field(default_factory=list)
+
+
+def load_tasks(path: str) -> List[Task]:
+    """
+    Reads a JSONL task file. Blank lines are skipped.
+
+    Raises:
+        ValueError: If a line is not JSON or has no prompt
+    """
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}") from None
+            if isinstance(entry, str):
+                entry = {"prompt": entry}
+            prompt = entry.get("prompt") or ". ".join(entry[key] for key in ("title", "body") if entry.get(key))
+            if not prompt:
+                raise ValueError(f"{path}:{number}: task has no prompt, title or body")
+            tasks.append(Task(str(entry.get("id") or entry.get("request_id") or number), prompt))
+    return tasks
+
+
+class DeviceScheduler:
+    """
+    Leases ready devices from list_android_devices to a queue of tasks.
+
+    The device list is polled every `poll_interval` seconds, so devices attached
+    mid-run take tasks too. When a leased device drops out of the list, or stops
+    answering so that its circuit breaker opens (PyAdb.health), its session is asked
+    to stop, and once it returns without completing the task, the task goes back to
+    the front of the queue (up to `max_attempts` tries). The device is leased again
+    once it is back in the list and answering.
+
+    Args:
+        adb (PyAdb): Shared by all sessions
+        run_task (callable): run_task(device_id, task, stop_event) runs one session and
+            returns the model's final text, or None if the task was not completed
+        poll_interval (float): Seconds between device listings
+        max_attempts (int): Tries per task before it is reported as failed
+        on_result (callable, optional): Called with each task's result dict as it finishes
+    """
+
+    def __init__(self, adb: PyAdb, run_task: Callable, poll_interval: float = 2.0, max_attempts: int = 3,
+                 on_result: Optional[Callable[[dict], None]] = None):
+        self.adb = adb
+        self.run_task = run_task
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.on_result = on_result
+        self._ready = set()
+        self._stops: Dict[str, threading.Event] = {}
+
+    def ready_devices(self) -> set:
+        devices = self.adb.list_android_devices(incremental=True)
+        if isinstance(devices, tuple):
+            print(f"Error listing devices: {devices[1]}")
+            return set()
+        return {device['id'] for device in devices if device['status'] == 'device' and device['detail'][1] is None
+                and not self.adb.health.is_open(device['id'])}
+
+    def _refresh(self):
+        self._ready = self.ready_devices()
+        for device_id, stop_event in self._stops.items():
+            if device_id not in self._ready and not stop_event.is_set():
+                reason = "is not responding" if self.adb.health.is_open(device_id) else "went offline"
+                print(f"[{device_id}] {reason}")
+                stop_event.set()
+
+    def _session(self, device_id: str, task: Task, stop_event: threading.Event) -> dict:
+        started_at = time.time()
+        start = time.perf_counter()
+        output, error = None, None
+        try:
+            output = self.run_task(device_id, task, stop_event)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return {
+            "id": task.id,
+            "prompt": task.prompt,
+            "device_id": device_id,
+            "status": "completed" if output is not None else "failed",
+            "output": output,
+            "error": error,
+            "started_at": started_at,
+            "elapsed_s": round(time.perf_counter() - start, 3),
+        }
+
+    def run(self, tasks: List[Task]) -> List[dict]:
+        """
+        Runs every task and blocks until all are completed or have failed.
+
+        Returns:
+            list: One result per task, in completion order: id, prompt, device_id, status
+                ('completed' or 'failed'), output, error, attempts, devices, started_at,
+                elapsed_s (of the last attempt) and total_s (queue to finish)
+        """
+        queue: Deque[Task] = collections.deque(tasks)
+        queued_at = time.perf_counter()
+        results = []
+        running = {}
+        last_poll = 0.0
+        with concurrent.futures.ThreadPoolExecutor(thread_name_prefix="device-session") as executor:
+            while queue or running:
+                if time.monotonic() - last_poll >= self.poll_interval:
+                    self._refresh()
+                    last_poll = time.monotonic()
+                    if not self._ready and not running:
+                        print(f"No ready devices; {len(queue)} tasks waiting")
+
+                for device_id in sorted(self._ready - self._stops.keys()):
+                    if not queue:
+                        break
+                    task = queue.popleft()
+                    task.attempts += 1
+                    task.devices.append(device_id)
+                    stop_event = self._stops[device_id] = threading.Event()
+                    print(f"[{device_id}] task {task.id} (attempt {task.attempts})")
+                    running[executor.submit(self._session, device_id, task, stop_event)] = (device_id, task)
+
+                if not running:
+                    time.sleep(self.poll_interval)
+                    continue
+                done, _ = concurrent.futures.wait(running, timeout=self.poll_interval,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    device_id, task = running.pop(future)
+                    offline = self._stops.pop(device_id).is_set()
+                    result = future.result()
+                    if result["status"] != "completed" and offline and task.attempts < self.max_attempts:
+                        print(f"[{device_id}] requeued task {task.id}")
+                        self._ready.discard(device_id)
+                        queue.appendleft(task)
+                        continue
+                    if offline:
+                        self._ready.discard(device_id)
+                        if result["status"] != "completed" and result["error"] is None:
+                            result["error"] = "device went offline"
+                    result.update(attempts=task.attempts, devices=list(task.devices),
+                                  total_s=round(time.perf_counter() - queued_at, 3))
+                    results.append(result)
+                    if self.on_result is not None:
+                        self.on_result(result)
+        return results
+
+
+def run_tasks(tasks: List[Task], adb: Optional[PyAdb] = None, results_path: Optional[str] = None,
+              max_steps: Optional[int] = 30, poll_interval: float = 2.0, max_attempts: int = 3,
+              replay: bool = True) -> List[dict]:
+    """
+    Runs tasks across all ready devices with main.main as the agent session.
+
+    Args:
+        adb (PyAdb, optional): Defaults to a PyAdb on a SocketTransport tracing to
+            agent-trace.jsonl, closed at the end
+        results_path (str, optional): JSONL file each task's result is appended to as it finishes
+        max_steps (int, optional): Model turns per session before the task counts as failed
+
+    Returns:
+        list: The task results, see DeviceScheduler.run
+    """
+    owned = adb is None
+    if owned:
+        adb = PyAdb(transport=SocketTransport(), tracer=Tracer("agent-trace.jsonl"))
+    results_file = open(results_path, "a", encoding="utf-8") if results_path else None
+    write_lock = threading.Lock()
+    # Shared so that the sessions' writes to the memo file and the trace cache do not overwrite each other
+    memo = ElementMemo()
+    trace_cache = TraceCache() if replay else False
+
+    def run_task(device_id, task, stop_event):
+        return agent.main(adb=adb, prompt=task.prompt, device_id=device_id, max_steps=max_steps,
+                          stop_event=stop_event, replay=trace_cache, metrics_path=None, memo=memo)
+
+    def on_result(result):
+        print(f"[{result['device_id']}] task {result['id']} {result['status']} in {result['elapsed_s']:.1f}s")
+        if results_file is not None:
+            with write_lock:
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+
+    try:
+        scheduler = DeviceScheduler(adb, run_task, poll_interval, max_attempts, on_result)
+        return scheduler.run(tasks)
+    finally:
+        if results_file is not None:
+            results_file.close()
+        adb.tracer.write_metrics("agent-metrics.prom")
+        if owned:
+            adb.close()
+            adb.tracer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", help="JSONL task file")
+    parser.add_argument("--results", default="results.jsonl", help="JSONL file the task results are appended to")
+    parser.add_argument("--max-steps", type=int, default=30, help="Model turns per task before giving up")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Tries per task when its device goes offline")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between device listings")
+    parser.add_argument("--no-replay", action="store_true", help="Do not replay or record cached traces")
+    options = parser.parse_args()
+    results = run_tasks(load_tasks(options.tasks), results_path=options.results, max_steps=options.max_steps,
+                        poll_interval=options.poll_interval, max_attempts=options.max_attempts,
+                        replay=not options.no_replay)
+    completed = sum(result["status"] == "completed" for result in results)
+    print(f"{completed} of {len(results)} tasks completed")
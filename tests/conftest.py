@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+# main builds its Gemini client on import; the tests never call the model
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+from adb_transport import SocketTransport
+from fake_adb_server import FakeAdbServer
+from pyadb import PyAdb
+
+
+@pytest.fixture
+def server():
+    with FakeAdbServer() as server:
+        yield server
+
+
+@pytest.fixture
+def device(server):
+    return server.add_device("emulator-5554")
+
+
+@pytest.fixture
+def make_adb(server, tmp_path):
+    """Builds PyAdb instances on the fake server and closes them after the test."""
+    instances = []
+
+    def make(**kwargs):
+        kwargs.setdefault("screenshot_dir", str(tmp_path / "screenshots"))
+        adb = PyAdb(transport=SocketTransport(port=server.port), **kwargs)
+        instances.append(adb)
+        return adb
+
+    yield make
+    for adb in instances:
+        adb.close()
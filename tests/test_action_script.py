@@ -0,0 +1,50 @@
+from pyadb import build_action_script, parse_action_output
+
+ACTIONS = [{"action": "tap", "x": 1, "y": 2}, {"action": "press_key", "keycode": "BACK"},
+           {"action": "swipe", "x1": 1, "y1": 2, "x2": 3, "y2": 4}]
+
+
+def run(device, actions, stop_on_error=True):
+    script, commands, marker = build_action_script(actions, stop_on_error)
+    stdout, _, returncode = device.run_script(script)
+    return parse_action_output(actions, commands, marker, stdout.decode(), returncode, script)
+
+
+def test_output_without_a_final_newline_stays_with_its_step(device):
+    outputs = {"tap": b"tapped", "keyevent": b"pressed\n", "swipe": b""}
+    device.commands["input"] = lambda args, stdin: (outputs[args[0]], b"", 0)
+
+    result = run(device, ACTIONS)
+
+    assert result["success"]
+    assert [step["output"] for step in result["steps"]] == ["tapped", "pressed", ""]
+
+
+def test_failing_step_stops_the_rest(device):
+    device.commands["input"] = lambda args, stdin: (b"no", b"", 0) if args[0] == "tap" else (b"boom", b"", 3)
+
+    result = run(device, ACTIONS)
+
+    assert not result["success"]
+    first, failed, skipped = result["steps"]
+    assert (first["success"], first["output"]) == (True, "no")
+    assert (failed["success"], failed["return_code"], failed["output"]) == (False, 3, "boom")
+    assert skipped == {"action": "swipe", "command": "input swipe 1 2 3 4 300", "success": False, "skipped": True}
+
+
+def test_without_stop_on_error_every_step_reports(device):
+    device.commands["input"] = lambda args, stdin: (b"", b"", 1 if args[0] == "keyevent" else 0)
+
+    result = run(device, ACTIONS, stop_on_error=False)
+
+    assert [step["return_code"] for step in result["steps"]] == [0, 1, 0]
+
+
+def test_step_output_that_looks_like_a_marker_is_kept(device):
+    script, commands, marker = build_action_script(ACTIONS[:1])
+    stdout = f"{marker}:0:5\n\n{marker}:0:0\n\n{marker}:end:0\n"
+
+    result = parse_action_output(ACTIONS[:1], commands, marker, stdout, 0, script)
+
+    assert result["steps"][0]["output"] == f"{marker}:0:5"
+    assert result["steps"][0]["return_code"] == 0
@@ -0,0 +1,64 @@
+import pytest
+
+from adb_protocol import AdbClient, AdbProtocolError
+
+
+@pytest.fixture
+def client(server):
+    client = AdbClient(port=server.port)
+    yield client
+    client.close()
+
+
+def test_host_services(client, server, device):
+    server.add_device("emulator-5556", state="offline")
+
+    assert client.version() == 0x29
+    assert client.devices() == [("emulator-5554", "device"), ("emulator-5556", "offline")]
+    assert client.get_state("emulator-5556") == "offline"
+
+
+def test_features_are_cached(client, server, device):
+    assert "shell_v2" in client.features("emulator-5554")
+    device.features = []
+
+    assert "shell_v2" in client.features("emulator-5554")
+    client.forget_device("emulator-5554")
+    assert client.features("emulator-5554") == []
+
+
+def test_shell_v2_separates_streams_and_exit_code(client, device):
+    assert client.shell("emulator-5554", "echo out; echo err >&2; false") == (b"out\n", b"err\n", 1)
+
+
+def test_shell_v1_recovers_the_exit_code(client, server):
+    server.add_device("legacy", features=[])
+
+    stdout, stderr, code = client.shell("legacy", "echo out; false")
+
+    assert (stdout, stderr, code) == (b"out\n", b"", 1)
+
+
+def test_exec_out_is_binary_safe(client, device):
+    assert client.exec_out("emulator-5554", "screencap -p").startswith(b"\x89PNG\r\n\x1a\n")
+
+
+def test_sync_sessions_are_pooled(client, device):
+    client.push("emulator-5554", b"x" * 200_000, "/sdcard/big.bin")
+
+    assert client.stat("emulator-5554", "/sdcard/big.bin")[1] == 200_000
+    assert client.pull("emulator-5554", "/sdcard/big.bin") == b"x" * 200_000
+    assert len(client._idle_sync["emulator-5554"]) == 1
+
+
+def test_sync_failure_keeps_the_session_usable(client, device):
+    device.files["/sdcard/a"] = b"a"
+
+    with pytest.raises(AdbProtocolError, match="No such file"):
+        client.pull("emulator-5554", "/sdcard/missing")
+    assert client.pull("emulator-5554", "/sdcard/a") == b"a"
+
+
+def test_unknown_device_fails(client, device):
+    with pytest.raises(AdbProtocolError, match="not found"):
+        client.shell("missing", "echo hi")
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from adb_transport import AdbTimeoutError, SocketTransport
+from fake_adb_server import FakeAdbServer
+from pyadb import PyAdb
+
+
+@pytest.fixture
+def stalled_server():
+    # Answers every request only after 30 seconds
+    with FakeAdbServer(latency=30.0) as server:
+        server.add_device("emulator-5554")
+        yield server
+
+
+def test_run_shell_returns_output_and_exit_code(server, device):
+    transport = SocketTransport(port=server.port)
+
+    result = transport.run("-s emulator-5554 shell 'echo out; echo err >&2; false'")
+
+    assert (result.stdout, result.stderr, result.returncode) == ("out\n", "err\n", 1)
+
+
+def test_run_exec_out_returns_bytes(server, device):
+    transport = SocketTransport(port=server.port)
+
+    result = transport.run("-s emulator-5554 exec-out screencap -p", text=False)
+
+    assert result.stdout.startswith(b"\x89PNG")
+
+
+def test_run_lists_devices(server, device):
+    server.add_device("emulator-5556", state="offline")
+
+    result = SocketTransport(port=server.port).run("devices")
+
+    assert [line for line in result.stdout.splitlines()[1:] if line] == ["emulator-5554\tdevice", "emulator-5556\toffline"]
+
+
+def test_push_then_pull_round_trips_a_file(server, device, tmp_path):
+    transport = SocketTransport(port=server.port)
+    source, target = tmp_path / "source.bin", tmp_path / "target.bin"
+    source.write_bytes(bytes(range(256)) * 1000)
+
+    assert transport.run(f"-s emulator-5554 push {source} /sdcard/data.bin").returncode == 0
+    assert transport.run(f"-s emulator-5554 pull /sdcard/data.bin {target}").returncode == 0
+    assert target.read_bytes() == source.read_bytes()
+
+
+def test_unknown_device_is_an_error_result(server, device):
+    result = SocketTransport(port=server.port).run("-s missing shell echo hi")
+
+    assert result.returncode == 1
+    assert "not found" in result.stderr
+
+
+@pytest.mark.parametrize("command", ["devices", "-s emulator-5554 get-state", "-s emulator-5554 shell echo hi",
+                                     "-s emulator-5554 pull /sdcard/a /tmp/a"])
+def test_stalled_server_times_out(stalled_server, command):
+    transport = SocketTransport(port=stalled_server.port)
+    start = time.monotonic()
+
+    with pytest.raises(AdbTimeoutError):
+        transport.run(command, timeout=0.5)
+
+    assert time.monotonic() - start < 2
+
+
+def test_stalled_server_times_out_opening_a_shell_session(stalled_server):
+    transport = SocketTransport(port=stalled_server.port)
+
+    with pytest.raises(AdbTimeoutError):
+        transport.open_shell("emulator-5554", timeout=0.5)
+
+
+def test_list_android_devices_gives_up_on_a_stalled_server(stalled_server):
+    adb = PyAdb(transport=SocketTransport(port=stalled_server.port), timeouts={"command": 0.5}, screenshot_dir=None)
+    try:
+        start = time.monotonic()
+        devices, error = adb.list_android_devices()
+        assert devices is None and "timed out" in error
+        assert time.monotonic() - start < 2
+    finally:
+        adb.close()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from device_health import DeviceHealth
+
+
+def wait_until(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_circuit_opens_after_consecutive_timeouts():
+    health = DeviceHealth(lambda device_id: False, threshold=3, probe_interval=60)
+
+    health.record_timeout("a")
+    health.record_timeout("a")
+    health.record_success("a")
+    health.record_timeout("a")
+    health.record_timeout("a")
+    assert health.check("a") is None
+    health.record_timeout("a")
+
+    assert "not responding" in health.check("a")
+    assert health.check("b") is None
+    health.close()
+
+
+def test_probe_closes_the_circuit():
+    answering = threading.Event()
+    health = DeviceHealth(lambda device_id: answering.is_set(), threshold=1, probe_interval=0.05)
+
+    health.record_timeout("a")
+    time.sleep(0.2)
+    assert health.is_open("a")
+    answering.set()
+
+    assert wait_until(lambda: not health.is_open("a"))
+    health.close()
+
+
+def test_probing_restarts_after_close():
+    answering = threading.Event()
+    health = DeviceHealth(lambda device_id: answering.is_set(), threshold=1, probe_interval=0.05)
+    health.record_timeout("a")
+    health.close()
+    answering.set()
+    time.sleep(0.2)
+
+    # Still open: nothing probed since close(), until the circuit is used again
+    assert health.is_open("a")
+    assert wait_until(lambda: not health.is_open("a"))
+    health.close()
+
+
+def test_reset_forgets_a_device():
+    health = DeviceHealth(lambda device_id: False, threshold=1, probe_interval=60)
+    health.record_timeout("a")
+
+    health.reset("a")
+
+    assert health.check("a") is None
+    health.close()
+
+
+def test_pyadb_skips_a_hung_device_until_it_answers(make_adb, device):
+    adb = make_adb(timeouts={"shell": 0.3, "probe": 0.3}, breaker_threshold=2, probe_interval=0.1)
+    device.responsive.clear()
+
+    for _ in range(2):
+        assert "timed out" in adb.run_shell("echo hi", "emulator-5554")[1]
+    start = time.monotonic()
+    _, error = adb.run_shell("echo hi", "emulator-5554")
+
+    assert "not responding" in error and time.monotonic() - start < 0.1
+    device.responsive.set()
+    assert wait_until(lambda: not adb.health.is_open("emulator-5554"))
+    assert adb.run_shell("echo back", "emulator-5554")[0].stdout == "back\n"
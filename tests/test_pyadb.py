@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.mark.parametrize("persistent_shell", [True, False])
+def test_input_text_keeps_shell_syntax_in_the_text(make_adb, device, persistent_shell):
+    adb = make_adb(persistent_shell=persistent_shell)
+
+    result = adb.input_text("a;b 'c'", "emulator-5554", method="input")
+
+    assert result["success"], result
+    assert device.typed == "a;b 'c'"
+    assert not any(command.startswith("b") for command in device.history)
+
+
+def commands_during(device, call):
+    start = len(device.history)
+    call()
+    return device.history[start:]
+
+
+def test_ui_hierarchy_cache_checks_the_foreground_only_when_reusing(make_adb, device):
+    adb = make_adb()
+
+    first = commands_during(device, lambda: adb.get_ui_hierarchy("emulator-5554"))
+    forced = commands_during(device, lambda: adb.get_ui_hierarchy("emulator-5554", refresh=True))
+    reused = commands_during(device, lambda: adb.get_ui_hierarchy("emulator-5554"))
+    device.foreground = "com.android.chrome/.Main"
+    moved = commands_during(device, lambda: adb.get_ui_hierarchy("emulator-5554"))
+
+    assert not any(command.startswith("dumpsys") for command in first + forced)
+    assert any(command.startswith("dumpsys") for command in reused)
+    assert not any(command.startswith("uiautomator") for command in reused)
+    assert any(command.startswith("uiautomator") for command in moved)
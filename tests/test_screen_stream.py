@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from frames import RawFrame
+from screen_stream import FrameRing
+
+
+def frame_at(timestamp):
+    return RawFrame(1, 1, "RGBA", 4, memoryview(b"\0\0\0\xff"), timestamp)
+
+
+@pytest.fixture
+def small_device(server):
+    return server.add_device("small", screen_size=(64, 128))
+
+
+def test_ring_keeps_the_newest_frames():
+    ring = FrameRing(size=2)
+    for timestamp in (1.0, 2.0, 3.0):
+        ring.push(frame_at(timestamp))
+
+    assert [frame.timestamp for frame in ring.frames()] == [2.0, 3.0]
+    assert ring.latest().timestamp == 3.0
+
+
+def test_first_after_waits_for_a_newer_frame():
+    ring = FrameRing()
+    ring.push(frame_at(1.0))
+    threading.Timer(0.1, ring.push, args=(frame_at(2.0),)).start()
+
+    assert ring.first_after(0.5, timeout=1).timestamp == 1.0
+    assert ring.first_after(1.0, timeout=1).timestamp == 2.0
+    assert ring.first_after(2.0, timeout=0.05) is None
+
+
+def test_stream_feeds_screenshots_and_frames_after_an_action(make_adb, small_device):
+    adb = make_adb()
+    stream, error = adb.start_screen_stream("small")
+    assert error is None
+
+    sent = time.monotonic()
+    frame, error = adb.get_frame_after(sent, timeout=2, device_id="small")
+    assert error is None and frame.timestamp > sent and (frame.width, frame.height) == (64, 128)
+
+    start = len(small_device.history)
+    png, error = adb.take_screenshot("small")
+    assert error is None and png.startswith(b"\x89PNG")
+    # Served from the stream, not by a PNG screencap on the device
+    assert "screencap -p" not in small_device.history[start:]
+
+    adb.stop_screen_stream("small")
+    assert not stream.running
+    assert adb.get_frame_after(sent, device_id="small")[1] == "no screen stream running for this device"
+
+
+def test_screenrecord_source_needs_pyav(make_adb, small_device):
+    try:
+        import av  # noqa: F401
+        pytest.skip("PyAV is installed")
+    except ImportError:
+        pass
+
+    stream, error = make_adb().start_screen_stream("small", source="screenrecord")
+
+    assert stream is None and "PyAV" in error
@@ -0,0 +1,51 @@
+import os
+
+from fake_adb_server import make_png
+from screenshot_store import ScreenshotStore, frame_digest
+
+
+def frame_files(root):
+    return sorted(name for _, _, names in os.walk(root / "frames") for name in names if name.endswith(".png"))
+
+
+def test_stores_on_one_root_share_the_budget(tmp_path):
+    frames = [make_png(64, 64, (index, index, index)) for index in range(12)]
+    budget = 4 * len(frames[0])
+    stores = [ScreenshotStore(str(tmp_path), budget), ScreenshotStore(str(tmp_path), budget)]
+
+    for index, frame in enumerate(frames):
+        stores[index % 2].put(frame)
+        stores[index % 2].flush()
+
+    assert stores[0].size == stores[1].size <= budget
+    assert sum(os.path.getsize(tmp_path / "frames" / name[:2] / name) for name in frame_files(tmp_path)) <= budget
+    # Either store can read the newest frame, whichever one wrote it
+    for store in stores:
+        mapping = store.open(frame_digest(frames[-1]))
+        assert bytes(mapping) == frames[-1]
+        mapping.close()
+        store.close()
+
+
+def test_same_frame_from_two_stores_is_counted_once(tmp_path):
+    first, second = ScreenshotStore(str(tmp_path)), ScreenshotStore(str(tmp_path))
+    frame = make_png(32, 32)
+
+    first.put(frame)
+    second.put(frame)
+    first.flush()
+    second.flush()
+
+    assert first.size == len(frame)
+    assert len(frame_files(tmp_path)) == 1
+
+
+def test_record_links_steps_to_frames(tmp_path):
+    store = ScreenshotStore(str(tmp_path))
+    frame = make_png(16, 16)
+
+    digest = store.record("session", 3, frame, "emulator-5554")
+
+    assert [(entry["step"], entry["frame"]) for entry in store.session("session")] == [(3, digest)]
+    assert store.sessions() == ["session"]
+    store.close()
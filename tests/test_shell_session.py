@@ -0,0 +1,60 @@
+import pytest
+
+from adb_protocol import AdbClient
+from fake_adb_server import FakeAdbServer
+from shell_session import ShellSessionError, ShellTimeoutError, SocketShellSession
+
+
+@pytest.fixture
+def session(server, device):
+    session = SocketShellSession(AdbClient(port=server.port), "emulator-5554", timeout=5.0)
+    yield session
+    session.close()
+
+
+def test_commands_are_framed_separately(session):
+    first = session.run("echo one; echo warn >&2; false")
+    second = session.run("echo two")
+
+    assert (first.stdout, first.stderr, first.returncode) == ("one\n", "warn\n", 1)
+    assert (second.stdout, second.stderr, second.returncode) == ("two\n", "", 0)
+
+
+def test_output_without_a_final_newline(session):
+    result = session.run("echo -n partial")
+
+    assert (result.stdout, result.returncode) == ("partial", 0)
+    assert session.run("echo next").stdout == "next\n"
+
+
+def test_commands_share_one_shell(session, device):
+    session.run("greeting=hello")
+
+    assert session.run("echo $greeting").stdout == "hello\n"
+
+
+def test_a_dead_shell_is_restarted(session):
+    session.run("greeting=hello")
+
+    with pytest.raises(ShellSessionError):
+        session.run("exit")
+    assert not session.alive
+    result = session.run("echo $greeting")
+
+    assert session.alive
+    # A new shell, so the variable is gone
+    assert (result.stdout, result.returncode) == ("\n", 0)
+
+
+def test_timeout_tears_the_shell_down(session):
+    with pytest.raises(ShellTimeoutError):
+        session.run("sleep 1", timeout=0.2)
+
+    assert session.run("echo again").stdout == "again\n"
+
+
+def test_stalled_server_times_out_opening_the_shell():
+    with FakeAdbServer(latency=30.0) as stalled:
+        session = SocketShellSession(AdbClient(port=stalled.port), timeout=0.3)
+        with pytest.raises(ShellTimeoutError):
+            session.run("echo hi")
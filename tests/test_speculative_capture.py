@@ -0,0 +1,71 @@
+import io
+import time
+
+import pytest
+from PIL import Image
+
+from speculative_capture import SpeculativeCapture
+
+
+@pytest.fixture
+def small_device(server):
+    return server.add_device("small", screen_size=(64, 128))
+
+
+def paint(device, color):
+    width, height = device.screen_size
+    pixels = bytes(color) + b"\xff"
+    device.raw_pixels = lambda: pixels * (width * height)
+
+
+def png_color(png):
+    return Image.open(io.BytesIO(png)).convert("RGB").getpixel((0, 0))
+
+
+def test_static_screen_settles_and_is_encoded(make_adb, small_device):
+    capture = SpeculativeCapture(make_adb(), "small").start()
+
+    png, error = capture.result()
+
+    assert error is None and png_color(png) == (32, 32, 32)
+    assert capture.settle["settled"] and capture.settle["frames"] >= 2
+    assert not capture.running
+
+
+def test_waits_until_the_animation_stops(make_adb, small_device):
+    frames = iter([(0, 0, 0), (80, 80, 80), (160, 160, 160)])
+    width, height = small_device.screen_size
+
+    def animated():
+        color = next(frames, (240, 240, 240))
+        return (bytes(color) + b"\xff") * (width * height)
+
+    small_device.raw_pixels = animated
+
+    png, error = SpeculativeCapture(make_adb(), "small").start().result()
+
+    assert error is None and png_color(png) == (240, 240, 240)
+
+
+def test_change_after_settling_replaces_the_screenshot(make_adb, small_device):
+    paint(small_device, (10, 10, 10))
+    capture = SpeculativeCapture(make_adb(), "small").start()
+    deadline = time.monotonic() + 3
+    while capture.settle is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    paint(small_device, (200, 200, 200))
+    while capture.refreshes == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    png, error = capture.result()
+
+    assert capture.refreshes >= 1
+    assert error is None and png_color(png) == (200, 200, 200)
+
+
+def test_capture_error_is_reported(make_adb, small_device):
+    capture = SpeculativeCapture(make_adb(), "missing").start()
+
+    png, error = capture.result(timeout=2)
+
+    assert png is None and error
@@ -0,0 +1,76 @@
+import json
+import threading
+import time
+
+import pytest
+
+from task_runner import DeviceScheduler, Task, load_tasks
+
+
+@pytest.fixture
+def devices(server):
+    return [server.add_device(serial) for serial in ("d0", "d1")]
+
+
+def test_load_tasks_reads_prompts_and_request_files(tmp_path):
+    path = tmp_path / "tasks.jsonl"
+    path.write_text("\n".join([json.dumps({"id": "a", "prompt": "open chrome"}),
+                               "",
+                               json.dumps({"request_id": "b", "title": "Open mail", "body": "Read it"}),
+                               json.dumps("plain prompt")]))
+
+    tasks = load_tasks(str(path))
+
+    assert [(task.id, task.prompt) for task in tasks] == [("a", "open chrome"), ("b", "Open mail. Read it"),
+                                                           ("4", "plain prompt")]
+
+
+def test_tasks_are_spread_over_ready_devices(make_adb, devices):
+    adb = make_adb()
+    running = set()
+    overlap = []
+    lock = threading.Lock()
+
+    def run_task(device_id, task, stop_event):
+        with lock:
+            assert device_id not in running
+            running.add(device_id)
+            overlap.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.discard(device_id)
+        return f"done {task.id}"
+
+    results = DeviceScheduler(adb, run_task, poll_interval=0.05).run([Task(str(i), "p") for i in range(6)])
+
+    assert sorted(result["id"] for result in results) == [str(i) for i in range(6)]
+    assert all(result["status"] == "completed" for result in results)
+    assert {result["device_id"] for result in results} == {"d0", "d1"}
+    assert max(overlap) == 2
+
+
+def test_task_of_a_device_that_goes_offline_is_requeued(make_adb, server, devices):
+    adb = make_adb()
+
+    def run_task(device_id, task, stop_event):
+        if device_id == "d0":
+            server.remove_device("d0")
+            assert stop_event.wait(5)
+            return None
+        return "ok"
+
+    results = DeviceScheduler(adb, run_task, poll_interval=0.05).run([Task("only", "p")])
+
+    (result,) = results
+    assert (result["status"], result["devices"], result["attempts"]) == ("completed", ["d0", "d1"], 2)
+
+
+def test_failed_task_is_not_retried_on_a_healthy_device(make_adb, devices):
+    adb = make_adb()
+
+    def run_task(device_id, task, stop_event):
+        raise RuntimeError("model error")
+
+    (result,) = DeviceScheduler(adb, run_task, poll_interval=0.05).run([Task("t", "p")])
+
+    assert (result["status"], result["attempts"], result["error"]) == ("failed", 1, "RuntimeError: model error")
@@ -0,0 +1,58 @@
+import shlex
+
+import pytest
+
+from text_entry import ADB_KEYBOARD_PACKAGE, input_commands
+
+TRICKY_TEXTS = ["it's me", 'say "hi"', "a;b 'c'", "x && y || z", "a|b > c", "100%s off", "tab\there\nnext line",
+                "  spaced  ", "back\\slash"]
+
+
+@pytest.mark.parametrize("text", TRICKY_TEXTS + ["$HOME `id` $(id)"])
+def test_input_commands_pass_the_text_as_one_argument(text):
+    typed = ""
+    for command in input_commands(text):
+        args = shlex.split(command)
+        if args[:2] == ["input", "text"]:
+            assert len(args) == 3
+            typed += args[2].replace("%s", " ")
+        else:
+            typed += {"KEYCODE_ENTER": "\n", "KEYCODE_TAB": "\t"}[args[2]]
+
+    assert typed == text
+
+
+def test_input_commands_split_long_text():
+    commands = input_commands("a" * 600, chunk_size=256)
+
+    assert [len(shlex.split(command)[2]) for command in commands] == [256, 256, 88]
+
+
+def test_input_commands_reject_non_ascii():
+    with pytest.raises(ValueError):
+        input_commands("héllo")
+
+
+@pytest.mark.parametrize("persistent_shell", [True, False])
+@pytest.mark.parametrize("text", TRICKY_TEXTS)
+def test_input_text_types_the_text_verbatim(make_adb, device, persistent_shell, text):
+    adb = make_adb(persistent_shell=persistent_shell)
+
+    result = adb.input_text(text, "emulator-5554", method="input")
+
+    assert result["success"], result
+    assert device.typed == text
+
+
+@pytest.mark.parametrize("current_ime", ["com.android.adbkeyboard/.AdbIME", "com.android.inputmethod.latin/.LatinIME"])
+def test_ime_types_unicode_and_restores_the_keyboard(make_adb, device, current_ime):
+    device.packages[ADB_KEYBOARD_PACKAGE] = 1
+    device.ime = current_ime
+    adb = make_adb()
+    text = "héllo wörld 'quoted'; ✓ " * 3
+
+    result = adb.input_text(text, "emulator-5554")
+
+    assert (result["success"], result["method"]) == (True, "ime")
+    assert device.typed == text
+    assert device.ime == current_ime
@@ -0,0 +1,45 @@
+import json
+import threading
+
+from element_memo import ElementMemo
+from trace_cache import TraceCache
+
+
+def hammer(write, threads=8, rounds=50):
+    errors = []
+
+    def worker(index):
+        try:
+            for round_ in range(rounds):
+                write(index, round_)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return errors
+
+
+def test_instances_sharing_a_directory_do_not_clobber_each_other(tmp_path):
+    caches = [TraceCache(str(tmp_path)), TraceCache(str(tmp_path))]
+    trace = {"task": "t", "steps": [{"hash": "0", "calls": [{"name": "tap", "args": {"x": 1}}] * 50}]}
+
+    errors = hammer(lambda index, round_: caches[index % 2].put("key", dict(trace, writer=index)))
+
+    assert errors == []
+    assert caches[0].get("key")["task"] == "t"
+    assert [path.name for path in tmp_path.iterdir()] == ["key.json"]
+
+
+def test_element_memo_saves_from_many_threads(tmp_path):
+    path = tmp_path / "memo.json"
+    memo = ElementMemo(str(path))
+    fingerprint = {"hash": "0", "size": [1080, 2400], "window": "w"}
+
+    errors = hammer(lambda index, round_: memo.remember(fingerprint, f"button {index}", index, round_))
+
+    assert errors == []
+    assert len(json.loads(path.read_text())) == 8
@@ -0,0 +1,113 @@
+"""
+Shell scripts that type text on a device, through `input text` or through the
+ADBKeyBoard IME (https://github.com/senzhk/ADBKeyBoard), and the choice between them.
+
+`input text` starts a process per call and injects one key event per character,
+so it suits short ASCII text. The IME commits a whole base64-encoded broadcast
+at once and can type any Unicode text, but has to be installed on the device.
+"""
+import base64
+import shlex
+from typing import List
+
+ADB_KEYBOARD_PACKAGE = "com.android.adbkeyboard"
+ADB_KEYBOARD_IME = "com.android.adbkeyboard/.AdbIME"
+CURRENT_IME_COMMAND = "settings get secure default_input_method"
+IME_STATUS_MARKER = "__IME_STATUS:"
+
+# Characters per `input text` call; long arguments make some devices drop characters
+INPUT_CHUNK_SIZE = 256
+# Characters per IME broadcast, well under the binder transaction limit
+IME_CHUNK_SIZE = 4096
+# Texts at least this long go through the IME when it is installed
+IME_MIN_LENGTH = 32
+
+_KEYS = {"\n": "KEYCODE_ENTER", "\t": "KEYCODE_TAB"}
+
+
+def is_input_typeable(text: str) -> bool:
+    """Whether `input text` can type text: printable ASCII, newlines and tabs."""
+    return all(" " <= char <= "~" or char in _KEYS for char in text)
+
+
+def choose_method(text: str, ime_available: bool) -> str:
+    """
+    Picks 'input' or 'ime' by length and charset.
+
+    Raises:
+        ValueError: If the text needs the IME and it is not available
+    """
+    if not is_input_typeable(text):
+        if not ime_available:
+            raise ValueError(f"typing non-ASCII text needs the ADBKeyBoard IME ({ADB_KEYBOARD_PACKAGE}) on the device")
+        return "ime"
+    return "ime" if ime_available and len(text) >= IME_MIN_LENGTH else "input"
+
+
+def _input_pieces(segment: str) -> List[str]:
+    # `input text` reads %s as a space, so a literal '%s' is typed as '%' and 's' in separate calls
+    parts = segment.split("%s")
+    return [("s" if index else "") + part + ("%" if index < len(parts) - 1 else "")
+            for index, part in enumerate(parts)]
+
+
+def input_commands(text: str, chunk_size: int = INPUT_CHUNK_SIZE) -> List[str]:
+    """
+    Builds the `input text` / `input keyevent` commands that type text.
+
+    Raises:
+        ValueError: If the text has characters `input text` cannot type
+    """
+    if not is_input_typeable(text):
+        raise ValueError("`input text` can only type printable ASCII, newlines and tabs")
+    commands = []
+    segment = ""
+    for char in text + "\0":
+        if char not in _KEYS and char != "\0":
+            segment += char
+            continue
+        for piece in _input_pieces(segment) if segment else []:
+            for start in range(0, len(piece), chunk_size):
+                chunk = piece[start:start + chunk_size].replace(" ", "%s")
+                commands.append(f"input text {shlex.quote(chunk)}")
+        segment = ""
+        if char in _KEYS:
+            commands.append(f"input keyevent {_KEYS[char]}")
+    return commands
+
+
+def input_script(text: str, chunk_size: int = INPUT_CHUNK_SIZE) -> str:
+    """The commands of input_commands in one script that stops at the first failure."""
+    return " && ".join(input_commands(text, chunk_size))
+
+
+def ime_script(text: str, current_ime: str = ADB_KEYBOARD_IME, chunk_size: int = IME_CHUNK_SIZE) -> str:
+    """
+    Builds a script that types text with ADBKeyBoard broadcasts.
+
+    Args:
+        current_ime (str): The device's input method. If it is not ADBKeyBoard, the
+            script switches to it for the broadcasts and back afterwards.
+    """
+    broadcasts = []
+    for start in range(0, len(text), chunk_size):
+        payload = base64.b64encode(text[start:start + chunk_size].encode("utf-8")).decode("ascii")
+        broadcasts.append(f"am broadcast -a ADB_INPUT_B64 --es msg {payload}")
+    script = " && ".join(broadcasts)
+    if current_ime == ADB_KEYBOARD_IME:
+        return script
+    # The editor binds to the new IME asynchronously. The restore runs either way,
+    # so the broadcasts' exit status is echoed before it.
+    return (f"ime enable {ADB_KEYBOARD_IME} >/dev/null && ime set {ADB_KEYBOARD_IME} >/dev/null && sleep 0.2 && "
+            f"{script}; echo {IME_STATUS_MARKER}$?; ime set {shlex.quote(current_ime)} >/dev/null")
+
+
+def ime_status(stdout: str, returncode: int) -> int:
+    """The exit status of an ime_script's broadcasts, from its output and exit code."""
+    for line in stdout.splitlines():
+        if line.startswith(IME_STATUS_MARKER):
+            try:
+                return int(line[len(IME_STATUS_MARKER):])
+            except ValueError:
+                break
+    return returncode
@@ -0,0 +1,229 @@
+"""
+Gestures as `sendevent` sequences written straight to the touchscreen's input
+device node, skipping the JVM that every `input` command starts.
+
+The touchscreen is found with `getevent -p`: the first device reporting
+ABS_MT_POSITION_X/Y. Screen pixels are mapped to its ABS ranges, and gestures use
+the multi-touch type B protocol (slots and tracking ids).
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# One round-trip: the input devices with their axes, and the display size
+PROBE_COMMAND = "getevent -p; wm size"
+
+EV_SYN, EV_KEY, EV_ABS = 0, 1, 3
+SYN_REPORT = 0
+BTN_TOUCH = 0x14a
+ABS_MT_SLOT = 0x2f
+ABS_MT_TOUCH_MAJOR = 0x30
+ABS_MT_POSITION_X = 0x35
+ABS_MT_POSITION_Y = 0x36
+ABS_MT_TRACKING_ID = 0x39
+ABS_MT_PRESSURE = 0x3a
+
+# Milliseconds between the move reports of a swipe, about one per frame
+MOVE_INTERVAL_MS = 16
+
+_DEVICE = re.compile(r"^add device \d+: (\S+)")
+_NAME = re.compile(r'^\s*name:\s*"(.*)"')
+_ABS_AXIS = re.compile(r"([0-9a-f]{4})\s*:\s*value -?\d+, min (-?\d+), max (-?\d+)")
+_SIZE = re.compile(r"(Physical|Override) size: (\d+)x(\d+)")
+
+
+@dataclass
+class TouchScreen:
+    """A multi-touch input device and how screen pixels map onto it."""
+    path: str
+    name: str
+    axes: Dict[int, Tuple[int, int]]
+    has_btn_touch: bool
+    display_size: Tuple[int, int]
+
+    def to_abs(self, x: float, y: float) -> Tuple[int, int]:
+        """Maps a point in display pixels to the device's ABS_MT_POSITION ranges."""
+        (x_min, x_max), (y_min, y_max) = self.axes[ABS_MT_POSITION_X], self.axes[ABS_MT_POSITION_Y]
+        width, height = self.display_size
+        abs_x = x_min + round(min(max(x, 0), width - 1) * (x_max - x_min) / max(width - 1, 1))
+        abs_y = y_min + round(min(max(y, 0), height - 1) * (y_max - y_min) / max(height - 1, 1))
+        return abs_x, abs_y
+
+    @property
+    def slots(self) -> int:
+        return self.axes[ABS_MT_SLOT][1] + 1 if ABS_MT_SLOT in self.axes else 1
+
+
+def parse_touchscreen(output: str) -> Optional[TouchScreen]:
+    """
+    Finds the touchscreen in the output of PROBE_COMMAND.
+
+    Returns:
+        TouchScreen or None: None if no device reports multi-touch positions or the
+            display size is missing
+    """
+    devices = []
+    current = None
+    section = None
+    for line in output.splitlines():
+        match = _DEVICE.match(line)
+        if match:
+            current = {"path": match.group(1), "name": "", "axes": {}, "keys": set()}
+            devices.append(current)
+            section = None
+            continue
+        if current is None:
+            continue
+        match = _NAME.match(line)
+        if match:
+            current["name"] = match.group(1)
+            continue
+        stripped = line.strip()
+        if stripped.startswith("KEY (0001):"):
+            section, stripped = "key", stripped[len("KEY (0001):"):]
+        elif stripped.startswith("ABS (0003):"):
+            section, stripped = "abs", stripped[len("ABS (0003):"):]
+        elif re.match(r"^[A-Z]+\s+\([0-9a-f]{4}\):", stripped) or stripped.endswith(":"):
+            section = None
+        if section == "key":
+            current["keys"].update(int(code, 16) for code in re.findall(r"\b[0-9a-f]{4}\b", stripped))
+        elif section == "abs":
+            for code, minimum, maximum in _ABS_AXIS.findall(stripped):
+                current["axes"][int(code, 16)] = (int(minimum), int(maximum))
+
+    sizes = {kind: (int(width), int(height)) for kind, width, height in _SIZE.findall(output)}
+    display_size = sizes.get("Override") or sizes.get("Physical")
+    if display_size is None:
+        return None
+    for device in devices:
+        if ABS_MT_POSITION_X in device["axes"] and ABS_MT_POSITION_Y in device["axes"]:
+            return TouchScreen(device["path"], device["name"], device["axes"], BTN_TOUCH in device["keys"],
+                               display_size)
+    return None
+
+
+class GestureWriter:
+    """
+    Builds the shell script of one gesture as `sendevent` lines.
+
+    Args:
+        screen (TouchScreen): The device node and axes to write to
+        tracking_id (int): First tracking id to use; each finger takes the next one
+    """
+
+    def __init__(self, screen: TouchScreen, tracking_id: int = 1):
+        self.screen = screen
+        self.tracking_id = tracking_id
+        self.commands: List[str] = []
+        self._slot = None
+
+    def _event(self, kind: int, code: int, value: int):
+        self.commands.append(f"sendevent {self.screen.path} {kind} {code} {value}")
+
+    def _select(self, slot: int):
+        if self.screen.slots > 1 and slot != self._slot:
+            self._event(EV_ABS, ABS_MT_SLOT, slot)
+            self._slot = slot
+
+    def down(self, slot: int, x: float, y: float):
+        axes = self.screen.axes
+        self._select(slot)
+        self._event(EV_ABS, ABS_MT_TRACKING_ID, self.tracking_id + slot)
+        abs_x, abs_y = self.screen.to_abs(x, y)
+        self._event(EV_ABS, ABS_MT_POSITION_X, abs_x)
+        self._event(EV_ABS, ABS_MT_POSITION_Y, abs_y)
+        # Some drivers ignore contacts without pressure or size
+        if ABS_MT_PRESSURE in axes:
+            self._event(EV_ABS, ABS_MT_PRESSURE, max(1, axes[ABS_MT_PRESSURE][1] // 2))
+        if ABS_MT_TOUCH_MAJOR in axes:
+            self._event(EV_ABS, ABS_MT_TOUCH_MAJOR, max(1, min(5, axes[ABS_MT_TOUCH_MAJOR][1])))
+
+    def move(self, slot: int, x: float, y: float):
+        self._select(slot)
+        abs_x, abs_y = self.screen.to_abs(x, y)
+        self._event(EV_ABS, ABS_MT_POSITION_X, abs_x)
+        self._event(EV_ABS, ABS_MT_POSITION_Y, abs_y)
+
+    def up(self, slot: int):
+        self._select(slot)
+        self._event(EV_ABS, ABS_MT_TRACKING_ID, -1)
+
+    def touch(self, pressed: bool):
+        if self.screen.has_btn_touch:
+            self._event(EV_KEY, BTN_TOUCH, 1 if pressed else 0)
+
+    def sync(self):
+        self._event(EV_SYN, SYN_REPORT, 0)
+
+    def sleep(self, milliseconds: float):
+        if milliseconds > 0:
+            self.commands.append(f"sleep {milliseconds / 1000:g}")
+
+    def script(self) -> str:
+        # ';' so the lift-off is still written if a move fails
+        return "; ".join(self.commands)
+
+
+def _steps(duration_ms: int) -> int:
+    return max(1, min(60, int(duration_ms) // MOVE_INTERVAL_MS))
+
+
+def tap_script(screen: TouchScreen, x: float, y: float, tracking_id: int = 1, hold_ms: int = 0) -> str:
+    """A tap, or a long press when hold_ms is long enough."""
+    writer = GestureWriter(screen, tracking_id)
+    writer.down(0, x, y)
+    writer.touch(True)
+    writer.sync()
+    writer.sleep(hold_ms)
+    writer.up(0)
+    writer.touch(False)
+    writer.sync()
+    return writer.script()
+
+
+def swipe_script(screen: TouchScreen, x1: float, y1: float, x2: float, y2: float, duration_ms: int = 300,
+                 tracking_id: int = 1) -> str:
+    """A straight swipe reported about every MOVE_INTERVAL_MS over duration_ms."""
+    writer = GestureWriter(screen, tracking_id)
+    steps = _steps(duration_ms)
+    writer.down(0, x1, y1)
+    writer.touch(True)
+    writer.sync()
+    for step in range(1, steps + 1):
+        writer.sleep(duration_ms / steps)
+        writer.move(0, x1 + (x2 - x1) * step / steps, y1 + (y2 - y1) * step / steps)
+        writer.sync()
+    writer.up(0)
+    writer.touch(False)
+    writer.sync()
+    return writer.script()
+
+
+def pinch_script(screen: TouchScreen, x: float, y: float, start_span: float, end_span: float,
+                 duration_ms: int = 400, tracking_id: int = 1) -> str:
+    """
+    Two fingers moving apart (end_span > start_span, zoom in) or together around
+    (x, y) on a horizontal line.
+
+    Raises:
+        ValueError: If the touchscreen tracks only one contact
+    """
+    if screen.slots < 2:
+        raise ValueError(f"{screen.name} tracks a single contact")
+    writer = GestureWriter(screen, tracking_id)
+    steps = _steps(duration_ms)
+    writer.down(0, x - start_span / 2, y)
+    writer.down(1, x + start_span / 2, y)
+    writer.touch(True)
+    writer.sync()
+    for step in range(1, steps + 1):
+        writer.sleep(duration_ms / steps)
+        span = start_span + (end_span - start_span) * step / steps
+        writer.move(0, x - span / 2, y)
+        writer.move(1, x + span / 2, y)
+        writer.sync()
+    writer.up(0)
+    writer.up(1)
+    writer.touch(False)
+    writer.sync()
+    return writer.script()
@@ -0,0 +1,161 @@
+"""
+Recorded tool-call traces of completed tasks, replayed without the model while
+the screen still looks the way it did when the trace was recorded.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from frames import hamming_distance
+
+# Bits of frames.difference_hash(frame, HASH_SIZE)
+HASH_SIZE = 16
+
+
+def task_key(task: str, screen_size: Tuple[int, int]) -> str:
+    """
+    Cache key of a task on a screen size. Recorded coordinates are device pixels,
+    so a trace is only reused on a screen of the same size.
+    """
+    normalized = " ".join(task.lower().split())
+    return hashlib.sha256(f"{normalized}|{screen_size[0]}x{screen_size[1]}".encode("utf-8")).hexdigest()
+
+
+class TraceCache:
+    """
+    Traces stored as one JSON file per task under `directory`, evicted least
+    recently used first once they take more than `max_bytes` or number more than
+    `max_entries`. A file's modification time records its last use.
+
+    Args:
+        directory (str): Where traces are stored
+        max_bytes (int): Total size budget of the stored traces
+        max_entries (int, optional): Maximum number of stored traces
+        hash_threshold (int): Maximum differing hash bits for a screen to match a recorded one
+    """
+
+    def __init__(self, directory: str = ".trace_cache", max_bytes: int = 5_000_000,
+                 max_entries: Optional[int] = 1000, hash_threshold: int = 10):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hash_threshold = hash_threshold
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns the trace stored under key and marks it as recently used, or None."""
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    trace = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError):
+                return None
+        return trace
+
+    def put(self, key: str, trace: dict):
+        """Stores a trace, replacing any previous one, then evicts down to the budget."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # Unique per writer, so instances sharing the directory cannot clobber each other's file
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(trace, f)
+            os.replace(temporary, path)
+            self._evict()
+
+    def invalidate(self, key: str):
+        with self._lock:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or (self.max_entries is not None and len(entries) > self.max_entries)):
+            _, size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def matches(self, recorded_hash: str, current_hash: int) -> bool:
+        return hamming_distance(int(recorded_hash, 16), current_hash) <= self.hash_threshold
+
+
+class TraceRecorder:
+    """
+    Collects the steps of one run: the screen hash before each model turn and the
+    successful calls of that turn, with arguments already in device pixels.
+    """
+
+    def __init__(self, task: str, steps: Optional[List[dict]] = None):
+        self.task = task
+        self.steps = list(steps or [])
+
+    def add_step(self, screen_hash: int, calls: List[dict]):
+        """
+        Args:
+            screen_hash (int): difference_hash of the screen before the calls
+            calls (list): {'name': tool name, 'args': device-space arguments} per successful call
+        """
+        if calls:
+            self.steps.append({"screen_hash": f"{screen_hash:x}", "calls": calls})
+
+    def trace(self, final_hash: int) -> dict:
+        return {
+            "task": self.task,
+            "steps": self.steps,
+            "final_hash": f"{final_hash:x}",
+            "recorded_at": time.time(),
+        }
+
+
+def replay_trace(cache: TraceCache, trace: dict, screen_hash: Callable[[], Optional[int]],
+                 execute: Callable[[str, dict], object]):
+    """
+    Replays a trace step by step while the screen matches the recorded one.
+
+    Args:
+        cache (TraceCache): Supplies the match threshold
+        trace (dict): A trace from TraceCache.get
+        screen_hash (callable): Returns the current screen's hash, or None if it cannot be captured
+        execute (callable): Runs one call given its tool name and arguments and returns
+            whether it succeeded; the screen should be settled when it returns
+
+    Returns:
+        tuple: (replayed_steps, completed) where completed is True if every step was
+            replayed and the screen matches the recorded final screen
+    """
+    replayed = []
+    for step in trace.get("steps", []):
+        current = screen_hash()
+        if current is None or not cache.matches(step["screen_hash"], current):
+            return replayed, False
+        for call in step["calls"]:
+            if not execute(call["name"], call["args"]):
+                return replayed, False
+        replayed.append(step)
+    current = screen_hash()
+    completed = current is not None and "final_hash" in trace and cache.matches(trace["final_hash"], current)
+    return replayed, completed
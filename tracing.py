@@ -0,0 +1,247 @@
+"""
+Timed spans around the phases of the agent loop, written as JSONL and
+aggregated into Prometheus-text counters and histograms.
+
+Example:
+    tracer = Tracer("agent-trace.jsonl")
+    with tracer.span("adb.shell", device_id="emulator-5554") as span:
+        result = run()
+        span.set(return_code=result.returncode, bytes=len(result.stdout))
+    print(tracer.metrics.render())
+"""
+import http.server
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Seconds; covers shell round-trips (ms) up to model calls (tens of seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Span attributes that become metric labels; everything else only goes to the trace file
+LABEL_ATTRIBUTES = ("tool",)
+
+
+class Metrics:
+    """Counters and histograms keyed by metric name and label set, rendered in Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], list] = {}
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1.0):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                # Per-bucket counts, then sum and count
+                histogram = self._histograms[(name, labels)] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = []
+        for key, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {values[-1]}")
+                lines.append(f"{name}_sum{self._labels(labels)} {values[-2]:g}")
+                lines.append(f"{name}_count{self._labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """One timed phase. Use as a context manager; add attributes with set()."""
+
+    __slots__ = ("tracer", "name", "attributes", "id", "parent", "start", "_start_perf")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.id = None
+        self.parent = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self):
+        self.id = next(self.tracer._ids)
+        stack = self.tracer._stack()
+        self.parent = stack[-1] if stack else None
+        stack.append(self.id)
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self._start_perf
+        stack = self.tracer._stack()
+        # Coroutines sharing a thread can finish their spans out of order
+        if stack and stack[-1] == self.id:
+            stack.pop()
+        elif self.id in stack:
+            stack.remove(self.id)
+        if exc_type is not None:
+            self.attributes.setdefault("error", f"{exc_type.__name__}: {exc}")
+        self.tracer._finish(self, duration)
+        return False
+
+
+class _NullSpan:
+    def set(self, **attributes):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Records spans to a JSONL file (if `path` is given) and to `metrics`:
+    - android_agent_span_duration_seconds: histogram per span name (and tool)
+    - android_agent_spans_total: counter per span name (and tool) and status
+    - android_agent_payload_bytes_total: counter of the spans' `bytes` attribute
+
+    Lines are buffered and flushed at most every `flush_interval` seconds and on
+    close(), so a span costs a dict, a json.dumps and a few counter updates.
+
+    Args:
+        path (str, optional): JSONL trace file, appended to
+        enabled (bool): When False, span() returns a no-op span
+        flush_interval (float): Seconds between flushes of the trace file
+    """
+
+    def __init__(self, path: Optional[str] = None, enabled: bool = True, flush_interval: float = 1.0,
+                 buckets=DEFAULT_BUCKETS):
+        self.path = path
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.metrics = Metrics(buckets)
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1 << 16) if path and enabled else None
+        self._last_flush = time.monotonic()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name: str, **attributes):
+        """
+        Args:
+            name (str): Phase name, e.g. 'model.generate_content', 'adb.shell', 'screenshot.write'
+            **attributes: Span attributes, e.g. device_id, tool, bytes, return_code
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, attributes)
+
+    def _finish(self, span: Span, duration: float):
+        attributes = span.attributes
+        labels = (("span", span.name),) + tuple((key, attributes[key]) for key in LABEL_ATTRIBUTES
+                                                if attributes.get(key) is not None)
+        status = "error" if "error" in attributes or attributes.get("success") is False else "ok"
+        self.metrics.observe("android_agent_span_duration_seconds", labels, duration)
+        self.metrics.inc("android_agent_spans_total", labels + (("status", status),))
+        if isinstance(attributes.get("bytes"), int):
+            self.metrics.inc("android_agent_payload_bytes_total", (("span", span.name),), attributes["bytes"])
+
+        if self._file is None:
+            return
+        record = {"name": span.name, "id": span.id, "parent": span.parent, "start": span.start,
+                  "duration_ms": round(duration * 1000, 3), "thread": threading.current_thread().name}
+        record.update(attributes)
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def write_metrics(self, path: str):
+        """Writes the current metrics in Prometheus text format, e.g. for node_exporter's textfile collector."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.metrics.render())
+        os.replace(temporary, path)
+
+    def serve_metrics(self, port: int = 9464, host: str = "127.0.0.1") -> http.server.HTTPServer:
+        """Serves the metrics at http://host:port/metrics from a background thread."""
+        metrics = self.metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# Metrics-only tracer used when none is passed in
+default_tracer = Tracer()
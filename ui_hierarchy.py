@@ -0,0 +1,188 @@
+"""Parsing, indexing and caching of `uiautomator dump` view hierarchies."""
+import re
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+# Dumps to stdout; the trailing status line is stripped by parse_hierarchy
+DUMP_COMMAND = "uiautomator dump /dev/tty"
+# For builds that refuse /dev/tty
+DUMP_FILE = "/sdcard/window_dump.xml"
+DUMP_FILE_COMMAND = f"uiautomator dump {DUMP_FILE} >/dev/null && cat {DUMP_FILE}"
+
+_BOUNDS = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+@dataclass
+class UiElement:
+    """One node of the view hierarchy. Bounds are device pixels (left, top, right, bottom)."""
+    index: int
+    text: str
+    resource_id: str
+    content_desc: str
+    class_name: str
+    package: str
+    bounds: Tuple[int, int, int, int]
+    clickable: bool = False
+    enabled: bool = True
+    focused: bool = False
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        left, top, right, bottom = self.bounds
+        return (left + right) // 2, (top + bottom) // 2
+
+    def to_dict(self) -> dict:
+        """A compact description for the model; empty fields are left out."""
+        entry = {"index": self.index, "class": self.class_name.rsplit(".", 1)[-1],
+                 "bounds": list(self.bounds), "center": list(self.center)}
+        if self.text:
+            entry["text"] = self.text
+        if self.resource_id:
+            entry["resource_id"] = self.resource_id
+        if self.content_desc:
+            entry["content_desc"] = self.content_desc
+        if self.clickable:
+            entry["clickable"] = True
+        if not self.enabled:
+            entry["enabled"] = False
+        return entry
+
+
+class UiHierarchy:
+    """
+    The elements of one dump, indexed by lowercased text, resource-id (full and
+    the part after ':id/'), content-desc and class name (full and simple).
+    """
+
+    def __init__(self, elements: List[UiElement]):
+        self.elements = elements
+        self.by_text: Dict[str, List[UiElement]] = {}
+        self.by_resource_id: Dict[str, List[UiElement]] = {}
+        self.by_content_desc: Dict[str, List[UiElement]] = {}
+        self.by_class: Dict[str, List[UiElement]] = {}
+        for element in elements:
+            if element.text:
+                self.by_text.setdefault(element.text.strip().lower(), []).append(element)
+            if element.content_desc:
+                self.by_content_desc.setdefault(element.content_desc.strip().lower(), []).append(element)
+            if element.resource_id:
+                self.by_resource_id.setdefault(element.resource_id, []).append(element)
+                if ":id/" in element.resource_id:
+                    short = element.resource_id.split(":id/", 1)[1]
+                    self.by_resource_id.setdefault(short, []).append(element)
+            if element.class_name:
+                self.by_class.setdefault(element.class_name, []).append(element)
+                self.by_class.setdefault(element.class_name.rsplit(".", 1)[-1], []).append(element)
+
+    def find(self, text: Optional[str] = None, resource_id: Optional[str] = None,
+             content_desc: Optional[str] = None, class_name: Optional[str] = None,
+             exact: bool = False) -> List[UiElement]:
+        """
+        Finds elements matching every given criterion. Text and content-desc match
+        case-insensitively, exactly first and then as substrings unless exact is set.
+
+        Returns:
+            list: Matching elements in document order, clickable ones first
+        """
+        candidates = None
+        for value, index, fuzzy in ((text, self.by_text, True), (content_desc, self.by_content_desc, True),
+                                    (resource_id, self.by_resource_id, False), (class_name, self.by_class, False)):
+            if not value:
+                continue
+            key = value.strip().lower() if fuzzy else value
+            matches = index.get(key, [])
+            if not matches and fuzzy and not exact:
+                matches = [element for indexed, elements in index.items() if key in indexed for element in elements]
+            found = {element.index for element in matches}
+            candidates = found if candidates is None else candidates & found
+        if candidates is None:
+            return []
+        elements = sorted((self.elements[index] for index in candidates), key=lambda element: element.index)
+        return sorted(elements, key=lambda element: not element.clickable)
+
+
+def parse_hierarchy(xml: str) -> UiHierarchy:
+    """
+    Parses `uiautomator dump` output.
+
+    Raises:
+        ValueError: If the output does not contain a hierarchy
+    """
+    start, end = xml.find("<hierarchy"), xml.rfind("</hierarchy>")
+    if start < 0 or end < 0:
+        raise ValueError("no view hierarchy in uiautomator output")
+    try:
+        root = ElementTree.fromstring(xml[start:end + len("</hierarchy>")])
+    except ElementTree.ParseError as e:
+        raise ValueError(f"malformed view hierarchy: {e}")
+
+    elements = []
+    for node in root.iter("node"):
+        match = _BOUNDS.match(node.get("bounds", ""))
+        bounds = tuple(int(value) for value in match.groups()) if match else (0, 0, 0, 0)
+        elements.append(UiElement(
+            index=len(elements),
+            text=node.get("text", ""),
+            resource_id=node.get("resource-id", ""),
+            content_desc=node.get("content-desc", ""),
+            class_name=node.get("class", ""),
+            package=node.get("package", ""),
+            bounds=bounds,
+            clickable=node.get("clickable") == "true",
+            enabled=node.get("enabled", "true") == "true",
+            focused=node.get("focused") == "true",
+        ))
+    return UiHierarchy(elements)
+
+
+class HierarchyCache:
+    """
+    The last hierarchy per device, with a signature of the screen it was dumped
+    from (PyAdb uses the foreground state's screen fields). An entry is reused
+    while the signature is unchanged and it is at most `max_age` seconds old, and
+    dropped when an action is sent to the device.
+
+    Computing a signature costs a device round-trip, so an entry may be stored
+    without one; it takes the signature of its first lookup. Callers should only
+    compute a signature when `has` reports an entry to check it against.
+    """
+
+    def __init__(self, max_age: Optional[float] = 10.0):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries: Dict[Optional[str], tuple] = {}
+
+    def has(self, device_id: Optional[str]) -> bool:
+        with self._lock:
+            return device_id in self._entries
+
+    def get(self, device_id: Optional[str], signature: Optional[Hashable]) -> Optional[UiHierarchy]:
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None or signature is None:
+                return None
+            cached_signature, dumped_at, hierarchy = entry
+            if (cached_signature is not None and cached_signature != signature) or (
+                    self.max_age is not None and time.monotonic() - dumped_at > self.max_age):
+                del self._entries[device_id]
+                return None
+            if cached_signature is None:
+                self._entries[device_id] = (signature, dumped_at, hierarchy)
+            return hierarchy
+
+    def put(self, device_id: Optional[str], signature: Optional[Hashable], hierarchy: UiHierarchy):
+        """Stores a freshly dumped hierarchy; signature may be None if it was not computed."""
+        with self._lock:
+            self._entries[device_id] = (signature, time.monotonic(), hierarchy)
+
+    def invalidate(self, device_id: Optional[str] = None):
+        """Drops one device's hierarchy, or every hierarchy if device_id is None."""
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)